@@ -14,6 +14,9 @@ import { WeatherAdapterService } from './pipeline/weather-adapter.service';
 import { OutfitCacheService } from './services/outfit-cache.service';
 import { OutfitResult, PipelineContext } from './types/outfit.types';
 
+// Called as each pipeline stage finishes (streamed to WebSocket clients as `pipeline` events).
+export type PipelineStepCallback = (step: string) => void;
+
 @Injectable()
 export class AiService {
   constructor(
@@ -38,10 +41,13 @@ export class AiService {
       personalization?: PipelineContext['personalization'];
       monetization?: PipelineContext['monetization'];
     },
+    onStep: PipelineStepCallback = () => undefined,
   ) {
     const input = this.inputAnalyzer.analyze(inputDto);
+    onStep('input-analyzer');
     const style = this.styleClassifier.classify(input.styleInput);
     input.style = style.style;
+    onStep('style-classifier');
 
     const useCache = process.env.AI_CACHE_ENABLED === 'true';
     const cacheKey = this.getCacheKey(inputDto);
@@ -53,7 +59,9 @@ export class AiService {
     }
 
     const weather = await this.contextBuilder.build(input);
+    onStep('context-builder');
     const budget = this.budgetEngine.decide(input, style.preferredTiers);
+    onStep('budget-engine');
     const trend = await this.trendIntelligence.getSnapshot(input.style);
     const prompt = this.promptBuilder.build({
       style: input.style,
@@ -82,15 +90,15 @@ export class AiService {
       prompt,
     };
 
-    const result = await this.runPipeline(context);
+    const result = await this.runPipeline(context, onStep);
     if (useCache) {
       await this.outfitCache.set(cacheKey, result);
     }
     return result;
   }
 
-  private async runPipeline(context: PipelineContext) {
-    const firstAttempt = await this.tryComposeValidOutfit(context);
+  private async runPipeline(context: PipelineContext, onStep: PipelineStepCallback) {
+    const firstAttempt = await this.tryComposeValidOutfit(context, onStep);
     if (firstAttempt.outfit) {
       return firstAttempt.outfit;
     }
@@ -103,7 +111,7 @@ export class AiService {
         preference: 'cheaper',
       },
     };
-    const fallbackAttempt = await this.tryComposeValidOutfit(fallbackContext);
+    const fallbackAttempt = await this.tryComposeValidOutfit(fallbackContext, onStep);
     if (fallbackAttempt.outfit) {
       return fallbackAttempt.outfit;
     }
@@ -115,20 +123,28 @@ export class AiService {
     });
   }
 
-  private async tryComposeValidOutfit(context: PipelineContext): Promise<{
+  private async tryComposeValidOutfit(
+    context: PipelineContext,
+    onStep: PipelineStepCallback,
+  ): Promise<{
     outfit: OutfitResult | null;
     reasons: string[];
   }> {
     try {
       const candidates = await this.brandSelector.select(context);
+      onStep('brand-selector');
       const adapted = this.weatherAdapter.adapt(context, candidates);
+      onStep('weather-adapter');
       const composed = this.outfitComposer.compose(context, adapted);
+      onStep('outfit-composer');
       const validation = this.validationLayer.validate(context, composed);
+      onStep('validation-layer');
       if (!validation.isValid) {
         const deterministic = this.outfitComposer.composeDeterministic(context, adapted);
         const deterministicValidation = this.validationLayer.validate(context, deterministic);
         if (deterministicValidation.isValid) {
           const deterministicFormatted = await this.responseFormatter.format(context, deterministic);
+          onStep('response-formatter');
           if (
             deterministicFormatted.total_price >= context.budget.min &&
             deterministicFormatted.total_price <= context.budget.max
@@ -146,6 +162,7 @@ export class AiService {
       }
 
       const formatted = await this.responseFormatter.format(context, composed);
+      onStep('response-formatter');
       if (
         formatted.total_price < context.budget.min ||
         formatted.total_price > context.budget.max
@@ -66,4 +66,10 @@ export class GenerateOutfitDto {
   @IsOptional()
   @IsBoolean()
   premiumOnly?: boolean;
+
+  // Prefetched by a client before the user asked for it: counts against the quota, but
+  // reaches the generation history and style profile only through POST /outfits/commit.
+  @IsOptional()
+  @IsBoolean()
+  speculative?: boolean;
 }
@@ -53,9 +53,15 @@ export class MonetizationService {
 
   async getSubscription(userId: string) {
     await this.ensureUserMonetizationProfile(userId);
-    return this.prisma.userSubscription.findUnique({
-      where: { userId },
-    });
+    const [subscription, usage] = await Promise.all([
+      this.prisma.userSubscription.findUnique({
+        where: { userId },
+      }),
+      this.prisma.generationUsageDaily.findUnique({
+        where: { userId_day: { userId, day: this.todayStart() } },
+      }),
+    ]);
+    return subscription && { ...subscription, generationsToday: usage?.count ?? 0 };
   }
 
   async activatePremium(userId: string) {
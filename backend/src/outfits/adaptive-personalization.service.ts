@@ -14,6 +14,15 @@ type RatingPayload = {
   outfit?: Record<string, unknown>;
 };
 
+type SavedOutfitSummary = {
+  style?: string;
+  total_price?: number;
+  top?: { brand?: string };
+  bottom?: { brand?: string };
+  shoes?: { brand?: string };
+  outerwear?: { brand?: string };
+};
+
 @Injectable()
 export class AdaptivePersonalizationService {
   private readonly logger = new Logger(AdaptivePersonalizationService.name);
@@ -122,21 +131,19 @@ export class AdaptivePersonalizationService {
   }
 
   async recordRating(userId: string, payload: RatingPayload) {
-    await this.createAuditLog(userId, 'OUTFIT_RATE', payload);
+    await this.prisma.auditLog.create({ data: this.ratingLogEntry(userId, payload) });
   }
 
-  async recordSaveAction(
-    userId: string,
-    outfit: {
-      style?: string;
-      total_price?: number;
-      top?: { brand?: string };
-      bottom?: { brand?: string };
-      shoes?: { brand?: string };
-      outerwear?: { brand?: string };
-    },
-  ) {
-    await this.createAuditLog(userId, 'OUTFIT_SAVE', {
+  async recordSaveAction(userId: string, outfit: SavedOutfitSummary) {
+    await this.prisma.auditLog.create({ data: this.saveLogEntry(userId, outfit) });
+  }
+
+  ratingLogEntry(userId: string, payload: RatingPayload): Prisma.AuditLogCreateManyInput {
+    return this.auditLogEntry(userId, 'OUTFIT_RATE', payload);
+  }
+
+  saveLogEntry(userId: string, outfit: SavedOutfitSummary): Prisma.AuditLogCreateManyInput {
+    return this.auditLogEntry(userId, 'OUTFIT_SAVE', {
       style: outfit.style,
       totalPrice: outfit.total_price,
       brands: [
@@ -157,14 +164,16 @@ export class AdaptivePersonalizationService {
   }
 
   private async createAuditLog(userId: string, action: string, payload: unknown) {
-    await this.prisma.auditLog.create({
-      data: {
-        actorUserId: userId,
-        action,
-        entityType: 'OUTFIT',
-        payload: payload as Prisma.InputJsonValue,
-      },
-    });
+    await this.prisma.auditLog.create({ data: this.auditLogEntry(userId, action, payload) });
+  }
+
+  private auditLogEntry(userId: string, action: string, payload: unknown): Prisma.AuditLogCreateManyInput {
+    return {
+      actorUserId: userId,
+      action,
+      entityType: 'OUTFIT',
+      payload: payload as Prisma.InputJsonValue,
+    };
   }
 
   private computeAdaptiveIndex(input: {
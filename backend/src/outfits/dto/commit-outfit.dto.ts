@@ -0,0 +1,13 @@
+import { Type } from 'class-transformer';
+import { IsObject, ValidateNested } from 'class-validator';
+import { GenerateOutfitDto } from '../../ai/dto/generate-outfit.dto';
+
+export class CommitOutfitDto {
+  // The request the speculative outfit was generated for.
+  @ValidateNested()
+  @Type(() => GenerateOutfitDto)
+  input!: GenerateOutfitDto;
+
+  @IsObject()
+  outfit!: Record<string, unknown>;
+}
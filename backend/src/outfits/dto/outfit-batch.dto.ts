@@ -0,0 +1,38 @@
+import { Type } from 'class-transformer';
+import { ArrayMaxSize, IsArray, IsOptional, IsString, MaxLength, ValidateNested } from 'class-validator';
+import { OutfitFeedbackDto } from './outfit-feedback.dto';
+import { SaveOutfitDto } from './save-outfit.dto';
+
+export const OUTFIT_BATCH_MAX_ITEMS = 50;
+
+// A client-generated key per entry, fixed when the entry is first queued. An entry whose
+// key was already written for the user is skipped, so a resent batch is a no-op.
+export class BatchSaveOutfitDto extends SaveOutfitDto {
+  @IsOptional()
+  @IsString()
+  @MaxLength(64)
+  idempotencyKey?: string;
+}
+
+export class BatchOutfitFeedbackDto extends OutfitFeedbackDto {
+  @IsOptional()
+  @IsString()
+  @MaxLength(64)
+  idempotencyKey?: string;
+}
+
+export class OutfitBatchDto {
+  @IsOptional()
+  @IsArray()
+  @ArrayMaxSize(OUTFIT_BATCH_MAX_ITEMS)
+  @ValidateNested({ each: true })
+  @Type(() => BatchSaveOutfitDto)
+  saves?: BatchSaveOutfitDto[];
+
+  @IsOptional()
+  @IsArray()
+  @ArrayMaxSize(OUTFIT_BATCH_MAX_ITEMS)
+  @ValidateNested({ each: true })
+  @Type(() => BatchOutfitFeedbackDto)
+  feedback?: BatchOutfitFeedbackDto[];
+}
@@ -3,6 +3,8 @@ import { Throttle } from '@nestjs/throttler';
 import { GenerateOutfitDto } from '../ai/dto/generate-outfit.dto';
 import { CurrentUser } from '../common/decorators/current-user.decorator';
 import { JwtPayload } from '../common/interfaces/jwt-payload.interface';
+import { CommitOutfitDto } from './dto/commit-outfit.dto';
+import { OutfitBatchDto } from './dto/outfit-batch.dto';
 import { OutfitFeedbackDto } from './dto/outfit-feedback.dto';
 import { SaveOutfitDto } from './dto/save-outfit.dto';
 import { OutfitsService } from './outfits.service';
@@ -17,6 +19,13 @@ export class OutfitsController {
     return this.outfitsService.generate(user.sub, dto);
   }
 
+  // Records a speculative (prefetched) outfit once the user is shown it.
+  @Throttle({ generate: { limit: 8, ttl: 60_000 } })
+  @Post('commit')
+  commit(@CurrentUser() user: JwtPayload, @Body() dto: CommitOutfitDto) {
+    return this.outfitsService.commitSpeculative(user.sub, dto);
+  }
+
   @Throttle({ generate: { limit: 6, ttl: 60_000 } })
   @Post('regenerate')
   regenerate(@CurrentUser() user: JwtPayload, @Body() dto: GenerateOutfitDto) {
@@ -38,6 +47,11 @@ export class OutfitsController {
     return this.outfitsService.recordFeedback(user.sub, dto);
   }
 
+  @Post('batch')
+  batch(@CurrentUser() user: JwtPayload, @Body() dto: OutfitBatchDto) {
+    return this.outfitsService.recordBatch(user.sub, dto);
+  }
+
   @Get('saved')
   saved(@CurrentUser() user: JwtPayload) {
     return this.outfitsService.getSaved(user.sub);
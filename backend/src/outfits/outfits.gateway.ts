@@ -1,3 +1,4 @@
+import { HttpException, UsePipes, ValidationPipe } from '@nestjs/common';
 import {
   ConnectedSocket,
   MessageBody,
@@ -7,13 +8,14 @@ import {
   SubscribeMessage,
   WebSocketGateway,
   WebSocketServer,
+  WsException,
 } from '@nestjs/websockets';
 import { ConfigService } from '@nestjs/config';
 import { JwtService } from '@nestjs/jwt';
 import { Server, Socket } from 'socket.io';
-import { AiService } from '../ai/ai.service';
 import { GenerateOutfitDto } from '../ai/dto/generate-outfit.dto';
 import { JwtPayload } from '../common/interfaces/jwt-payload.interface';
+import { OutfitsService } from './outfits.service';
 
 const WS_CORS_ORIGIN = process.env.CORS_ORIGIN
   ? process.env.CORS_ORIGIN.split(',').map((origin) => origin.trim())
@@ -31,7 +33,7 @@ export class OutfitsGateway implements OnGatewayInit, OnGatewayConnection, OnGat
   private readonly requestTimestampsByUser = new Map<string, number[]>();
 
   constructor(
-    private readonly aiService: AiService,
+    private readonly outfitsService: OutfitsService,
     private readonly jwtService: JwtService,
     private readonly configService: ConfigService,
   ) {}
@@ -69,42 +71,56 @@ export class OutfitsGateway implements OnGatewayInit, OnGatewayConnection, OnGat
     client.emit('status', { message: 'Disconnected' });
   }
 
+  // Same validation as the REST routes; the global ValidationPipe does not cover gateways.
+  @UsePipes(
+    new ValidationPipe({
+      whitelist: true,
+      transform: true,
+      forbidNonWhitelisted: true,
+      transformOptions: { enableImplicitConversion: true },
+      exceptionFactory: (errors) =>
+        new WsException({
+          statusCode: 400,
+          message: errors.flatMap((error) => Object.values(error.constraints ?? {})),
+          error: 'Bad Request',
+        }),
+    }),
+  )
   @SubscribeMessage('generate')
   async generate(@ConnectedSocket() client: Socket, @MessageBody() payload: GenerateOutfitDto) {
     const user = client.data.user as JwtPayload | undefined;
     if (!user?.sub) {
-      client.emit('error', { message: 'Unauthorized' });
+      client.emit('error', { statusCode: 401, message: 'Unauthorized' });
       return null;
     }
     if (!this.allowSocketRequest(user.sub)) {
-      client.emit('error', { message: 'Too many websocket requests. Please wait 1 minute.' });
+      client.emit('error', { statusCode: 429, message: 'Too many websocket requests. Please wait 1 minute.' });
       return null;
     }
 
-    const steps = [
-      'input-analyzer',
-      'context-builder',
-      'style-classifier',
-      'budget-engine',
-      'brand-selector',
-      'weather-adapter',
-      'outfit-composer',
-      'validation-layer',
-      'response-formatter',
-    ];
-
-    for (const step of steps) {
-      client.emit('pipeline', { step, status: 'running' });
-    }
-
     try {
-      const outfit = await this.aiService.generateOutfit(payload, { userId: user.sub });
+      // Through OutfitsService like POST /outfits/generate: quota, luxury gate, history
+      // and style profile included. Each step is sent once that stage has finished.
+      const outfit = await this.outfitsService.generate(user.sub, payload, (step) => {
+        client.emit('pipeline', { step, status: 'done' });
+      });
       client.emit('result', outfit);
       return outfit;
     } catch (error) {
-      client.emit('error', { message: String(error) });
-      throw error;
+      client.emit('error', this.errorBody(error));
+      return null;
+    }
+  }
+
+  // The NestJS HTTP error body, so clients map stream and REST failures the same way.
+  private errorBody(error: unknown) {
+    if (error instanceof HttpException) {
+      const response = error.getResponse();
+      return typeof response === 'string'
+        ? { statusCode: error.getStatus(), message: response }
+        : { statusCode: error.getStatus(), ...(response as object) };
     }
+    return { statusCode: 500, message: String(error) };
   }
 
   private authorizeSocket(client: Socket): JwtPayload | null {
@@ -1,11 +1,14 @@
 import { Injectable } from '@nestjs/common';
 import { BudgetMode, OutfitChannel, Prisma } from '@prisma/client';
+import { PipelineStepCallback } from '../ai/ai.service';
 import { GenerateOutfitDto } from '../ai/dto/generate-outfit.dto';
 import { OutfitResult } from '../ai/types/outfit.types';
 import { BudgetModeInput } from '../common/enums/budget-mode.enum';
 import { PrismaService } from '../database/prisma.service';
 import { MonetizationService } from '../monetization/monetization.service';
 import { AdaptivePersonalizationService } from './adaptive-personalization.service';
+import { CommitOutfitDto } from './dto/commit-outfit.dto';
+import { OutfitBatchDto } from './dto/outfit-batch.dto';
 import { OutfitFeedbackDto } from './dto/outfit-feedback.dto';
 import { SaveOutfitDto } from './dto/save-outfit.dto';
 import { OutfitQueueService } from './queue/outfit-queue.service';
@@ -21,7 +24,9 @@ export class OutfitsService {
     private readonly adaptivePersonalizationService: AdaptivePersonalizationService,
   ) {}
 
-  async generate(userId: string, dto: GenerateOutfitDto) {
+  // REST and the /outfits WebSocket gateway both generate through here, so the quota,
+  // luxury gate, history and style profile apply to either; onStep receives pipeline steps.
+  async generate(userId: string, dto: GenerateOutfitDto, onStep?: PipelineStepCallback) {
     await this.monetizationService.ensureGenerationAllowed(
       userId,
       dto.luxuryOnly ?? false,
@@ -38,35 +43,40 @@ export class OutfitsService {
       ...dto,
       budgetMode: dto.budgetMode ?? this.toBudgetModeInput(styleProfile?.preferredBudgetMode),
     };
-    const outfit = await this.outfitQueueService.generate(resolvedInput, {
-      userId,
-      personalization: adaptiveSignals,
-      monetization: monetizationSignals,
-    });
-    const budgetMode = this.mapBudgetMode(resolvedInput.budgetMode);
-
-    await this.prisma.outfitGenerationLog.create({
-      data: {
+    const outfit = await this.outfitQueueService.generate(
+      resolvedInput,
+      {
         userId,
-        style: outfit.style,
-        occasion: resolvedInput.occasion,
-        weatherContext: outfit.weather_context,
-        location: resolvedInput.city ?? 'auto',
-        budgetMode,
-        budgetMin: resolvedInput.budgetMin ?? null,
-        budgetMax: resolvedInput.budgetMax ?? null,
-        totalPrice: outfit.total_price,
-        outputJson: outfit as unknown as Prisma.InputJsonValue,
-        validationPassed: true,
-        explanation: outfit.explanation,
+        personalization: adaptiveSignals,
+        monetization: monetizationSignals,
       },
-    });
-    await this.styleProfileService.recordGeneration(userId, resolvedInput, outfit);
+      onStep,
+    );
+
+    if (dto.speculative) {
+      // Recorded by commitSpeculative if the client ends up showing it.
+      await this.monetizationService.consumeGeneration(userId);
+      return outfit;
+    }
+
+    await this.recordGeneration(userId, resolvedInput, outfit);
     await this.monetizationService.consumeGeneration(userId);
 
     return outfit;
   }
 
+  // A speculative outfit the user has now been shown: written to the generation history
+  // and style profile as generate() would have. Its quota was spent when it was generated.
+  async commitSpeculative(userId: string, dto: CommitOutfitDto) {
+    const styleProfile = await this.styleProfileService.getByUserId(userId);
+    const resolvedInput: GenerateOutfitDto = {
+      ...dto.input,
+      budgetMode: dto.input.budgetMode ?? this.toBudgetModeInput(styleProfile?.preferredBudgetMode),
+    };
+    await this.recordGeneration(userId, resolvedInput, dto.outfit as unknown as OutfitResult);
+    return { status: 'ok' };
+  }
+
   async regenerate(userId: string, dto: GenerateOutfitDto) {
     await this.adaptivePersonalizationService.recordRegenerateAction(userId, dto);
     return this.generate(userId, dto);
@@ -123,6 +133,52 @@ export class OutfitsService {
     };
   }
 
+  async recordBatch(userId: string, dto: OutfitBatchDto) {
+    const saves = dto.saves ?? [];
+    const feedback = dto.feedback ?? [];
+    // Entries are keyed by the client's idempotencyKey, and skipDuplicates drops any already
+    // written: a batch resent after a lost response (the write committed, the client timed
+    // out) adds nothing twice. One transaction keeps a save and its log entry together.
+    const [savedOutfits, auditLogs] = await this.prisma.$transaction([
+      this.prisma.savedOutfit.createMany({
+        data: saves.map((save) => ({
+          userId,
+          channel: save.channel as OutfitChannel,
+          outfitJson: save.outfit as Prisma.InputJsonValue,
+          idempotencyKey: save.idempotencyKey,
+        })),
+        skipDuplicates: true,
+      }),
+      this.prisma.auditLog.createMany({
+        data: [
+          ...saves.map((save) => ({
+            ...this.adaptivePersonalizationService.saveLogEntry(userId, save.outfit as OutfitResult),
+            idempotencyKey: save.idempotencyKey,
+          })),
+          ...feedback.map((item) => ({
+            ...this.adaptivePersonalizationService.ratingLogEntry(userId, {
+              rating: item.rating,
+              style: item.style,
+              saved: item.saved,
+              regenerated: item.regenerated,
+              budgetMode: item.budgetMode,
+              note: item.note,
+              outfit: item.outfit,
+            }),
+            idempotencyKey: item.idempotencyKey,
+          })),
+        ],
+        skipDuplicates: true,
+      }),
+    ]);
+
+    // Counts of rows actually written; a save writes one of each, so the rest are ratings.
+    return {
+      saved: savedOutfits.count,
+      feedback: auditLogs.count - savedOutfits.count,
+    };
+  }
+
   async getStyleProfile(userId: string) {
     const profile = await this.styleProfileService.getByUserId(userId);
     const adaptive = await this.adaptivePersonalizationService.buildSignals(userId, profile);
@@ -135,6 +191,26 @@ export class OutfitsService {
     };
   }
 
+  private async recordGeneration(userId: string, resolvedInput: GenerateOutfitDto, outfit: OutfitResult) {
+    await this.prisma.outfitGenerationLog.create({
+      data: {
+        userId,
+        style: outfit.style,
+        occasion: resolvedInput.occasion,
+        weatherContext: outfit.weather_context,
+        location: resolvedInput.city ?? 'auto',
+        budgetMode: this.mapBudgetMode(resolvedInput.budgetMode),
+        budgetMin: resolvedInput.budgetMin ?? null,
+        budgetMax: resolvedInput.budgetMax ?? null,
+        totalPrice: outfit.total_price,
+        outputJson: outfit as unknown as Prisma.InputJsonValue,
+        validationPassed: true,
+        explanation: outfit.explanation,
+      },
+    });
+    await this.styleProfileService.recordGeneration(userId, resolvedInput, outfit);
+  }
+
   private mapBudgetMode(mode?: string): BudgetMode {
     if (mode === 'premium') {
       return BudgetMode.PREMIUM;
@@ -1,7 +1,8 @@
 import { Injectable, Logger, OnModuleDestroy, OnModuleInit } from '@nestjs/common';
 import { ConfigService } from '@nestjs/config';
 import { ConnectionOptions, Job, Queue, QueueEvents, Worker } from 'bullmq';
-import { AiService } from '../../ai/ai.service';
+import { randomUUID } from 'crypto';
+import { AiService, PipelineStepCallback } from '../../ai/ai.service';
 import { GenerateOutfitDto } from '../../ai/dto/generate-outfit.dto';
 import { OutfitResult } from '../../ai/types/outfit.types';
 
@@ -127,20 +128,35 @@ export class OutfitQueueService implements OnModuleInit, OnModuleDestroy {
   async generate(
     input: GenerateOutfitDto,
     options?: GenerationJobPayload['options'],
+    onStep?: PipelineStepCallback,
   ): Promise<OutfitResult> {
     if (!this.queue || !this.queueEvents) {
-      return this.aiService.generateOutfit(input, options);
+      return this.aiService.generateOutfit(input, options, onStep);
     }
 
+    // The worker reports pipeline steps as job progress; the id is chosen up front so the
+    // listener is in place before the first step can arrive.
+    const jobId = randomUUID();
+    const queueEvents = this.queueEvents;
+    const onProgress = ({ jobId: progressJobId, data }: { jobId: string; data: unknown }) => {
+      const step = (data as { step?: unknown } | null)?.step;
+      if (progressJobId === jobId && typeof step === 'string') {
+        onStep?.(step);
+      }
+    };
+    if (onStep) {
+      queueEvents.on('progress', onProgress);
+    }
     try {
-      const job = await this.queue.add('generate', {
-        input,
-        options,
-      });
-      return (await job.waitUntilFinished(this.queueEvents, this.timeoutMs)) as OutfitResult;
+      const job = await this.queue.add('generate', { input, options }, { jobId });
+      return (await job.waitUntilFinished(queueEvents, this.timeoutMs)) as OutfitResult;
     } catch (error) {
       this.logger.warn(`Queue generation fallback to direct mode: ${String(error)}`);
-      return this.aiService.generateOutfit(input, options);
+      return this.aiService.generateOutfit(input, options, onStep);
+    } finally {
+      if (onStep) {
+        queueEvents.off('progress', onProgress);
+      }
     }
   }
 
@@ -176,7 +192,9 @@ export class OutfitQueueService implements OnModuleInit, OnModuleDestroy {
 
   private async processJob(job: Job<GenerationJobPayload, OutfitResult>) {
     const payload = job.data;
-    return this.aiService.generateOutfit(payload.input, payload.options);
+    return this.aiService.generateOutfit(payload.input, payload.options, (step) => {
+      void job.updateProgress({ step }).catch(() => undefined);
+    });
   }
 
   private async closeQueueResources() {
@@ -1,36 +1,502 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any
+import asyncio
+import base64
+import binascii
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Mapping
 
 import aiohttp
 
-from config import Settings
+import json_codec
+from config import EndpointTimeout, Settings
+from metrics import backend_errors, backend_request_seconds
+from resilience import BreakerBoard, CircuitBreaker, LatencyTracker, time_remaining
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+StepCallback = Callable[[str], Awaitable[None]]
+
+
+class BackendError(RuntimeError):
+    def __init__(
+        self,
+        status: int,
+        path: str,
+        body: str = "",
+        *,
+        message: str | None = None,
+        error: str | None = None,
+        retry_after: float | None = None,
+    ):
+        self.status = status
+        self.path = path
+        self.body = body
+        self.message = message or body[:300] or f"HTTP {status}"
+        self.error = error
+        self.retry_after = retry_after
+        super().__init__(f"Backend {status} on {path}: {self.message}")
+
+    @classmethod
+    def from_response(cls, status: int, path: str, body: bytes, headers: Mapping[str, str]) -> BackendError:
+        # NestJS errors look like {"statusCode": 400, "message": "..." | [...], "error": "Bad Request"}.
+        text = body.decode("utf-8", errors="replace")
+        message: str | None = None
+        error: str | None = None
+        try:
+            data = json_codec.loads(body) if body else None
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            raw_message = data.get("message")
+            if isinstance(raw_message, list):
+                message = "; ".join(str(item) for item in raw_message)
+            elif raw_message is not None:
+                message = str(raw_message)
+            error = str(data["error"]) if data.get("error") is not None else None
+        if status in (401, 403):
+            error_cls: type[BackendError] = BackendAuthError
+        elif status == 429:
+            error_cls = BackendRateLimited
+        else:
+            error_cls = BackendError
+        return error_cls(
+            status,
+            path,
+            text,
+            message=message,
+            error=error,
+            retry_after=parse_retry_after(headers.get("Retry-After")),
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "status": self.status,
+            "path": self.path,
+            "message": self.message,
+            "error": self.error,
+            "retry_after": self.retry_after,
+        }
+
+
+class BackendAuthError(BackendError):
+    pass
+
+
+class BackendRateLimited(BackendError):
+    pass
+
+
+class BackendProtocolError(BackendError):
+    # The backend answered 2xx but the body is unusable (too large or not JSON).
+    def __init__(self, status: int, path: str, reason: str, message: str):
+        super().__init__(status, path, message=message, error=reason)
+        self.reason = reason
+
+
+class BackendCircuitOpen(BackendError):
+    # Refused locally: the breaker for this path is open after repeated failures.
+    def __init__(self, path: str, retry_after: float):
+        super().__init__(503, path, message="circuit open", error="circuit_open", retry_after=retry_after)
+
+
+class BackendDeadlineExceeded(BackendError):
+    # The handler's time budget ran out before this call could be made.
+    def __init__(self, path: str):
+        super().__init__(504, path, message="deadline exceeded", error="deadline")
+
+
+def backend_failed(error: BaseException, clipped: bool) -> bool | None:
+    # What a failed call says about the backend, for its circuit breaker: True when it is
+    # unhealthy, False when it answered (4xx, bad body), None when the call tells nothing
+    # (cancelled, or timed out only because the caller's deadline cut it short).
+    if isinstance(error, BackendError):
+        return error.status >= 500
+    if isinstance(error, asyncio.TimeoutError):
+        return None if clipped else True
+    if isinstance(error, aiohttp.ClientError):
+        return True
+    return None
+
+
+def generation_payload(
+    *,
+    style: str,
+    occasion: str | None,
+    city: str | None,
+    budget_mode: str,
+    budget_min: int | None = None,
+    budget_max: int | None = None,
+    luxury_only: bool = False,
+) -> dict[str, Any]:
+    # GenerateOutfitDto body for POST /outfits/generate (and the stream, and commits).
+    payload: dict[str, Any] = {
+        "style": style,
+        "budgetMode": budget_mode,
+        "luxuryOnly": luxury_only,
+    }
+    if occasion:
+        payload["occasion"] = occasion
+    if city:
+        payload["city"] = city
+    if budget_mode == "custom":
+        if budget_min is not None:
+            payload["budgetMin"] = budget_min
+        if budget_max is not None:
+            payload["budgetMax"] = budget_max
+    return payload
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def jwt_expiry(token: str) -> float | None:
+    # Only reads the `exp` claim to schedule refreshes; the backend still verifies the signature.
+    try:
+        payload = token.split(".")[1]
+        claims = json_codec.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (IndexError, ValueError, binascii.Error):
+        return None
+    exp = claims.get("exp") if isinstance(claims, dict) else None
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+
+@dataclass(slots=True)
 class BackendSession:
     access_token: str
     refresh_token: str
     token_type: str
+    expires_at: float | None = None
+
+    @classmethod
+    def from_payload(cls, data: dict[str, Any]) -> BackendSession:
+        return cls(
+            access_token=data["accessToken"],
+            refresh_token=data["refreshToken"],
+            token_type=data.get("tokenType", "Bearer"),
+            expires_at=jwt_expiry(data["accessToken"]),
+        )
+
+    def expires_within(self, seconds: float) -> bool:
+        return self.expires_at is not None and self.expires_at - time.time() <= seconds
+
+
+# Path label of streamed generations in errors, metrics and the circuit breakers.
+STREAM_PATH = "/outfits (ws)"
+
+
+class StreamUnavailable(Exception):
+    # The stream could not take the request, which was therefore never sent: REST may retry it.
+    pass
+
+
+@dataclass
+class _StreamConnection:
+    client: Any
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+    on_step: StepCallback | None = None
+    result: asyncio.Future[dict[str, Any]] | None = None
+    last_error: str | None = None
+
+
+class OutfitStreamPool:
+    # Socket.IO connections to the backend `/outfits` namespace, one per access token
+    # (the gateway authenticates at handshake). Result/error events carry no request id,
+    # so each connection runs one generation at a time, and a connection whose request
+    # timed out or was cancelled is closed rather than reused: its late result would
+    # otherwise answer the next caller.
+    namespace = "/outfits"
+
+    def __init__(self, backend_url: str, *, max_connections: int, idle_seconds: float, timeout_seconds: float):
+        self.backend_url = backend_url
+        self.max_connections = max_connections
+        self.idle_seconds = idle_seconds
+        self.timeout_seconds = timeout_seconds
+        self._connections: OrderedDict[str, _StreamConnection] = OrderedDict()
+        self.connects = 0
+        self.reuses = 0
+        self.evictions = 0
+        self.abandoned = 0
+
+    async def generate(self, access_token: str, payload: dict[str, Any], on_step: StepCallback) -> dict[str, Any]:
+        import socketio
+
+        connection = await self._acquire(access_token)
+        async with connection.lock:
+            if not connection.client.connected:
+                # Closed while this call waited for the lock.
+                raise StreamUnavailable("stream closed")
+            loop = asyncio.get_running_loop()
+            connection.on_step = on_step
+            connection.result = loop.create_future()
+            try:
+                try:
+                    await connection.client.emit("generate", payload, namespace=self.namespace)
+                except socketio.exceptions.SocketIOError as error:
+                    raise StreamUnavailable(str(error)) from error
+                remaining = time_remaining()
+                timeout = self.timeout_seconds if remaining is None else min(self.timeout_seconds, remaining)
+                return await asyncio.wait_for(connection.result, max(timeout, 0))
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self.abandoned += 1
+                await self._discard(access_token, connection)
+                raise
+            finally:
+                connection.on_step = None
+                connection.result = None
+                connection.last_used = time.monotonic()
+
+    async def _acquire(self, access_token: str) -> _StreamConnection:
+        await self._evict_idle()
+        connection = self._connections.get(access_token)
+        if connection is not None and connection.client.connected:
+            self._connections.move_to_end(access_token)
+            self.reuses += 1
+            return connection
+        if connection is not None:
+            await self._drop(access_token)
+
+        import socketio
+
+        client = socketio.AsyncClient(reconnection=False)
+        connection = _StreamConnection(client=client)
+        self._register_handlers(connection)
+        try:
+            await client.connect(
+                self.backend_url,
+                auth={"token": access_token},
+                transports=["websocket"],
+                namespaces=[self.namespace],
+                wait_timeout=self.timeout_seconds,
+            )
+        except socketio.exceptions.ConnectionError as error:
+            raise StreamUnavailable(str(error)) from error
+        self.connects += 1
+        self._connections[access_token] = connection
+        while len(self._connections) > self.max_connections:
+            oldest = next(iter(self._connections))
+            await self._drop(oldest)
+            self.evictions += 1
+        return connection
+
+    def _register_handlers(self, connection: _StreamConnection) -> None:
+        client = connection.client
+
+        def _fail(error: Exception) -> None:
+            if connection.result is not None and not connection.result.done():
+                connection.result.set_exception(error)
+
+        async def on_pipeline(data: Any) -> None:
+            step = data.get("step") if isinstance(data, dict) else None
+            if connection.on_step is not None and isinstance(step, str):
+                try:
+                    await connection.on_step(step)
+                except Exception as error:
+                    logger.warning("Pipeline step callback failed: %s", error)
+
+        async def on_result(data: Any) -> None:
+            if connection.result is not None and not connection.result.done():
+                connection.result.set_result(data if isinstance(data, dict) else {})
+
+        async def on_error(data: Any) -> None:
+            message = str(data.get("message") if isinstance(data, dict) else data)
+            connection.last_error = message
+            status = data.get("statusCode") if isinstance(data, dict) else None
+            if isinstance(status, int):
+                # The gateway sends the NestJS HTTP error body: same classes as over REST.
+                _fail(BackendError.from_response(status, STREAM_PATH, json_codec.dumps(data), {}))
+            elif "Unauthorized" in message:
+                _fail(BackendAuthError(401, STREAM_PATH, message))
+            elif "Too many" in message:
+                _fail(BackendRateLimited(429, STREAM_PATH, message))
+            else:
+                _fail(BackendError(500, STREAM_PATH, message))
+
+        async def on_disconnect() -> None:
+            if connection.last_error and "Unauthorized" in connection.last_error:
+                _fail(BackendAuthError(401, STREAM_PATH, connection.last_error))
+            else:
+                # The request was already sent and may still be running: not safe to resend.
+                _fail(BackendError(502, STREAM_PATH, "stream disconnected during generation"))
+
+        client.on("pipeline", on_pipeline, namespace=self.namespace)
+        client.on("result", on_result, namespace=self.namespace)
+        client.on("error", on_error, namespace=self.namespace)
+        client.on("exception", on_error, namespace=self.namespace)
+        client.on("disconnect", on_disconnect, namespace=self.namespace)
+
+    async def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        for token, connection in list(self._connections.items()):
+            if connection.last_used < cutoff and not connection.lock.locked():
+                await self._drop(token)
+                self.evictions += 1
+
+    async def _drop(self, access_token: str) -> None:
+        connection = self._connections.pop(access_token, None)
+        if connection is not None:
+            await self._disconnect(connection)
+
+    async def _discard(self, access_token: str, connection: _StreamConnection) -> None:
+        if self._connections.get(access_token) is connection:
+            del self._connections[access_token]
+        await self._disconnect(connection)
+
+    @staticmethod
+    async def _disconnect(connection: _StreamConnection) -> None:
+        try:
+            await connection.client.disconnect()
+        except Exception as error:
+            logger.warning("Failed to close outfit stream: %s", error)
+
+    async def close(self) -> None:
+        for token in list(self._connections):
+            await self._drop(token)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "connections": len(self._connections),
+            "connects": self.connects,
+            "reuses": self.reuses,
+            "evictions": self.evictions,
+            "abandoned": self.abandoned,
+        }
+
+
+@dataclass
+class PoolStats:
+    in_flight: int = 0
+    in_flight_peak: int = 0
+    queued: int = 0
+    queued_total: int = 0
+    queue_wait_seconds_total: float = 0.0
+    queue_wait_seconds_max: float = 0.0
+    connections_created: int = 0
+    connections_reused: int = 0
 
 
 class BackendClient:
     def __init__(self, settings: Settings):
         self.base_url = f"{settings.backend_url}/api"
         self.timeout = aiohttp.ClientTimeout(total=settings.backend_timeout_seconds)
+        self.timeouts = {
+            name: self._client_timeout(value) for name, value in settings.backend_timeouts.items()
+        }
+        self.pool_limit = settings.backend_pool_limit
+        self.pool_limit_per_host = settings.backend_pool_limit_per_host
+        self.keepalive_seconds = settings.backend_keepalive_seconds
+        self.dns_ttl_seconds = settings.backend_dns_ttl_seconds
         self.bot_secret = settings.bot_secret
+        self.max_response_bytes = settings.backend_max_response_bytes
+        self.stats = PoolStats()
         self._session: aiohttp.ClientSession | None = None
+        self.breakers = BreakerBoard(
+            failure_threshold=settings.breaker_failures,
+            open_seconds=settings.breaker_open_seconds,
+        )
+        # Only idempotent reads (GET) are hedged; 0 disables.
+        self.latency = LatencyTracker(settings.hedge_percentile) if settings.hedge_percentile > 0 else None
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.streams = (
+            OutfitStreamPool(
+                settings.backend_url,
+                max_connections=settings.stream_max_connections,
+                idle_seconds=settings.stream_idle_seconds,
+                timeout_seconds=settings.backend_timeouts["generate"].total,
+            )
+            if settings.streaming_enabled
+            else None
+        )
+
+    @staticmethod
+    def _client_timeout(value: EndpointTimeout) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=value.total, connect=value.connect, sock_read=value.read)
 
     async def close(self) -> None:
         if self._session and not self._session.closed:
             await self._session.close()
+        if self.streams is not None:
+            await self.streams.close()
 
     async def _get_session(self) -> aiohttp.ClientSession:
         if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession(timeout=self.timeout)
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                limit_per_host=self.pool_limit_per_host,
+                keepalive_timeout=self.keepalive_seconds,
+                ttl_dns_cache=self.dns_ttl_seconds,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                trace_configs=[self._trace_config()],
+                json_serialize=json_codec.dumps_str,
+            )
         return self._session
 
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_queued_start(_session: Any, ctx: SimpleNamespace, _params: Any) -> None:
+            ctx.queued_at = time.perf_counter()
+            self.stats.queued += 1
+            self.stats.queued_total += 1
+
+        async def on_queued_end(_session: Any, ctx: SimpleNamespace, _params: Any) -> None:
+            waited = time.perf_counter() - ctx.queued_at
+            self.stats.queued -= 1
+            self.stats.queue_wait_seconds_total += waited
+            self.stats.queue_wait_seconds_max = max(self.stats.queue_wait_seconds_max, waited)
+
+        async def on_create_end(_session: Any, _ctx: SimpleNamespace, _params: Any) -> None:
+            self.stats.connections_created += 1
+
+        async def on_reuse(_session: Any, _ctx: SimpleNamespace, _params: Any) -> None:
+            self.stats.connections_reused += 1
+
+        trace.on_connection_queued_start.append(on_queued_start)
+        trace.on_connection_queued_end.append(on_queued_end)
+        trace.on_connection_create_end.append(on_create_end)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    def pool_stats(self) -> dict[str, float]:
+        stats = self.stats
+        active = stats.in_flight - stats.queued
+        return {
+            "limit": self.pool_limit,
+            "limit_per_host": self.pool_limit_per_host,
+            "in_flight": stats.in_flight,
+            "in_flight_peak": stats.in_flight_peak,
+            "active": active,
+            "saturation": active / self.pool_limit if self.pool_limit else 0.0,
+            "queued": stats.queued,
+            "queued_total": stats.queued_total,
+            "queue_wait_seconds_avg": (
+                stats.queue_wait_seconds_total / stats.queued_total if stats.queued_total else 0.0
+            ),
+            "queue_wait_seconds_max": stats.queue_wait_seconds_max,
+            "connections_created": stats.connections_created,
+            "connections_reused": stats.connections_reused,
+        }
+
+    def resilience_stats(self) -> dict[str, float]:
+        return {
+            **{f"breakers_{name}": value for name, value in self.breakers.stats().items()},
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+
     async def telegram_login(self, telegram_id: str, username: str | None) -> BackendSession:
         payload: dict[str, Any] = {
             "telegramId": telegram_id,
@@ -39,20 +505,17 @@ class BackendClient:
         if self.bot_secret:
             payload["botSecret"] = self.bot_secret
 
-        data = await self._request("POST", "/auth/telegram/login", json=payload)
-        return BackendSession(
-            access_token=data["accessToken"],
-            refresh_token=data["refreshToken"],
-            token_type=data.get("tokenType", "Bearer"),
-        )
+        data = await self._request("POST", "/auth/telegram/login", json=payload, endpoint="auth")
+        return BackendSession.from_payload(data)
 
     async def refresh(self, refresh_token: str) -> BackendSession:
-        data = await self._request("POST", "/auth/refresh", json={"refreshToken": refresh_token})
-        return BackendSession(
-            access_token=data["accessToken"],
-            refresh_token=data["refreshToken"],
-            token_type=data.get("tokenType", "Bearer"),
+        data = await self._request(
+            "POST",
+            "/auth/refresh",
+            json={"refreshToken": refresh_token},
+            endpoint="auth",
         )
+        return BackendSession.from_payload(data)
 
     async def generate_outfit(
         self,
@@ -65,27 +528,55 @@ class BackendClient:
         budget_min: int | None = None,
         budget_max: int | None = None,
         luxury_only: bool = False,
+        speculative: bool = False,
+        on_step: StepCallback | None = None,
     ) -> dict[str, Any]:
-        payload: dict[str, Any] = {
-            "style": style,
-            "budgetMode": budget_mode,
-            "luxuryOnly": luxury_only,
-        }
-        if occasion:
-            payload["occasion"] = occasion
-        if city:
-            payload["city"] = city
-        if budget_mode == "custom":
-            if budget_min is not None:
-                payload["budgetMin"] = budget_min
-            if budget_max is not None:
-                payload["budgetMax"] = budget_max
+        payload = generation_payload(
+            style=style,
+            occasion=occasion,
+            city=city,
+            budget_mode=budget_mode,
+            budget_min=budget_min,
+            budget_max=budget_max,
+            luxury_only=luxury_only,
+        )
+        if speculative:
+            # Prefetch: kept out of the user's history and style profile until commit_outfit.
+            payload["speculative"] = True
+
+        if on_step is not None and self.streams is not None:
+            try:
+                return await self._stream(access_token, payload, on_step)
+            except (StreamUnavailable, BackendCircuitOpen) as error:
+                # Only raised before the request went out, so it is generated once; REST
+                # has its own breaker.
+                logger.warning("Outfit stream unavailable, using REST: %s", error)
 
         return await self._request(
             "POST",
             "/outfits/generate",
             json=payload,
             access_token=access_token,
+            endpoint="generate",
+        )
+
+    async def commit_outfit(self, access_token: str, request: dict[str, Any], outfit: dict[str, Any]) -> dict[str, Any]:
+        # Records a speculative outfit the user has now been shown; request is the
+        # generation_payload it was generated for.
+        return await self._request(
+            "POST",
+            "/outfits/commit",
+            json={"input": request, "outfit": outfit},
+            access_token=access_token,
+            endpoint="write",
+        )
+
+    async def subscription(self, access_token: str) -> dict[str, Any]:
+        return await self._request(
+            "GET",
+            "/monetization/subscription",
+            access_token=access_token,
+            endpoint="auth",
         )
 
     async def save_outfit(self, access_token: str, outfit: dict[str, Any]) -> dict[str, Any]:
@@ -97,8 +588,98 @@ class BackendClient:
                 "outfit": outfit,
             },
             access_token=access_token,
+            endpoint="write",
         )
 
+    async def send_feedback(self, access_token: str, feedback: dict[str, Any]) -> dict[str, Any]:
+        return await self._request(
+            "POST",
+            "/outfits/feedback",
+            json=feedback,
+            access_token=access_token,
+            endpoint="write",
+        )
+
+    async def write_batch(
+        self,
+        access_token: str,
+        *,
+        saves: list[dict[str, Any]],
+        feedback: list[dict[str, Any]],
+    ) -> dict[str, Any]:
+        # One transactional write of a chat's queued saves and ratings (see write_behind.py).
+        # Every entry carries its idempotencyKey, so resending a batch writes nothing twice.
+        return await self._request(
+            "POST",
+            "/outfits/batch",
+            json={"saves": saves, "feedback": feedback},
+            access_token=access_token,
+            endpoint="write",
+        )
+
+    async def featured_styles(self) -> list[str]:
+        # Public and small, so it shares the short auth timeouts.
+        path = "/brands/featured-styles"
+        data: Any = await self._request("GET", path, endpoint="auth")
+        if not isinstance(data, list):
+            raise BackendProtocolError(200, path, "invalid_json", "Expected a list of featured styles")
+        return [item["name"] for item in data if isinstance(item, dict) and isinstance(item.get("name"), str)]
+
+    async def _stream(self, access_token: str, payload: dict[str, Any], on_step: StepCallback) -> dict[str, Any]:
+        # A streamed generation gets the same deadline, circuit breaker and latency and
+        # error metrics as a REST call, under STREAM_PATH.
+        remaining, breaker = self._admit("WS", STREAM_PATH)
+        clipped = remaining is not None and remaining < self.streams.timeout_seconds
+        started = time.perf_counter()
+        try:
+            return await self._guarded(breaker, clipped, self.streams.generate(access_token, payload, on_step))
+        except StreamUnavailable:
+            backend_errors.inc(method="WS", path=STREAM_PATH, status="unavailable")
+            raise
+        except BackendError as error:
+            backend_errors.inc(method="WS", path=STREAM_PATH, status=error.status)
+            raise
+        except asyncio.TimeoutError:
+            backend_errors.inc(method="WS", path=STREAM_PATH, status="timeout")
+            raise
+        finally:
+            backend_request_seconds.observe(time.perf_counter() - started, method="WS", path=STREAM_PATH)
+
+    def _admit(self, method: str, path: str) -> tuple[float | None, CircuitBreaker | None]:
+        # The handler's remaining time and the path's breaker, or raises if either says no.
+        remaining = time_remaining()
+        if remaining is not None and remaining <= 0:
+            backend_errors.inc(method=method, path=path, status="deadline")
+            raise BackendDeadlineExceeded(path)
+        breaker = self.breakers.get(path)
+        wait = breaker.retry_after() if breaker is not None else None
+        if wait is not None:
+            self.breakers.rejected += 1
+            backend_errors.inc(method=method, path=path, status="circuit_open")
+            raise BackendCircuitOpen(path, wait)
+        return remaining, breaker
+
+    @staticmethod
+    async def _guarded(
+        breaker: CircuitBreaker | None, clipped: bool, call: Awaitable[dict[str, Any]]
+    ) -> dict[str, Any]:
+        try:
+            result = await call
+        except BaseException as error:
+            if breaker is not None:
+                # Never reached the backend: says nothing about its health.
+                failed = None if isinstance(error, StreamUnavailable) else backend_failed(error, clipped)
+                if failed is None:
+                    breaker.release()
+                elif failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
     async def _request(
         self,
         method: str,
@@ -106,22 +687,186 @@ class BackendClient:
         *,
         json: dict[str, Any] | None = None,
         access_token: str | None = None,
+        endpoint: str = "write",
     ) -> dict[str, Any]:
+        remaining, breaker = self._admit(method, path)
+
+        timeout = self.timeouts.get(endpoint, self.timeout)
+        # Never wait past the handler's deadline; a timeout caused by that cut says
+        # nothing about the backend, so it does not count against the breaker.
+        clipped = remaining is not None and (timeout.total is None or remaining < timeout.total)
+        if clipped:
+            timeout = aiohttp.ClientTimeout(total=remaining, connect=timeout.connect, sock_read=timeout.sock_read)
+
         headers = {"Content-Type": "application/json"}
         if access_token:
             headers["Authorization"] = f"Bearer {access_token}"
 
+        def send() -> Awaitable[dict[str, Any]]:
+            return self._send(method, path, json=json, headers=headers, timeout=timeout)
+
+        if method == "GET" and self.latency is not None:
+            return await self._guarded(breaker, clipped, self._hedged(path, send, self.latency))
+        return await self._guarded(breaker, clipped, send())
+
+    async def _hedged(
+        self,
+        path: str,
+        send: Callable[[], Awaitable[dict[str, Any]]],
+        latency: LatencyTracker,
+    ) -> dict[str, Any]:
+        # Past the path's latency percentile a second identical request is sent; the first
+        # successful answer wins and the other is cancelled.
+        delay = latency.threshold(path)
+        started = time.perf_counter()
+        first = asyncio.ensure_future(send())
+        pending: set[asyncio.Future[dict[str, Any]]] = {first}
+        errors: list[BaseException] = []
+        try:
+            if delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    self.hedged += 1
+                    pending.add(asyncio.ensure_future(send()))
+                pending |= done
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is not None:
+                        errors.append(error)
+                        continue
+                    if task is not first:
+                        self.hedge_wins += 1
+                    latency.observe(path, time.perf_counter() - started)
+                    return task.result()
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(
+        self,
+        method: str,
+        path: str,
+        *,
+        json: dict[str, Any] | None,
+        headers: dict[str, str],
+        timeout: aiohttp.ClientTimeout,
+    ) -> dict[str, Any]:
         session = await self._get_session()
 
-        async with session.request(
-            method=method,
-            url=f"{self.base_url}{path}",
-            headers=headers,
-            json=json,
-        ) as response:
-            text = await response.text()
-            if response.status >= 400:
-                raise RuntimeError(f"Backend {response.status}: {text}")
-            if not text:
-                return {}
-            return await response.json()
+        self.stats.in_flight += 1
+        self.stats.in_flight_peak = max(self.stats.in_flight_peak, self.stats.in_flight)
+        started = time.perf_counter()
+        try:
+            async with session.request(
+                method=method,
+                url=f"{self.base_url}{path}",
+                headers=headers,
+                json=json,
+                timeout=timeout,
+            ) as response:
+                # Bytes are read once and parsed once; no str round-trip for the outfit payloads.
+                body = await self._read_body(response, path)
+                if response.status >= 400:
+                    raise BackendError.from_response(response.status, path, body, response.headers)
+                if not body:
+                    return {}
+                try:
+                    return json_codec.loads(body)
+                except ValueError as error:
+                    raise BackendProtocolError(response.status, path, "invalid_json", str(error)) from error
+        except BackendProtocolError as error:
+            backend_errors.inc(method=method, path=path, status=error.reason)
+            raise
+        except BackendError as error:
+            backend_errors.inc(method=method, path=path, status=error.status)
+            raise
+        except asyncio.TimeoutError:
+            backend_errors.inc(method=method, path=path, status="timeout")
+            raise
+        except aiohttp.ClientError:
+            backend_errors.inc(method=method, path=path, status="connection")
+            raise
+        finally:
+            self.stats.in_flight -= 1
+            backend_request_seconds.observe(time.perf_counter() - started, method=method, path=path)
+
+    async def _read_body(self, response: aiohttp.ClientResponse, path: str) -> bytes:
+        limit = self.max_response_bytes
+        if response.content_length is not None and response.content_length > limit:
+            raise BackendProtocolError(
+                response.status, path, "too_large", f"Content-Length {response.content_length} exceeds {limit} bytes"
+            )
+        chunks: list[bytes] = []
+        size = 0
+        async for chunk in response.content.iter_any():
+            size += len(chunk)
+            if size > limit:
+                raise BackendProtocolError(response.status, path, "too_large", f"Body exceeds {limit} bytes")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+
+class TokenManager:
+    def __init__(self, backend: BackendClient, refresh_margin_seconds: int = 60):
+        self.backend = backend
+        self.refresh_margin_seconds = refresh_margin_seconds
+        # One in-flight login/refresh per chat; concurrent callers await the same task.
+        self._inflight: dict[int, asyncio.Task[BackendSession]] = {}
+
+    def needs_refresh(self, session: BackendSession) -> bool:
+        return session.expires_within(self.refresh_margin_seconds)
+
+    async def login(self, chat_id: int, telegram_id: str, username: str | None) -> BackendSession:
+        return await self._single_flight(
+            chat_id,
+            lambda: self.backend.telegram_login(telegram_id=telegram_id, username=username),
+        )
+
+    async def refresh(
+        self,
+        chat_id: int,
+        session: BackendSession,
+        telegram_id: str,
+        username: str | None,
+    ) -> BackendSession:
+        async def _refresh_or_login() -> BackendSession:
+            try:
+                return await self.backend.refresh(session.refresh_token)
+            except BackendAuthError:
+                # Refresh token expired or revoked: start a new backend session.
+                return await self.backend.telegram_login(telegram_id=telegram_id, username=username)
+
+        return await self._single_flight(chat_id, _refresh_or_login)
+
+    async def ensure_fresh(
+        self,
+        chat_id: int,
+        session: BackendSession | None,
+        telegram_id: str,
+        username: str | None,
+    ) -> BackendSession:
+        if session is None:
+            return await self.login(chat_id, telegram_id, username)
+        if self.needs_refresh(session):
+            return await self.refresh(chat_id, session, telegram_id, username)
+        return session
+
+    async def _single_flight(
+        self,
+        chat_id: int,
+        factory: Callable[[], Awaitable[BackendSession]],
+    ) -> BackendSession:
+        task = self._inflight.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[chat_id] = task
+            task.add_done_callback(lambda done: self._forget(chat_id, done))
+        # Shield so one cancelled caller does not cancel the login shared with the others.
+        return await asyncio.shield(task)
+
+    def _forget(self, chat_id: int, task: asyncio.Task[BackendSession]) -> None:
+        if self._inflight.get(chat_id) is task:
+            del self._inflight[chat_id]
@@ -0,0 +1,97 @@
+"""Collage render time per outfit using the local PACK_ALL_CLOTHES raster images.
+
+Usage: python telegram-bot/benchmarks/bench_collage.py [--outfits 50] [--workers 2]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from collage import CollageRenderer, CollageSlot  # noqa: E402
+from config import DEFAULT_PACK_IMAGES_DIR  # noqa: E402
+
+CATALOG_PATH = Path(__file__).resolve().parents[2] / "data" / "end" / "launches-catalog.json"
+SLOT_LABELS = {"top": "Top", "bottom": "Bottom", "outerwear": "Outerwear", "shoes": "Shoes", "accessory": "Accessory 1"}
+
+
+def build_outfits(count: int) -> list[list[CollageSlot]]:
+    items = json.loads(CATALOG_PATH.read_text(encoding="utf-8"))
+    by_category: dict[str, list[dict]] = {}
+    for item in items:
+        by_category.setdefault(item["category"], []).append(item)
+    rng = random.Random(7)
+    outfits = []
+    for _ in range(count):
+        slots = []
+        for category, label in SLOT_LABELS.items():
+            if category not in by_category:
+                continue
+            item = rng.choice(by_category[category])
+            slots.append(CollageSlot(label=label, url=None, brand=item["brand"], item=item["title"], category=category))
+        outfits.append(slots)
+    return outfits
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run(outfit_count: int, workers: int) -> None:
+    outfits = build_outfits(outfit_count)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        renderer = CollageRenderer(
+            images_dir=str(DEFAULT_PACK_IMAGES_DIR),
+            cache_dir=cache_dir,
+            cache_max_bytes=512 * 1024 * 1024,
+            workers=workers,
+            fetch_timeout_seconds=5,
+        )
+        # Spawn the worker processes before timing.
+        await renderer.render(outfits[0])
+
+        cold: list[float] = []
+        for slots in outfits:
+            renderer.cache.directory.joinpath(f"{renderer.cache_key(slots)}.jpg").unlink(missing_ok=True)
+            started = time.perf_counter()
+            await renderer.render(slots)
+            cold.append((time.perf_counter() - started) * 1000)
+
+        warm: list[float] = []
+        for slots in outfits:
+            started = time.perf_counter()
+            await renderer.render(slots)
+            warm.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        for slots in outfits:
+            renderer.cache.directory.joinpath(f"{renderer.cache_key(slots)}.jpg").unlink(missing_ok=True)
+        await asyncio.gather(*(renderer.render(slots) for slots in outfits))
+        concurrent_total = time.perf_counter() - started
+        await renderer.close()
+
+    print(f"outfits={outfit_count} workers={workers}")
+    print(f"cold render  p50={statistics.median(cold):.1f}ms p99={percentile(cold, 0.99):.1f}ms")
+    print(f"disk cache   p50={statistics.median(warm):.2f}ms p99={percentile(warm, 0.99):.2f}ms")
+    print(f"concurrent   {outfit_count / concurrent_total:.1f} collages/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--outfits", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args.outfits, args.workers))
+
+
+if __name__ == "__main__":
+    main()
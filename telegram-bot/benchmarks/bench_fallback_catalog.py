@@ -0,0 +1,101 @@
+"""Index build time and outfit query latency of the local fallback catalog.
+
+Indexes the catalogs the bot would use (PACK_ALL_CLOTHES/items.csv when it has
+been exported, and data/end/launches-catalog.json). When the pack table is not
+there, --synthetic N adds N generated rows shaped like it (five categories,
+log-normal prices, two or three style tags each) so the 10.8k-item case can be
+measured anyway.
+
+Usage: python telegram-bot/benchmarks/bench_fallback_catalog.py [--synthetic 10852] [--queries 20000]
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from config import DEFAULT_FALLBACK_CATALOGS  # noqa: E402
+from fallback_catalog import SLOTS, CatalogIndex, read_end_catalog, read_pack_table  # noqa: E402
+from state import OutfitRequestState  # noqa: E402
+
+STYLES = ("streetwear", "casual", "y2k", "minimal", "vintage", "smart casual", "goth", "old money")
+BRANDS = ("Nike", "Adidas", "Levi's", "Carhartt WIP", "Stone Island", "Acne Studios", "Prada", "Bottega Veneta")
+# Median price per category for the synthetic rows.
+MEDIANS = {"top": 120, "bottom": 150, "outerwear": 400, "shoes": 220, "accessory": 90}
+
+
+def synthetic_rows(count: int, seed: int):
+    rng = random.Random(seed)
+    for index in range(count):
+        category = SLOTS[index % len(SLOTS)]
+        price = round(MEDIANS[category] * rng.lognormvariate(0, 0.9))
+        yield (
+            rng.choice(BRANDS),
+            f"Synthetic {category} {index}",
+            category,
+            max(price, 10),
+            f"https://example.com/p/{index}",
+            f"https://example.com/i/{index}.jpg",
+            rng.sample(STYLES, rng.randint(2, 3)),
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="generated rows to add to the real catalogs")
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    def rows():
+        for path in DEFAULT_FALLBACK_CATALOGS:
+            if path.is_file():
+                yield from (read_pack_table(path) if path.suffix == ".csv" else read_end_catalog(path))
+        yield from synthetic_rows(args.synthetic, args.seed)
+
+    # Rows are materialized first, so the build time below excludes file parsing.
+    parse_started = time.perf_counter()
+    materialized = list(rows())
+    parse_seconds = time.perf_counter() - parse_started
+
+    builds = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        index = CatalogIndex.build(materialized)
+        builds.append(time.perf_counter() - started)
+    print(f"items={len(index)} parse {parse_seconds * 1000:.1f} ms, index build best {min(builds) * 1000:.1f} ms")
+
+    modes = [("cheaper", False, None, None), ("premium", False, None, None), ("premium", True, None, None)]
+    modes.append(("custom", False, 300, 900))
+    requests = [
+        OutfitRequestState(style=style, budget_mode=mode, luxury_only=luxury, budget_min=low, budget_max=high)
+        for style, (mode, luxury, low, high) in itertools.product(STYLES, modes)
+    ]
+    rng = random.Random(args.seed)
+    latencies = []
+    in_budget = 0
+    for req in itertools.islice(itertools.cycle(requests), args.queries):
+        started = time.perf_counter()
+        outfit = index.compose(req, rng)
+        latencies.append(time.perf_counter() - started)
+        if outfit is not None:
+            low, high = (int(part) for part in outfit["budget_range"].replace("$", "").split("-"))
+            in_budget += low <= outfit["total_price"] <= high
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(
+        f"queries={len(latencies)} mean {statistics.fmean(latencies) * 1e6:.1f} us, "
+        f"p50 {latencies[len(latencies) // 2] * 1e6:.1f} us, p99 {p99 * 1e6:.1f} us, "
+        f"total within budget {in_budget / len(latencies):.0%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Album pre-validation cost and what it saves, against a local fake image origin.
+
+Builds outfits whose photos are backend proxy URLs (as /outfits/generate returns
+them) over origins served by a local aiohttp app: most answer HEAD with an image,
+some are dead (404), hang past the probe timeout, refuse HEAD (405, probed with a
+ranged GET) or are too large for Telegram's 5 MB URL limit. Reports the probe
+latency per outfit with a cold and a warm cache, how many probes the negative
+cache skipped, and how many media groups would have gone out with a dead URL
+(each of those used to cost three failed sendMediaGroup attempts, 1.2 s of sleeps
+and a single-photo fallback).
+
+Usage: python telegram-bot/benchmarks/bench_image_check.py [--outfits 200] [--dead 0.05] [--slow 0.01]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from collage import LocalImageIndex  # noqa: E402
+from fakes import start_app  # noqa: E402
+from image_check import PHOTO_URL_MAX_BYTES, ImageChecker  # noqa: E402
+from outfit_view import OutfitView  # noqa: E402
+
+SLOTS = ("top", "bottom", "outerwear", "shoes")
+PORT = 18093
+
+
+async def origin(request: web.Request) -> web.Response:
+    kind = request.match_info["kind"]
+    if kind == "dead":
+        return web.Response(status=404)
+    if kind == "slow":
+        await asyncio.sleep(5)
+    if kind == "nohead" and request.method == "HEAD":
+        return web.Response(status=405)
+    size = PHOTO_URL_MAX_BYTES * 2 if kind == "big" else 180_000
+    if "Range" in request.headers:
+        headers = {"Content-Type": "image/jpeg", "Content-Range": f"bytes 0-0/{size}"}
+        return web.Response(status=206, body=b"\xff", headers=headers)
+    return web.Response(headers={"Content-Type": "image/jpeg", "Content-Length": str(size)})
+
+
+def proxy(url: str, variant: str) -> str:
+    return f"https://api.example.com/api/media/proxy?url={quote(url, safe='')}&variant={variant}&exp=1&sig=0"
+
+
+def build_outfits(args: argparse.Namespace) -> list[OutfitView]:
+    rng = random.Random(args.seed)
+    kinds = []
+    for _ in range(args.pool):
+        roll = rng.random()
+        kind = "ok"
+        for name, share in (("dead", args.dead), ("slow", args.slow), ("nohead", args.nohead), ("big", args.big)):
+            if roll < share:
+                kind = name
+                break
+            roll -= share
+        kinds.append(kind)
+    outfits = []
+    for _ in range(args.outfits):
+        payload = {}
+        for slot in (*SLOTS, "accessory"):
+            index = rng.randrange(args.pool)
+            base = f"http://127.0.0.1:{PORT}/{kinds[index]}/{index}"
+            high_res = f"{base}-high.jpg"
+            # Oversized items only have their high_res rendition over the limit.
+            medium = f"http://127.0.0.1:{PORT}/ok/{index}-medium.jpg" if kinds[index] == "big" else f"{base}-medium.jpg"
+            piece = {
+                "brand": "Brand",
+                "item": f"{slot} {index}",
+                "price": 100,
+                "image": {"high_res": proxy(high_res, "high_res"), "medium": proxy(medium, "medium")},
+            }
+            if slot == "accessory":
+                payload["accessories"] = [piece]
+            else:
+                payload[slot] = piece
+        outfits.append(OutfitView.from_payload(payload))
+    return outfits
+
+
+async def run(args: argparse.Namespace) -> None:
+    app = web.Application()
+    app.router.add_route("*", "/{kind}/{name}", origin)
+    runner = await start_app(app, "127.0.0.1", PORT)
+    outfits = build_outfits(args)
+    with tempfile.TemporaryDirectory() as empty_dir:
+        checker = ImageChecker(
+            local_images=LocalImageIndex(empty_dir),
+            timeout_seconds=args.timeout,
+            bad_ttl_seconds=600,
+        )
+        try:
+            for label in ("cold", "warm"):
+                probes_before = checker.probes
+                latencies = []
+                for outfit in outfits:
+                    pieces = [piece for piece in outfit.main_pieces + outfit.accessories if piece.image_url]
+                    started = time.perf_counter()
+                    await checker.choose(pieces)
+                    latencies.append(time.perf_counter() - started)
+                latencies.sort()
+                print(
+                    f"{label}: {len(outfits)} outfits, {checker.probes - probes_before} probes, "
+                    f"mean {statistics.fmean(latencies) * 1000:.1f} ms, "
+                    f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms"
+                )
+            # Without the check the album carries the high_res URL of every piece as is.
+            unusable = ("%2Fdead%2F", "%2Fslow%2F", "%2Fbig%2F")
+            failing = sum(
+                any(kind in (piece.image_url or "") for piece in outfit.pieces for kind in unusable)
+                for outfit in outfits
+            )
+            print(f"media groups that would have carried a dead, hanging or oversized URL: {failing}/{len(outfits)}")
+            print("checker:", checker.stats())
+        finally:
+            await checker.close()
+            await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outfits", type=int, default=200)
+    parser.add_argument("--pool", type=int, default=400, help="distinct product images the outfits draw from")
+    parser.add_argument("--dead", type=float, default=0.05)
+    parser.add_argument("--slow", type=float, default=0.01)
+    parser.add_argument("--nohead", type=float, default=0.1)
+    parser.add_argument("--big", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=1.5)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
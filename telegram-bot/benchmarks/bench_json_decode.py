@@ -0,0 +1,72 @@
+"""Decode cost per outfit response: the old text()+json() path against a single decode of the bytes.
+
+The old BackendClient._request called response.text() and then response.json(),
+so every body was decoded to str twice and parsed once. The current path parses
+the raw bytes once, with orjson when it is installed.
+
+Usage: python telegram-bot/benchmarks/bench_json_decode.py [--outfits 500] [--repeat 20]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import json_codec  # noqa: E402
+from fakes import FakeBackend  # noqa: E402
+
+
+def old_path(body: bytes) -> Any:
+    text = body.decode("utf-8")  # response.text()
+    if not text:
+        return {}
+    return json.loads(body.decode("utf-8"))  # response.json() decodes the cached bytes again
+
+
+def stdlib_once(body: bytes) -> Any:
+    return json.loads(body)
+
+
+def measure(decode: Callable[[bytes], Any], bodies: list[bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for body in bodies:
+            decode(body)
+        best = min(best, time.perf_counter() - started)
+    return best / len(bodies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outfits", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    backend = FakeBackend(seed=5)
+    bodies = [json.dumps(backend.outfit({"style": "streetwear"})).encode() for _ in range(args.outfits)]
+    average_size = sum(len(body) for body in bodies) / len(bodies)
+
+    variants: list[tuple[str, Callable[[bytes], Any]]] = [
+        ("text()+json() (old)", old_path),
+        ("json.loads(bytes)", stdlib_once),
+    ]
+    if json_codec.orjson is not None:
+        variants.append(("orjson.loads(bytes)", json_codec.orjson.loads))
+
+    print(f"outfits={args.outfits} avg body {average_size / 1024:.1f} KiB, json_codec backend: {json_codec.JSON_BACKEND}")
+    baseline = None
+    for name, decode in variants:
+        seconds = measure(decode, bodies, args.repeat)
+        baseline = baseline or seconds
+        print(f"{name:<24}{seconds * 1e6:>10.1f} us/outfit{baseline / seconds:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
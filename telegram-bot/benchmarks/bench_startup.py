@@ -0,0 +1,176 @@
+"""Restart cost of bot.py in webhook mode, with and without the chat state snapshot.
+
+Starts fakes.py, then the bot; every chat sends /start and /setstyle. The bot is
+stopped with SIGTERM (which writes the snapshot when one is configured) and
+started again, and every chat sends /state at once. Reported per run: spawn to
+/healthz, time to the first and to the last reply after the restart, and how
+many backend logins the restart cost. Without a snapshot every returning chat
+logs in again and has lost its settings.
+
+Usage: python telegram-bot/benchmarks/bench_startup.py [--chats 500] [--latency-ms 20]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_supervisor import free_port, wait_http  # noqa: E402
+from loadtest import message_update  # noqa: E402
+
+BOT_DIR = Path(__file__).resolve().parents[1]
+SECRET = "bench-secret"
+LOGIN = "/auth/telegram/login"
+
+
+async def counts(session: aiohttp.ClientSession, url: str) -> dict[str, int]:
+    async with session.get(f"{url}/calls") as response:
+        return await response.json()
+
+
+async def run_once(args: argparse.Namespace, snapshot: bool, telegram_url: str, backend_url: str) -> None:
+    webhook_port = free_port()
+    with tempfile.TemporaryDirectory(prefix="gothyxan-bench-startup-") as cache_dir:
+        env = {
+            **os.environ,
+            "TELEGRAM_BOT_TOKEN": "123456:bench",
+            "TELEGRAM_API_URL": telegram_url,
+            "TELEGRAM_BACKEND_URL": backend_url,
+            "TELEGRAM_BOT_MODE": "webhook",
+            "TELEGRAM_WEBHOOK_SECRET": SECRET,
+            "TELEGRAM_WEBHOOK_HOST": "127.0.0.1",
+            "TELEGRAM_WEBHOOK_PORT": str(webhook_port),
+            "TELEGRAM_WEBHOOK_URL": "",
+            "TELEGRAM_WORKERS": "1",
+            "TELEGRAM_METRICS_PORT": "0",
+            "TELEGRAM_STATE_BACKEND": "memory",
+            "TELEGRAM_STATE_SNAPSHOT_PATH": str(Path(cache_dir) / "state.snapshot") if snapshot else "",
+            "TELEGRAM_INLINE_ENABLED": "false",
+            "TELEGRAM_SEND_GLOBAL_RATE": "100000",
+            "TELEGRAM_SEND_CHAT_RATE": "100000",
+            "TELEGRAM_FILE_ID_CACHE_PATH": str(Path(cache_dir) / "file-ids.sqlite3"),
+            "TELEGRAM_COLLAGE_CACHE_DIR": str(Path(cache_dir) / "collages"),
+            "TELEGRAM_WRITE_QUEUE_PATH": str(Path(cache_dir) / "write-queue.sqlite3"),
+        }
+        base = f"http://127.0.0.1:{webhook_port}"
+        chat_ids = [300_000 + index for index in range(args.chats)]
+        update_ids = iter(range(1, 10**9))
+
+        async with aiohttp.ClientSession() as session:
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def post(chat_id: int, text: str) -> None:
+                async with semaphore:
+                    async with session.post(
+                        f"{base}/telegram/webhook",
+                        json=message_update(next(update_ids), chat_id, text),
+                        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                    ) as response:
+                        response.raise_for_status()
+
+            async def sent() -> int:
+                return (await counts(session, telegram_url)).get("sendMessage", 0)
+
+            async def wait_replies(target: int, started: float) -> tuple[float, float]:
+                first = None
+                while True:
+                    total = await sent()
+                    now = time.perf_counter()
+                    if first is None and total > target - len(chat_ids):
+                        first = now - started
+                    if total >= target:
+                        return first, now - started
+                    await asyncio.sleep(0.01)
+
+            async def start_bot() -> tuple[subprocess.Popen[bytes], float]:
+                spawned = time.perf_counter()
+                process = subprocess.Popen(
+                    [sys.executable, str(BOT_DIR / "bot.py")],
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                    stderr=None if args.verbose else subprocess.DEVNULL,
+                )
+                await wait_http(session, f"{base}/healthz")
+                return process, time.perf_counter() - spawned
+
+            process, _ = await start_bot()
+            try:
+                before = await sent()
+                await asyncio.gather(*(post(chat_id, "/start") for chat_id in chat_ids))
+                await asyncio.gather(*(post(chat_id, "/setstyle old money") for chat_id in chat_ids))
+                await wait_replies(before + 2 * len(chat_ids), time.perf_counter())
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+            process, ready = await start_bot()
+            try:
+                before = await sent()
+                logins_before = (await counts(session, backend_url)).get(LOGIN, 0)
+                started = time.perf_counter()
+                await asyncio.gather(*(post(chat_id, "/state") for chat_id in chat_ids))
+                first, last = await wait_replies(before + len(chat_ids), started)
+                logins = (await counts(session, backend_url)).get(LOGIN, 0) - logins_before
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+        print(
+            f"snapshot={'on ' if snapshot else 'off'} chats={args.chats}  spawn->healthz {ready:.2f}s"
+            f"  first reply {first * 1000:.0f} ms  all replies {last * 1000:.0f} ms  backend logins {logins}"
+        )
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    telegram_port, backend_port = free_port(), free_port()
+    fakes = subprocess.Popen(
+        [
+            sys.executable,
+            str(BOT_DIR / "benchmarks" / "fakes.py"),
+            "--telegram-port",
+            str(telegram_port),
+            "--backend-port",
+            str(backend_port),
+            "--telegram-latency-ms",
+            str(args.latency_ms),
+            "--backend-latency-ms",
+            str(args.latency_ms),
+            "--jitter-ms",
+            "0",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    telegram_url = f"http://127.0.0.1:{telegram_port}"
+    backend_url = f"http://127.0.0.1:{backend_port}"
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_http(session, f"{telegram_url}/calls")
+            await wait_http(session, f"{backend_url}/calls")
+        for snapshot in (False, True):
+            await run_once(args, snapshot, telegram_url, backend_url)
+    finally:
+        fakes.terminate()
+        fakes.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64, help="webhook requests in flight")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake Bot API and backend latency")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log output")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
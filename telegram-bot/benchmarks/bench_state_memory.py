@@ -0,0 +1,134 @@
+"""Resident memory of the in-memory chat state, before and after the compact OutfitView.
+
+"before" is the previous layout: plain dataclasses holding the whole backend
+response dict in ChatState.last_outfit. "after" is the current state.ChatState
+with slots and OutfitView. Each variant runs in a fresh interpreter.
+
+Usage: python telegram-bot/benchmarks/bench_state_memory.py [--chats 20000]
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+@dataclass
+class LegacySession:
+    access_token: str
+    refresh_token: str
+    token_type: str
+    expires_at: float | None = None
+
+
+@dataclass
+class LegacyRequest:
+    style: str = "streetwear"
+    occasion: str | None = None
+    city: str | None = None
+    budget_mode: str = "cheaper"
+    budget_min: int | None = None
+    budget_max: int | None = None
+    luxury_only: bool = False
+
+
+@dataclass
+class LegacyChatState:
+    backend_session: LegacySession
+    last_request: LegacyRequest = field(default_factory=LegacyRequest)
+    last_outfit: dict[str, Any] | None = None
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm", encoding="ascii") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def token(chat_id: int, kind: str) -> str:
+    # Roughly the length of the backend's JWTs.
+    return f"eyJhbGciOiJIUzI1NiJ9.{kind}{chat_id:012d}{'x' * 180}.{'s' * 43}"
+
+
+def run_worker(variant: str, chats: int) -> dict[str, float]:
+    from fakes import FakeBackend
+
+    from api_client import BackendSession
+    from outfit_view import OutfitView
+    from state import ChatState, OutfitRequestState
+
+    backend = FakeBackend(seed=11)
+    # Responses arrive as JSON, so every chat owns freshly parsed strings, as in production.
+    payloads = [json.dumps(backend.outfit({"style": "streetwear"})) for _ in range(256)]
+    gc.collect()
+    tracemalloc.start()
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+
+    states: list[Any] = []
+    for chat_id in range(chats):
+        outfit = json.loads(payloads[chat_id % len(payloads)])
+        if variant == "before":
+            session = LegacySession(token(chat_id, "a"), token(chat_id, "r"), "Bearer", time.time() + 900)
+            states.append(LegacyChatState(session, LegacyRequest(), outfit))
+        else:
+            session = BackendSession(token(chat_id, "a"), token(chat_id, "r"), "Bearer", time.time() + 900)
+            states.append(ChatState(session, OutfitRequestState(), OutfitView.from_payload(outfit)))
+
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    rss_after = rss_bytes()
+    return {
+        "chats": chats,
+        "traced_bytes": traced,
+        "rss_bytes": rss_after - rss_before,
+        "build_seconds": elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=20_000, help="chats to build; results are scaled to 100k")
+    parser.add_argument("--worker", choices=("before", "after"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.chats)))
+        return
+
+    results: dict[str, dict[str, float]] = {}
+    for variant in ("before", "after"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", variant, "--chats", str(args.chats)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results[variant] = json.loads(output.strip().splitlines()[-1])
+
+    scale = 100_000 / args.chats
+    print(f"chats={args.chats} (figures scaled to 100k chats)")
+    print(f"{'variant':<10}{'heap MiB':>12}{'rss MiB':>12}{'bytes/chat':>12}{'build s':>10}")
+    for variant, result in results.items():
+        print(
+            f"{variant:<10}{result['traced_bytes'] * scale / 2**20:>12.1f}{result['rss_bytes'] * scale / 2**20:>12.1f}"
+            f"{result['traced_bytes'] / args.chats:>12.0f}{result['build_seconds']:>10.2f}"
+        )
+    ratio = results["after"]["traced_bytes"] / results["before"]["traced_bytes"]
+    print(f"after/before heap: {ratio:.2f}")
+
+
+if __name__ == "__main__":
+    main()
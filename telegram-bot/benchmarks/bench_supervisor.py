@@ -0,0 +1,202 @@
+"""Webhook throughput of supervisor.py with one process against N sharded worker processes.
+
+Starts fakes.py and supervisor.py as subprocesses, posts a fixed script per
+chat to the webhook (/start, alternating /setstyle and /state, one /generate;
+nothing the chat queue would debounce, so every run does the same work), and
+waits until the fake Bot API goes quiet. TELEGRAM_WORKERS=1 is the plain single-process bot. For N > 1 the
+per-worker load gauges from the supervisor's /metrics are printed as well.
+Scaling needs free cores; on a single core the extra hop shows up as overhead.
+
+Usage: python telegram-bot/benchmarks/bench_supervisor.py [--workers 1,2,4] [--chats 200] [--updates-per-chat 6]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest import STYLE_TEXTS, message_update  # noqa: E402
+from supervisor import STATS_INTERVAL_SECONDS  # noqa: E402
+
+BOT_DIR = Path(__file__).resolve().parents[1]
+SECRET = "bench-secret"
+WORKER_GAUGE = re.compile(r"^gothyxan_bot_(worker_\d+)_(handled|cpu_seconds|restarts) (\S+)$")
+
+
+def chat_script(updates: int) -> list[str]:
+    middle = [
+        f"/setstyle {STYLE_TEXTS[index % len(STYLE_TEXTS)]}" if index % 2 == 0 else "/state"
+        for index in range(updates)
+    ]
+    return ["/start", *middle, "/generate"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_http(session: aiohttp.ClientSession, url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def telegram_calls(session: aiohttp.ClientSession, telegram_url: str) -> int:
+    async with session.get(f"{telegram_url}/calls") as response:
+        return sum((await response.json()).values())
+
+
+async def run_once(args: argparse.Namespace, workers: int, telegram_url: str, backend_url: str) -> None:
+    webhook_port = free_port()
+    metrics_port = free_port()
+    with tempfile.TemporaryDirectory(prefix="gothyxan-bench-supervisor-") as cache_dir:
+        env = {
+            **os.environ,
+            "TELEGRAM_BOT_TOKEN": "123456:bench",
+            "TELEGRAM_API_URL": telegram_url,
+            "TELEGRAM_BACKEND_URL": backend_url,
+            "TELEGRAM_BOT_MODE": "webhook",
+            "TELEGRAM_WEBHOOK_SECRET": SECRET,
+            "TELEGRAM_WEBHOOK_HOST": "127.0.0.1",
+            "TELEGRAM_WEBHOOK_PORT": str(webhook_port),
+            "TELEGRAM_WEBHOOK_URL": "",
+            "TELEGRAM_WORKERS": str(workers),
+            "TELEGRAM_METRICS_HOST": "127.0.0.1",
+            "TELEGRAM_METRICS_PORT": str(metrics_port),
+            "TELEGRAM_STATE_BACKEND": "memory",
+            "TELEGRAM_STATE_SNAPSHOT_PATH": "",
+            "TELEGRAM_SEND_GLOBAL_RATE": "100000",
+            "TELEGRAM_SEND_CHAT_RATE": "100000",
+            "TELEGRAM_FILE_ID_CACHE_PATH": str(Path(cache_dir) / "file-ids.sqlite3"),
+            "TELEGRAM_COLLAGE_CACHE_DIR": str(Path(cache_dir) / "collages"),
+        }
+        process = subprocess.Popen(
+            [sys.executable, str(BOT_DIR / "supervisor.py")],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=None if args.verbose else subprocess.DEVNULL,
+        )
+        try:
+            async with aiohttp.ClientSession() as session:
+                base = f"http://127.0.0.1:{webhook_port}"
+                await wait_http(session, f"{base}/healthz")
+                before = await telegram_calls(session, telegram_url)
+                semaphore = asyncio.Semaphore(args.concurrency)
+                update_ids = iter(range(1, 10**9))
+
+                async def post(update: dict) -> None:
+                    async with semaphore:
+                        async with session.post(
+                            f"{base}/telegram/webhook",
+                            json=update,
+                            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                        ) as response:
+                            response.raise_for_status()
+
+                async def run_chat(chat_id: int) -> None:
+                    # Each chat's updates are posted one after another, as Telegram delivers them.
+                    for text in chat_script(args.updates_per_chat):
+                        await post(message_update(next(update_ids), chat_id, text))
+
+                started = time.perf_counter()
+                await asyncio.gather(*(run_chat(200_000 + index) for index in range(args.chats)))
+                posted = time.perf_counter() - started
+
+                # Done once the fake Bot API has seen no call for --quiet-seconds.
+                last_total, last_change = before, time.perf_counter()
+                while time.perf_counter() - last_change < args.quiet_seconds:
+                    await asyncio.sleep(0.05)
+                    total = await telegram_calls(session, telegram_url)
+                    if total != last_total:
+                        last_total, last_change = total, time.perf_counter()
+                elapsed = last_change - started
+
+                updates = args.chats * len(chat_script(args.updates_per_chat))
+                print(
+                    f"workers={workers:<3} updates={updates} bot_api_calls={last_total - before}"
+                    f"  posted in {posted:.2f}s  done in {elapsed:.2f}s  {updates / elapsed:.1f} updates/s"
+                )
+                if workers > 1:
+                    # Worker gauges come from the supervisor's periodic stats poll.
+                    await asyncio.sleep(STATS_INTERVAL_SECONDS + 0.5)
+                    async with session.get(f"http://127.0.0.1:{metrics_port}/metrics") as response:
+                        text = await response.text()
+                    gauges: dict[str, dict[str, str]] = {}
+                    for line in text.splitlines():
+                        match = WORKER_GAUGE.match(line)
+                        if match:
+                            gauges.setdefault(match[1], {})[match[2]] = match[3]
+                    for name, values in sorted(gauges.items()):
+                        print(f"  {name}: " + " ".join(f"{key}={value}" for key, value in sorted(values.items())))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    telegram_port, backend_port = free_port(), free_port()
+    fakes = subprocess.Popen(
+        [
+            sys.executable,
+            str(BOT_DIR / "benchmarks" / "fakes.py"),
+            "--telegram-port",
+            str(telegram_port),
+            "--backend-port",
+            str(backend_port),
+            "--telegram-latency-ms",
+            str(args.latency_ms),
+            "--backend-latency-ms",
+            str(args.latency_ms),
+            "--jitter-ms",
+            "0",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    telegram_url = f"http://127.0.0.1:{telegram_port}"
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_http(session, f"{telegram_url}/calls")
+        for workers in args.workers:
+            await run_once(args, workers, telegram_url, f"http://127.0.0.1:{backend_port}")
+    finally:
+        fakes.terminate()
+        fakes.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts to compare")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--updates-per-chat", type=int, default=6, help="commands between /start and /generate")
+    parser.add_argument("--concurrency", type=int, default=64, help="webhook requests in flight")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake Bot API and backend latency")
+    parser.add_argument("--quiet-seconds", type=float, default=1.0)
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log output")
+    args = parser.parse_args()
+    args.workers = [int(value) for value in args.workers.split(",")]
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
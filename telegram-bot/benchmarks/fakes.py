@@ -0,0 +1,305 @@
+"""Local stand-ins for the Telegram Bot API and the NestJS /api backend.
+
+Point the bot at them with TELEGRAM_API_URL and TELEGRAM_BACKEND_URL. Both
+servers add configurable latency and can fail a share of requests, so the
+load-test driver (loadtest.py) can exercise retries and fallbacks offline.
+
+Usage: python telegram-bot/benchmarks/fakes.py [--telegram-port 8081] [--backend-port 8082]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+from urllib.parse import quote
+
+from aiohttp import web
+
+CATALOG_PATH = Path(__file__).resolve().parents[2] / "data" / "end" / "launches-catalog.json"
+OUTFIT_SLOTS = ("top", "bottom", "outerwear", "shoes")
+FEATURED_STYLES = ("gorpcore", "minimal", "old money", "quiet luxury", "streetwear", "techwear", "workwear", "y2k")
+SCORE_KEYS = (
+    "top_bottom_ratio",
+    "color_harmony",
+    "trend_influence",
+    "visual_coherence",
+    "image_harmony",
+    "aesthetic_density",
+    "minimalist_maximalist_fit",
+    "conversion_likelihood",
+    "margin_score",
+    "budget_efficiency",
+    "style_coherence",
+    "weather_compatibility",
+    "brand_prestige",
+    "personalization_confidence",
+    "overall",
+)
+
+
+@dataclass
+class FaultProfile:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    async def apply(self, rng: random.Random) -> bool:
+        # Returns True when this request should fail.
+        delay = self.latency_ms + rng.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        return rng.random() < self.error_rate
+
+
+@dataclass
+class FakeTelegramAPI:
+    profile: FaultProfile = field(default_factory=FaultProfile)
+    flood_rate: float = 0.0
+    seed: int = 1
+    calls: Counter[str] = field(default_factory=Counter)
+    # New messages that appeared in chats, and chat-bound calls weighted the way Telegram's
+    # flood limits count them; a media group counts each photo in both.
+    messages_created: int = 0
+    flood_weight: int = 0
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.seed)
+        self._message_ids = itertools.count(1)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/calls", self.on_calls)
+        return app
+
+    async def on_calls(self, _request: web.Request) -> web.Response:
+        # Lets drivers in another process see how far the bot has got.
+        return web.json_response(dict(self.calls))
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        data = await self._read_params(request)
+        if await self.profile.apply(self._rng):
+            return web.json_response(
+                {"ok": False, "error_code": 500, "description": "Internal Server Error: fake failure"},
+                status=500,
+            )
+        if self.flood_rate and self._rng.random() < self.flood_rate:
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+                status=429,
+            )
+        return web.json_response({"ok": True, "result": self._result(method, data)})
+
+    @staticmethod
+    async def _read_params(request: web.Request) -> dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        return {key: value for key, value in form.items() if isinstance(value, str)}
+
+    def _message(self, data: dict[str, Any], photo: bool = False) -> dict[str, Any]:
+        chat_id = int(data.get("chat_id") or 0)
+        message_id = next(self._message_ids)
+        message: dict[str, Any] = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+        }
+        if photo:
+            message["photo"] = [
+                {"file_id": f"fake-file-{message_id}", "file_unique_id": f"u{message_id}", "width": 640, "height": 640}
+            ]
+        else:
+            message["text"] = str(data.get("text") or "")
+        return message
+
+    def _result(self, method: str, data: dict[str, Any]) -> Any:
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bot", "username": "fake_bot"}
+        if method == "sendMediaGroup":
+            media = data.get("media") or "[]"
+            count = len(json.loads(media) if isinstance(media, str) else media)
+            self.messages_created += count
+            self.flood_weight += count
+            return [self._message(data, photo=True) for _ in range(count)]
+        if method not in {"answerCallbackQuery", "answerInlineQuery"}:
+            self.flood_weight += 1
+        if method in {"sendPhoto", "sendMessage"}:
+            self.messages_created += 1
+        if method in {"sendPhoto", "editMessageMedia"}:
+            return self._message(data, photo=True)
+        if method in {"sendMessage", "editMessageText", "editMessageCaption"}:
+            return self._message(data)
+        return True
+
+
+def load_catalog() -> list[dict[str, Any]]:
+    try:
+        return json.loads(CATALOG_PATH.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return [
+            {"brand": "Brand", "category": slot, "title": f"{slot} item", "price": 100, "imageUrl": None}
+            for slot in (*OUTFIT_SLOTS, "accessory")
+        ]
+
+
+def _token(ttl_seconds: int) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": int(time.time()) + ttl_seconds}).encode())
+    return f"fake.{payload.decode().rstrip('=')}.sig"
+
+
+@dataclass
+class FakeBackend:
+    profiles: dict[str, FaultProfile] = field(default_factory=dict)
+    token_ttl_seconds: int = 900
+    seed: int = 2
+    calls: Counter[str] = field(default_factory=Counter)
+    errors: Counter[str] = field(default_factory=Counter)
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.seed)
+        self._by_category: dict[str, list[dict[str, Any]]] = {}
+        for item in load_catalog():
+            self._by_category.setdefault(item["category"], []).append(item)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/api/{path:.*}", self.handle)
+        app.router.add_get("/calls", self.on_calls)
+        return app
+
+    async def on_calls(self, _request: web.Request) -> web.Response:
+        return web.json_response(dict(self.calls))
+
+    async def handle(self, request: web.Request) -> web.Response:
+        path = "/" + request.match_info["path"]
+        self.calls[path] += 1
+        body = await request.json() if request.can_read_body else {}
+        profile = self.profiles.get(path) or self.profiles.get("*") or FaultProfile()
+        if await profile.apply(self._rng):
+            self.errors[path] += 1
+            return web.json_response({"statusCode": 503, "message": "fake failure"}, status=503)
+        if path in {"/auth/telegram/login", "/auth/refresh"}:
+            return web.json_response(
+                {"accessToken": _token(self.token_ttl_seconds), "refreshToken": _token(86_400), "tokenType": "Bearer"}
+            )
+        if path == "/outfits/generate":
+            return web.json_response(self.outfit(body))
+        if path == "/brands/featured-styles":
+            return web.json_response(
+                [{"id": f"style-{index}", "name": name, "isFeatured": True} for index, name in enumerate(FEATURED_STYLES)]
+            )
+        if path == "/monetization/subscription":
+            # Unlimited, so load tests exercise prefetch of both variants.
+            return web.json_response(
+                {"tier": "PREMIUM", "unlimitedGenerations": True, "luxuryOnlyEnabled": True, "generationsToday": 0}
+            )
+        if path == "/outfits/batch":
+            return web.json_response({"saved": len(body.get("saves") or []), "feedback": len(body.get("feedback") or [])})
+        return web.json_response({"ok": True})
+
+    def _media(self, source: str, variant: str) -> str:
+        # Same shape as the backend media proxy URLs (signed, expiring).
+        query = f"url={quote(source, safe='')}&variant={variant}&exp={int(time.time()) + 3600}"
+        return f"https://api.example.com/api/media/proxy?{query}&sig={self._rng.getrandbits(128):032x}"
+
+    def _piece(self, category: str) -> dict[str, Any]:
+        items = self._by_category.get(category) or [{"brand": "Brand", "title": category, "price": 100}]
+        item = self._rng.choice(items)
+        source = item.get("imageUrl") or f"https://images.example.com/{category}.jpg"
+        product_url = item.get("productUrl") or "https://shop.example.com"
+        return {
+            "brand": item["brand"],
+            "item": item["title"],
+            "category": category,
+            "price": item.get("price") or 0,
+            "tier": self._rng.randint(1, 4),
+            "reference_link": product_url,
+            "affiliate_link": f"{product_url}?ref=gothyxan",
+            "image": {
+                "thumbnail": self._media(source, "thumbnail"),
+                "medium": self._media(source, "medium"),
+                "high_res": self._media(source, "high_res"),
+                "source": "validated",
+                "validated": True,
+            },
+            "image_url": self._media(source, "medium"),
+            "styleTags": list(item.get("styleTags") or ["streetwear"]),
+        }
+
+    def outfit(self, request: dict[str, Any]) -> dict[str, Any]:
+        # Mirrors OutfitResult in backend/src/ai/types/outfit.types.ts.
+        outfit: dict[str, Any] = {slot: self._piece(slot) for slot in OUTFIT_SLOTS}
+        outfit["accessories"] = [self._piece("accessory") for _ in range(self._rng.randint(1, 3))]
+        pieces = [outfit[slot] for slot in OUTFIT_SLOTS] + outfit["accessories"]
+        outfit.update(
+            style=request.get("style") or "streetwear",
+            weather_context="Mild, 18C, light wind",
+            budget_range=request.get("budgetMode") or "cheaper",
+            total_price=sum(piece["price"] for piece in pieces),
+            explanation=(
+                "Balanced silhouette: a relaxed top over a tapered bottom, grounded by chunky shoes. "
+                "The outer layer covers the forecast and the accessory adds one statement accent."
+            ),
+            scores={key: self._rng.randint(50, 100) for key in SCORE_KEYS},
+        )
+        return outfit
+
+
+async def start_app(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner
+
+
+async def serve(args: argparse.Namespace) -> None:
+    telegram = FakeTelegramAPI(FaultProfile(args.telegram_latency_ms, args.jitter_ms, args.telegram_error_rate))
+    backend = FakeBackend({"*": FaultProfile(args.backend_latency_ms, args.jitter_ms, args.backend_error_rate)})
+    runners = [
+        await start_app(telegram.app(), args.host, args.telegram_port),
+        await start_app(backend.app(), args.host, args.backend_port),
+    ]
+    print(f"Fake Bot API:  TELEGRAM_API_URL=http://{args.host}:{args.telegram_port}")
+    print(f"Fake backend:  TELEGRAM_BACKEND_URL=http://{args.host}:{args.backend_port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--telegram-port", type=int, default=8081)
+    parser.add_argument("--backend-port", type=int, default=8082)
+    parser.add_argument("--telegram-latency-ms", type=float, default=30)
+    parser.add_argument("--backend-latency-ms", type=float, default=400)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--backend-error-rate", type=float, default=0.0)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
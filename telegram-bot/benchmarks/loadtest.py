@@ -0,0 +1,370 @@
+"""Offline load test: the real bot wiring against a fake Bot API and a fake backend.
+
+Replays synthetic update streams through the same Dispatcher that polling and
+webhook mode use, and reports throughput, update latency percentiles and
+memory per chat. Settings can be overridden with --env KEY=VALUE. Telegram's
+send limits are lifted unless --send-limits is given, so latency reflects the
+bot and backend rather than the outbound scheduler.
+
+Scenarios:
+  burst  every chat sends /start and then a burst of /generate
+  taps   /start, /generate, then repeated card buttons (cheaper, luxury, regenerate, save, links, rating)
+  mixed  random commands, style text and button taps with think time
+  inline /start, then inline queries typing style prefixes (inline cache warmed before the run)
+
+Usage: python telegram-bot/benchmarks/loadtest.py [--scenario taps] [--chats 500] [--updates-per-chat 8]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import importlib
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fakes import FakeBackend, FakeTelegramAPI, FaultProfile, start_app  # noqa: E402
+
+BUTTONS = ("budget:cheaper", "budget:premium", "action:regenerate", "action:save", "action:links", "rate:5")
+STYLE_TEXTS = ("techwear", "old money", "minimal", "streetwear", "gorpcore")
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bot"}
+
+
+def message_update(update_id: int, chat_id: int, text: str) -> dict[str, Any]:
+    message: dict[str, Any] = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "user", "username": f"user{chat_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id: int, chat_id: int, data: str, message_id: int = 1) -> dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(chat_id),
+            "from": {"id": chat_id, "is_bot": False, "first_name": "user", "username": f"user{chat_id}"},
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "outfit",
+            },
+        },
+    }
+
+
+def inline_query_update(update_id: int, user_id: int, query: str) -> dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "inline_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "user", "username": f"user{user_id}"},
+            "query": query,
+            "offset": "",
+        },
+    }
+
+
+def chat_script(scenario: str, count: int, rng: random.Random) -> list[tuple[str, str]]:
+    # (kind, payload) where kind is "message", "callback" or "inline".
+    script: list[tuple[str, str]] = [("message", "/start")]
+    if scenario == "burst":
+        script += [("message", "/generate")] * count
+    elif scenario == "taps":
+        script.append(("message", "/generate"))
+        script += [("callback", rng.choice(BUTTONS)) for _ in range(count)]
+    elif scenario == "inline":
+        for _ in range(count):
+            style = rng.choice(STYLE_TEXTS)
+            script.append(("inline", style[: rng.randint(1, len(style))]))
+    else:
+        for _ in range(count):
+            roll = rng.random()
+            if roll < 0.2:
+                script.append(("message", "/generate"))
+            elif roll < 0.3:
+                script.append(("message", f"/setstyle {rng.choice(STYLE_TEXTS)}"))
+            elif roll < 0.45:
+                script.append(("message", rng.choice(STYLE_TEXTS)))
+            else:
+                script.append(("callback", rng.choice(BUTTONS)))
+    return script
+
+
+def update_label(kind: str, payload: str) -> str:
+    if kind == "callback":
+        return payload
+    if kind == "inline":
+        return "inline_query"
+    if payload.startswith("/"):
+        return payload.split()[0]
+    return "text"
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is a high-water mark (KiB on Linux), good enough as a fallback.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def configure_env(args: argparse.Namespace, telegram_url: str, backend_url: str, cache_dir: str) -> None:
+    os.environ.update(
+        {
+            "TELEGRAM_BOT_TOKEN": "123456:load-test",
+            "TELEGRAM_API_URL": telegram_url,
+            "TELEGRAM_BACKEND_URL": backend_url,
+            "TELEGRAM_BOT_MODE": "polling",
+            "TELEGRAM_STATE_BACKEND": "memory",
+            "TELEGRAM_STATE_SNAPSHOT_PATH": "",
+            "TELEGRAM_METRICS_PORT": "0",
+            "TELEGRAM_FILE_ID_CACHE_PATH": str(Path(cache_dir) / "file-ids.sqlite3"),
+            "TELEGRAM_COLLAGE_CACHE_DIR": str(Path(cache_dir) / "collages"),
+            "TELEGRAM_WRITE_QUEUE_PATH": str(Path(cache_dir) / "write-queue.sqlite3"),
+            "TELEGRAM_INLINE_ENABLED": "true" if args.scenario == "inline" else "false",
+        }
+    )
+    if args.scenario == "inline":
+        # The fake backend has no throttle, so warm-up need not wait out the per-user window.
+        os.environ["TELEGRAM_GENERATE_USER_LIMIT"] = "1000"
+    if not args.send_limits:
+        os.environ["TELEGRAM_SEND_GLOBAL_RATE"] = "100000"
+        os.environ["TELEGRAM_SEND_CHAT_RATE"] = "100000"
+    for override in args.env:
+        key, _, value = override.partition("=")
+        os.environ[key.strip()] = value.strip()
+
+
+async def drive(args: argparse.Namespace, bot_module: Any) -> dict[str, Any]:
+    bot = bot_module.build_bot()
+    dispatcher = bot_module.build_dispatcher()
+    rng = random.Random(args.seed)
+    update_ids: Iterator[int] = itertools.count(1)
+    latencies: dict[str, list[float]] = defaultdict(list)
+    failures = 0
+    tasks: set[asyncio.Task[None]] = set()
+
+    async def feed(label: str, update: dict[str, Any]) -> None:
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            await dispatcher.feed_raw_update(bot, update)
+        except Exception:
+            failures += 1
+        latencies[label].append(time.perf_counter() - started)
+
+    async def run_chat(chat_id: int) -> None:
+        if args.ramp_seconds:
+            await asyncio.sleep(rng.uniform(0, args.ramp_seconds))
+        for kind, payload in chat_script(args.scenario, args.updates_per_chat, rng):
+            update_id = next(update_ids)
+            if kind == "message":
+                update = message_update(update_id, chat_id, payload)
+            elif kind == "inline":
+                update = inline_query_update(update_id, chat_id, payload)
+            else:
+                # Buttons are tapped on the newest outfit card, as a user would.
+                state = await bot_module.store.get_chat_state(chat_id)
+                card = state.card if state is not None else None
+                update = callback_update(update_id, chat_id, payload, card.text_message_id if card else 1)
+            # Updates are handled in the background, as webhook mode and polling do.
+            task = asyncio.create_task(feed(update_label(kind, payload), update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if args.think_ms:
+                await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+
+    inline_cache = bot_module.inline_cache
+    if inline_cache is not None:
+        warm_started = time.perf_counter()
+        await inline_cache.refresh()
+        print(f"inline cache warmed in {time.perf_counter() - warm_started:.2f}s: {inline_cache.stats()['outfits']} outfits")
+
+    fallback = bot_module.fallback
+    if fallback is not None:
+        await fallback.load()
+
+    # Loop lag under load shows how much of the latency is the bot's own CPU work.
+    bot_module.loop_monitor.start()
+    gc.collect()
+    rss_before = rss_bytes()
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(run_chat(100_000 + index) for index in range(args.chats)))
+    while tasks:
+        await asyncio.gather(*list(tasks))
+    elapsed = time.perf_counter() - started
+    # Saves and ratings are written behind; wait for them so backend call counts are complete.
+    write_queue = bot_module.write_queue
+    deadline = time.monotonic() + 30
+    while write_queue is not None and write_queue.queued and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+    rss_after = rss_bytes()
+
+    report = {
+        "elapsed_seconds": elapsed,
+        "latencies": latencies,
+        "failures": failures,
+        "rss_per_chat": (rss_after - rss_before) / args.chats,
+        "traced_per_chat": traced / args.chats if traced is not None else None,
+        "components": {
+            "state": await bot_module.store.stats(),
+            "admission": bot_module.admission.stats(),
+            "chat_queue": bot_module.chat_serializer.stats(),
+            "outbound": bot_module.outbound.stats(),
+            "outfit_cache": bot_module.outfit_cache.stats(),
+            "prefetch": bot_module.prefetcher.stats(),
+            "backend_pool": bot_module.backend.pool_stats(),
+            "backend": bot_module.backend.resilience_stats(),
+            "loop": bot_module.loop_monitor.stats(),
+            **({"write_queue": write_queue.stats()} if write_queue is not None else {}),
+            **({"inline": inline_cache.stats()} if inline_cache is not None else {}),
+            **({"fallback": fallback.stats()} if fallback is not None else {}),
+        },
+    }
+    await bot_module.shutdown(bot)
+    return report
+
+
+def print_report(args: argparse.Namespace, report: dict[str, Any], telegram: FakeTelegramAPI, backend: FakeBackend) -> None:
+    latencies: dict[str, list[float]] = report["latencies"]
+    every = [value for values in latencies.values() for value in values]
+    elapsed = report["elapsed_seconds"]
+    print(
+        f"scenario={args.scenario} chats={args.chats} updates={len(every)} failures={report['failures']}"
+        f" send_limits={'on' if args.send_limits else 'off'}"
+    )
+    print(f"elapsed {elapsed:.2f}s  throughput {len(every) / elapsed:.1f} updates/s")
+    print(f"{'update':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, values in sorted(latencies.items()) + [("all", every)]:
+        print(
+            f"{label:<20}{len(values):>8}{percentile(values, 0.5) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}{max(values, default=0) * 1000:>10.1f}"
+        )
+    print(f"memory: rss delta {report['rss_per_chat'] / 1024:.1f} KiB/chat", end="")
+    if report["traced_per_chat"] is not None:
+        print(f", python heap {report['traced_per_chat'] / 1024:.1f} KiB/chat")
+    else:
+        print()
+    print("backend calls:", json.dumps(dict(backend.calls), sort_keys=True))
+    if backend.errors:
+        print("backend injected errors:", json.dumps(dict(backend.errors), sort_keys=True))
+    print("telegram calls:", json.dumps(dict(telegram.calls), sort_keys=True))
+    updates = max(len(every), 1)
+    print(
+        f"telegram per update: {sum(telegram.calls.values()) / updates:.2f} calls, "
+        f"{telegram.flood_weight / updates:.2f} flood-weighted sends, {telegram.messages_created / updates:.2f} new messages"
+    )
+    for name, stats in report["components"].items():
+        print(f"{name}: " + json.dumps({key: round(value, 4) for key, value in stats.items()}, sort_keys=True))
+    if args.json:
+        summary = {
+            "scenario": args.scenario,
+            "chats": args.chats,
+            "updates": len(every),
+            "throughput": len(every) / elapsed,
+            "p50_ms": percentile(every, 0.5) * 1000,
+            "p99_ms": percentile(every, 0.99) * 1000,
+            "rss_per_chat_bytes": report["rss_per_chat"],
+            "traced_per_chat_bytes": report["traced_per_chat"],
+            "per_update": {
+                label: {"p50_ms": percentile(values, 0.5) * 1000, "p99_ms": percentile(values, 0.99) * 1000}
+                for label, values in latencies.items()
+            },
+        }
+        Path(args.json).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    telegram = FakeTelegramAPI(
+        FaultProfile(args.telegram_latency_ms, args.jitter_ms, args.telegram_error_rate),
+        flood_rate=args.flood_rate,
+    )
+    generate_profile = FaultProfile(args.generate_latency_ms, args.jitter_ms, args.backend_error_rate)
+    backend = FakeBackend(
+        {
+            "/outfits/generate": generate_profile,
+            "*": FaultProfile(args.backend_latency_ms, args.jitter_ms, args.backend_error_rate),
+        }
+    )
+    runners = [await start_app(telegram.app(), "127.0.0.1", 0), await start_app(backend.app(), "127.0.0.1", 0)]
+    telegram_port = runners[0].addresses[0][1]
+    backend_port = runners[1].addresses[0][1]
+    try:
+        with tempfile.TemporaryDirectory(prefix="gothyxan-loadtest-") as cache_dir:
+            configure_env(args, f"http://127.0.0.1:{telegram_port}", f"http://127.0.0.1:{backend_port}", cache_dir)
+            # bot.py builds its singletons from the environment at import time.
+            bot_module = importlib.import_module("bot")
+            logging.getLogger().setLevel(args.log_level)
+            report = await drive(args, bot_module)
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+    print_report(args, report, telegram, backend)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=("burst", "taps", "mixed", "inline"), default="taps")
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--updates-per-chat", type=int, default=8)
+    parser.add_argument("--ramp-seconds", type=float, default=2.0)
+    parser.add_argument("--think-ms", type=float, default=300.0, help="mean pause between a chat's updates, 0 for bursts")
+    parser.add_argument("--telegram-latency-ms", type=float, default=20.0)
+    parser.add_argument("--backend-latency-ms", type=float, default=20.0)
+    parser.add_argument("--generate-latency-ms", type=float, default=400.0)
+    parser.add_argument("--jitter-ms", type=float, default=30.0)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--backend-error-rate", type=float, default=0.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of Bot API calls answered with 429")
+    parser.add_argument("--send-limits", action="store_true", help="keep Telegram's per-chat and global send limits")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report Python heap per chat (slower)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="override a bot setting")
+    parser.add_argument("--log-level", default="CRITICAL", help="bot log level during the run (failures are counted anyway)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write a summary to this file for comparing runs")
+    args = parser.parse_args()
+    if args.chats <= 0:
+        parser.error("--chats must be positive")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
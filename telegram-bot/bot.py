@@ -1,18 +1,56 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
 import logging
+import time
+import zlib
 from html import escape
 from typing import Any, Awaitable, Callable
 
 from aiogram import Bot, Dispatcher, F, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import Command, CommandObject
-from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Message
-
-from api_client import BackendClient
+from aiogram.types import (
+    BufferedInputFile,
+    CallbackQuery,
+    FSInputFile,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InlineQueryResultsButton,
+    InputFile,
+    InputMediaPhoto,
+    InputTextMessageContent,
+    LinkPreviewOptions,
+    Message,
+    Update,
+)
+from aiohttp import web
+
+import json_codec
+from api_client import BackendAuthError, BackendClient, StepCallback, TokenManager, generation_payload
+from cache import TTLCache
+from chat_queue import AdmissionController, AdmissionRejected, ChatSerialMiddleware
+from collage import CollageRenderer, CollageSlot, LocalImageIndex
 from config import load_settings
-from state import BotStateStore, ChatState, OutfitRequestState
+from diagnostics import LoopLagMonitor, ProfilerBusy, SamplingProfiler, SlowStepMiddleware, add_profile_route
+from fallback_catalog import FallbackGenerator, is_backend_unavailable
+from image_check import LOCAL_VARIANT, ImageChecker
+from inline_cache import InlineOutfitCache
+from media_cache import FileIdCache, MediaKey, unsigned_url
+from metrics import HandlerMetricsMiddleware, card_updates, media_sends, registry, start_metrics_server
+from outbound import OutboundScheduler
+from outfit_view import OutfitPiece, OutfitView
+from prefetch import Entitlement, PrefetchScheduler, RateWindow
+from resilience import DeadlineMiddleware, detached
+from state import ChatState, OutfitCard, OutfitRequestState, apply_budget_action, build_state_store
+from webhook import run_webhook
+from write_behind import KIND_FEEDBACK, KIND_SAVE, WriteBehindQueue
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -21,7 +59,159 @@ router = Router()
 
 settings = load_settings()
 backend = BackendClient(settings)
-store = BotStateStore()
+tokens = TokenManager(backend)
+store = build_state_store(settings)
+outfit_cache: TTLCache[OutfitView] = TTLCache(
+    max_entries=settings.outfit_cache_size,
+    ttl_seconds=settings.outfit_cache_ttl_seconds,
+)
+file_ids = FileIdCache(settings.file_id_cache_path, max_entries=settings.file_id_cache_size)
+collage = (
+    CollageRenderer(
+        images_dir=settings.pack_images_dir,
+        cache_dir=settings.collage_cache_dir,
+        cache_max_bytes=settings.collage_cache_max_bytes,
+        workers=settings.collage_workers,
+        fetch_timeout_seconds=settings.image_fetch_timeout_seconds,
+    )
+    if settings.collage_enabled
+    else None
+)
+# Album photos are checked before sending: one dead URL fails the whole media group.
+image_checker = (
+    ImageChecker(
+        local_images=collage.local_images if collage is not None else LocalImageIndex(settings.pack_images_dir),
+        timeout_seconds=settings.image_check_timeout_seconds,
+        bad_ttl_seconds=settings.image_bad_ttl_seconds,
+    )
+    if settings.image_check_enabled
+    else None
+)
+generate_window = RateWindow(settings.generate_global_limit, 60)
+prefetcher = PrefetchScheduler(
+    outfit_cache,
+    user_window=RateWindow(settings.generate_user_limit, 60),
+    global_window=generate_window,
+    user_reserve=settings.prefetch_user_reserve,
+    global_reserve=settings.prefetch_global_reserve,
+    quota_reserve=settings.prefetch_quota_reserve,
+)
+admission = AdmissionController(
+    generate_window,
+    max_concurrent=settings.max_concurrent_generations,
+    max_waiting=settings.max_waiting_generations,
+    max_delay_seconds=settings.admission_max_delay_seconds,
+)
+
+outbound = OutboundScheduler(
+    global_rate=settings.send_global_rate,
+    chat_rate=settings.send_chat_rate,
+    chat_burst=settings.send_chat_burst,
+    max_retries=settings.send_max_retries,
+)
+
+
+async def write_behind_token(chat_id: int, telegram_id: str, username: str | None, rejected: str | None) -> str:
+    # Queued writes may be flushed long after the tap, or after a restart, so the token
+    # is looked up (and refreshed if needed) at send time.
+    state = await store.get_chat_state(chat_id)
+    current = state.backend_session if state else None
+    if current is not None and current.access_token == rejected:
+        session = await tokens.refresh(chat_id, current, telegram_id, username)
+    else:
+        session = await tokens.ensure_fresh(chat_id, current, telegram_id=telegram_id, username=username)
+    if state is not None and session is not current:
+        # The chat may have moved on (new card, new outfit) during the refresh: re-read it
+        # and store only the session instead of writing back the stale copy.
+        await store.update_session(chat_id, session)
+    return session.access_token
+
+
+write_queue = (
+    WriteBehindQueue(
+        backend,
+        write_behind_token,
+        path=settings.write_queue_path,
+        max_entries=settings.write_queue_max_entries,
+        max_age_seconds=settings.write_queue_max_age_seconds,
+        flush_interval_seconds=settings.write_queue_flush_interval_seconds,
+        flush_concurrency=settings.write_queue_concurrency,
+    )
+    if settings.write_queue_max_entries > 0
+    else None
+)
+
+# Inline queries are answered from outfits warmed under the bot's own backend account
+# (the bot's user id is the numeric part of its token).
+inline_cache = (
+    InlineOutfitCache(
+        backend,
+        tokens,
+        telegram_id=settings.bot_token.split(":", maxsplit=1)[0],
+        user_window=RateWindow(settings.generate_user_limit, 60),
+        global_window=generate_window,
+        global_reserve=settings.prefetch_global_reserve,
+        max_styles=settings.inline_max_styles,
+        refresh_seconds=settings.inline_refresh_seconds,
+    )
+    if settings.inline_enabled
+    else None
+)
+INLINE_RESULTS_LIMIT = 20
+
+# Degraded mode: outfits from the local catalog when the backend times out or fails.
+fallback = FallbackGenerator(settings.fallback_catalogs) if settings.fallback_enabled else None
+
+loop_monitor = LoopLagMonitor(
+    interval_seconds=settings.loop_lag_interval_seconds,
+    warn_seconds=settings.slow_callback_seconds,
+)
+profiler = SamplingProfiler(
+    max_seconds=settings.profile_max_seconds,
+    interval_seconds=settings.profile_interval_seconds,
+)
+
+registry.add_collector("state", store.stats)
+registry.add_collector("backend_pool", backend.pool_stats)
+registry.add_collector("backend", backend.resilience_stats)
+registry.add_collector("outfit_cache", outfit_cache.stats)
+registry.add_collector("prefetch", prefetcher.stats)
+registry.add_collector("admission", admission.stats)
+registry.add_collector("file_ids", file_ids.stats)
+if image_checker is not None:
+    registry.add_collector("images", image_checker.stats)
+registry.add_collector("outbound", outbound.stats)
+if backend.streams is not None:
+    registry.add_collector("streams", backend.streams.stats)
+if write_queue is not None:
+    registry.add_collector("write_queue", write_queue.stats)
+if inline_cache is not None:
+    registry.add_collector("inline", inline_cache.stats)
+registry.add_collector("loop", loop_monitor.stats)
+if fallback is not None:
+    registry.add_collector("fallback", fallback.stats)
+registry.add_collector("profiler", profiler.stats)
+
+GENERATE_CALLBACKS = {"action:regenerate", "budget:cheaper", "budget:premium"}
+COLLAGE_CAPTION = "<b>GOTHYXAN Outfit</b>"
+
+
+def generate_debounce_key(update: Update) -> str | None:
+    # Every way of asking for a new outfit collapses into one "generate" slot per chat.
+    if update.callback_query is not None:
+        return "generate" if update.callback_query.data in GENERATE_CALLBACKS else None
+    if update.message is not None and update.message.text:
+        text = update.message.text.strip()
+        if not text.startswith("/") or text.split()[0].split("@")[0] == "/generate":
+            return "generate"
+    return None
+
+
+chat_serializer = ChatSerialMiddleware(generate_debounce_key, max_pending=settings.max_pending_updates)
+registry.add_collector("chat_queue", chat_serializer.stats)
+handler_metrics = HandlerMetricsMiddleware()
+slow_step_warnings = SlowStepMiddleware(settings.slow_callback_seconds)
+handler_deadline = DeadlineMiddleware(settings.handler_deadline_seconds)
 
 
 def action_keyboard() -> InlineKeyboardMarkup:
@@ -35,83 +225,89 @@ def action_keyboard() -> InlineKeyboardMarkup:
                 InlineKeyboardButton(text="💰 Cheaper", callback_data="budget:cheaper"),
                 InlineKeyboardButton(text="💎 Luxury", callback_data="budget:premium"),
             ],
-            [InlineKeyboardButton(text="🛒 View Links", callback_data="action:links")],
+            [
+                InlineKeyboardButton(text="👍", callback_data="rate:5"),
+                InlineKeyboardButton(text="👎", callback_data="rate:1"),
+                InlineKeyboardButton(text="🛒 View Links", callback_data="action:links"),
+            ],
         ]
     )
 
 
+def telegram_identity(message: Message) -> tuple[str, str | None]:
+    telegram_id = str(message.from_user.id if message.from_user else message.chat.id)
+    username = message.from_user.username if message.from_user else None
+    return telegram_id, username
+
+
 async def ensure_chat_session(message: Message) -> ChatState:
     chat_id = message.chat.id
-    existing = store.get_chat_state(chat_id)
-    if existing:
+    existing = await store.get_chat_state(chat_id)
+    if existing and not tokens.needs_refresh(existing.backend_session):
         return existing
 
-    telegram_id = str(message.from_user.id if message.from_user else message.chat.id)
-    username = message.from_user.username if message.from_user else None
-    session = await backend.telegram_login(telegram_id=telegram_id, username=username)
-    state = ChatState(backend_session=session)
-    store.set_chat_state(chat_id, state)
+    telegram_id, username = telegram_identity(message)
+    session = await tokens.ensure_fresh(
+        chat_id,
+        existing.backend_session if existing else None,
+        telegram_id=telegram_id,
+        username=username,
+    )
+    # Another update for this chat may have stored state while we were waiting on the login.
+    state = existing or await store.get_chat_state(chat_id) or ChatState(backend_session=session)
+    state.backend_session = session
+    await store.set_chat_state(chat_id, state)
     return state
 
 
 async def call_with_refresh(
+    message: Message,
     chat_state: ChatState,
     fn: Callable[[str], Awaitable[dict[str, Any]]],
 ) -> dict[str, Any]:
+    failed_session = chat_state.backend_session
     try:
-        return await fn(chat_state.backend_session.access_token)
-    except RuntimeError as error:
-        error_text = str(error)
-        if "401" not in error_text and "403" not in error_text:
-            raise
-        refreshed = await backend.refresh(chat_state.backend_session.refresh_token)
+        return await fn(failed_session.access_token)
+    except BackendAuthError:
+        # Another update may have refreshed the session while this call was in flight;
+        # its token is retried as is instead of refreshing the one that just failed.
+        stored = await store.get_chat_state(message.chat.id)
+        current = (stored or chat_state).backend_session
+        if current.access_token != failed_session.access_token:
+            refreshed = current
+        else:
+            telegram_id, username = telegram_identity(message)
+            refreshed = await tokens.refresh(message.chat.id, failed_session, telegram_id, username)
+            await store.update_session(message.chat.id, refreshed)
         chat_state.backend_session = refreshed
         return await fn(refreshed.access_token)
 
 
-def format_outfit(outfit: dict[str, Any]) -> str:
-    def line(label: str, data: dict[str, Any]) -> str:
-        brand = escape(str(data.get("brand") or "Brand"))
-        item = escape(str(data.get("item") or "Item"))
-        price = data.get("price") or 0
-        return f"<b>{label}</b>: {brand} — {item} (${price})"
+def render_outfit_text(outfit: OutfitView) -> str:
+    def line(piece: OutfitPiece) -> str:
+        brand = escape(piece.brand or "Brand")
+        item = escape(piece.item or "Item")
+        return f"<b>{piece.label}</b>: {brand} — {item} (${piece.price})"
 
-    top = outfit.get("top", {})
-    bottom = outfit.get("bottom", {})
-    shoes = outfit.get("shoes", {})
-    outerwear = outfit.get("outerwear", {})
-    accessories = outfit.get("accessories", [])
-    scores = outfit.get("scores") if isinstance(outfit.get("scores"), dict) else {}
-
-    acc_lines: list[str] = []
-    for acc in accessories[:3]:
-        if not isinstance(acc, dict):
-            continue
-        brand = escape(str(acc.get("brand") or "Brand"))
-        item = escape(str(acc.get("item") or "Item"))
-        price = acc.get("price") or 0
-        acc_lines.append(f"• {brand} — {item} (${price})")
+    acc_lines = [
+        f"• {escape(piece.brand or 'Brand')} — {escape(piece.item or 'Item')} (${piece.price})"
+        for piece in outfit.accessories
+    ]
     accessories_block = "\n".join(acc_lines) if acc_lines else "• none"
 
-    score_line = (
-        f"Style {scores.get('style_coherence', 0)}/100 | "
-        f"Budget {scores.get('budget_efficiency', 0)}/100 | "
-        f"Weather {scores.get('weather_compatibility', 0)}/100"
-    )
+    style_score, budget_score, weather_score = outfit.scores
+    score_line = f"Style {style_score}/100 | Budget {budget_score}/100 | Weather {weather_score}/100"
 
     text = (
         "✨ <b>GOTHYXAN Outfit</b>\n"
-        f"<b>Style</b>: {escape(str(outfit.get('style') or 'N/A'))}\n"
-        f"<b>Weather</b>: {escape(str(outfit.get('weather_context') or 'N/A'))}\n"
-        f"<b>Budget</b>: {escape(str(outfit.get('budget_range') or 'N/A'))}\n\n"
-        f"{line('Top', top)}\n"
-        f"{line('Bottom', bottom)}\n"
-        f"{line('Outerwear', outerwear)}\n"
-        f"{line('Shoes', shoes)}\n"
-        f"<b>Accessories</b>:\n{accessories_block}\n\n"
-        f"<b>Total</b>: ${outfit.get('total_price')}\n"
+        f"<b>Style</b>: {escape(outfit.style or 'N/A')}\n"
+        f"<b>Weather</b>: {escape(outfit.weather_context or 'N/A')}\n"
+        f"<b>Budget</b>: {escape(outfit.budget_range or 'N/A')}\n\n"
+        + "".join(f"{line(piece)}\n" for piece in outfit.main_pieces)
+        + f"<b>Accessories</b>:\n{accessories_block}\n\n"
+        f"<b>Total</b>: ${outfit.total_price}\n"
         f"<b>Scores</b>: {escape(score_line)}\n"
-        f"<b>Why it works</b>: {escape(str(outfit.get('explanation') or 'Balanced branded outfit'))}"
+        f"<b>Why it works</b>: {escape(outfit.explanation or 'Balanced branded outfit')}"
     )
 
     if len(text) > 3900:
@@ -119,97 +315,363 @@ def format_outfit(outfit: dict[str, Any]) -> str:
     return text
 
 
-def collect_outfit_photos(outfit: dict[str, Any]) -> list[tuple[str, str, str]]:
-    slots: list[tuple[str, dict[str, Any]]] = [
-        ("Top", outfit.get("top", {})),
-        ("Bottom", outfit.get("bottom", {})),
-        ("Outerwear", outfit.get("outerwear", {})),
-        ("Shoes", outfit.get("shoes", {})),
-    ]
-    accessories = outfit.get("accessories", [])
-    if isinstance(accessories, list):
-        for index, item in enumerate(accessories[:2], start=1):
-            if isinstance(item, dict):
-                slots.append((f"Accessory {index}", item))
-
-    photos: list[tuple[str, str, str]] = []
-    for label, data in slots:
-        image = data.get("image") if isinstance(data.get("image"), dict) else {}
-        image_url = image.get("high_res") or image.get("medium") or data.get("image_url")
-        if not isinstance(image_url, str) or not image_url.startswith(("http://", "https://")):
-            continue
+def format_outfit(outfit: OutfitView) -> str:
+    rendered = outfit.rendered
+    if rendered.text is None:
+        rendered.text = render_outfit_text(outfit)
+    return rendered.text
+
+
+def collect_outfit_photos(outfit: OutfitView) -> list[tuple[str, str, str, str]]:
+    rendered = outfit.rendered
+    if rendered.photos is None:
+        photos: list[tuple[str, str, str, str]] = []
+        for piece in outfit.main_pieces + outfit.accessories[:2]:
+            if piece.image_url is None:
+                continue
+            brand = escape(piece.brand or "Brand")
+            item = escape(piece.item or "Item")
+            caption = f"<b>{escape(piece.label.upper())}</b>\n{brand} — {item}\n${piece.price}"
+            photos.append((piece.image_url, caption, piece.label, piece.image_variant))
+        rendered.photos = photos[:6]
+    return rendered.photos
+
+
+async def checked_outfit_photos(outfit: OutfitView) -> list[tuple[str, str, str, str]]:
+    # collect_outfit_photos with every URL probed at once; dead ones are swapped for
+    # another rendition, the local pack image (variant "local", a file path) or the
+    # backend proxy URL, or left out.
+    photos = collect_outfit_photos(outfit)
+    if image_checker is None or not photos:
+        return photos
+    pieces = [piece for piece in outfit.main_pieces + outfit.accessories[:2] if piece.image_url is not None]
+    choices = await image_checker.choose(pieces[: len(photos)])
+    checked = []
+    for (_url, caption, label, _variant), choice in zip(photos, choices):
+        if choice is not None:
+            source, variant = choice
+            checked.append((source, caption, label, variant))
+    return checked
 
-        brand = data.get("brand") or "Brand"
-        item = data.get("item") or "Item"
-        price = data.get("price") or 0
-        caption = f"<b>{escape(label.upper())}</b>\n{escape(str(brand))} — {escape(str(item))}\n${price}"
-        photos.append((image_url, caption, label))
 
-    return photos[:6]
+def photo_media(url: str, variant: str) -> str | InputFile:
+    return FSInputFile(url) if variant == LOCAL_VARIANT else url
 
 
-async def send_outfit_photos(message: Message, outfit: dict[str, Any]) -> None:
-    photos = collect_outfit_photos(outfit)
+async def send_outfit_photos(message: Message, photos: list[tuple[str, str, str, str]]) -> list[int]:
+    # Returns the ids of the photo messages that went out (none if every attempt failed).
     if not photos:
-        return
+        return []
+
+    keys: list[MediaKey] = [(url, variant) for url, _caption, _label, variant in photos]
 
-    media_group: list[InputMediaPhoto] = []
-    for index, (url, caption, _label) in enumerate(photos):
-        media_group.append(
+    # Flood control is retried by the outbound scheduler; a second attempt here only
+    # resends from URLs after a stale file_id.
+    for use_file_ids in (True, False):
+        cached = {key: file_ids.get(key) for key in keys} if use_file_ids else {}
+        media_group = [
             InputMediaPhoto(
-                media=url,
+                media=cached.get(key) or photo_media(url, variant),
                 caption=caption if index == 0 else None,
                 parse_mode="HTML" if index == 0 else None,
             )
-        )
-
-    for attempt in range(3):
+            for index, (key, (url, caption, _label, variant)) in enumerate(zip(keys, photos))
+        ]
         try:
-            await message.answer_media_group(media=media_group)
-            return
+            sent = await message.answer_media_group(media=media_group)
+        except TelegramRetryAfter as error:
+            # The scheduler already waited and gave up; more sends would only extend the ban.
+            logger.warning("Outfit photo group hit flood control: %s", error)
+            media_sends.inc(kind="media_group", outcome="flood")
+            return []
         except Exception as error:
-            logger.warning("Failed to send outfit photo group (attempt %s): %s", attempt + 1, error)
-            await asyncio.sleep(0.4 + attempt * 0.4)
+            logger.warning("Failed to send outfit photo group: %s", error)
+            used = [key for key, file_id in cached.items() if file_id]
+            if not used:
+                break
+            # A stored file_id may have gone stale; drop them and resend from URLs right away.
+            file_ids.invalidate(used)
+            continue
+        file_ids.set_many(
+            {key: result.photo[-1].file_id for key, result in zip(keys, sent) if result.photo}
+        )
+        media_sends.inc(kind="media_group", outcome="cached" if any(cached.values()) else "uploaded")
+        return [result.message_id for result in sent]
+
+    media_sends.inc(kind="media_group", outcome="failed")
 
-    first_url, first_caption, _ = photos[0]
+    first_url, first_caption, _label, first_variant = photos[0]
+    first_key = (first_url, first_variant)
+    cached_first = file_ids.get(first_key)
     fallback_url = f"{settings.backend_url}/api/media/placeholder?variant=medium"
-    for source_url in [first_url, fallback_url]:
+    sources = ([cached_first] if cached_first else []) + [first_url, fallback_url]
+    for source in sources:
         try:
-            await message.answer_photo(photo=source_url, caption=first_caption, parse_mode="HTML")
-            return
+            result = await message.answer_photo(
+                photo=photo_media(source, first_variant) if source == first_url else source,
+                caption=first_caption,
+                parse_mode="HTML",
+            )
+        except TelegramRetryAfter as inner_error:
+            logger.warning("Fallback outfit photo hit flood control: %s", inner_error)
+            break
         except Exception as inner_error:
             logger.warning("Failed to send fallback outfit photo: %s", inner_error)
+            if source == cached_first:
+                file_ids.invalidate([first_key])
+            continue
+        if source == first_url and result.photo:
+            file_ids.set_many({first_key: result.photo[-1].file_id})
+        media_sends.inc(kind="fallback_photo", outcome="placeholder" if source == fallback_url else "sent")
+        return [result.message_id]
+    media_sends.inc(kind="fallback_photo", outcome="failed")
+    return []
+
+
+def collect_collage_slots(outfit: OutfitView) -> list[CollageSlot]:
+    rendered = outfit.rendered
+    if rendered.collage_slots is None:
+        rendered.collage_slots = [
+            CollageSlot(
+                label=piece.label,
+                url=piece.collage_url,
+                brand=piece.brand or "Brand",
+                item=piece.item or "Item",
+                category=piece.category or piece.label.split()[0].lower(),
+            )
+            for piece in outfit.main_pieces + outfit.accessories[:2]
+            if piece.present
+        ]
+    return rendered.collage_slots
 
 
-def collect_outfit_links(outfit: dict[str, Any]) -> list[str]:
-    slots: list[tuple[str, dict[str, Any]]] = [
-        ("Top", outfit.get("top", {})),
-        ("Bottom", outfit.get("bottom", {})),
-        ("Outerwear", outfit.get("outerwear", {})),
-        ("Shoes", outfit.get("shoes", {})),
-    ]
+async def render_outfit_collage(outfit: OutfitView) -> tuple[str, bytes] | None:
+    if collage is None:
+        return None
+    slots = collect_collage_slots(outfit)
+    if not slots:
+        return None
+    try:
+        return await collage.render(slots)
+    except Exception as error:
+        logger.warning("Failed to render outfit collage: %s", error)
+        media_sends.inc(kind="collage", outcome="render_failed")
+        return None
+
+
+async def send_outfit_collage(message: Message, outfit: OutfitView) -> tuple[int, str] | None:
+    # Returns the id of the collage message and the collage key, or None to fall back to photos.
+    rendered = await render_outfit_collage(outfit)
+    if rendered is None:
+        return None
+    collage_key, data = rendered
+
+    # Rendered collages are uploaded once; repeats go out by file_id like product photos.
+    media_key: MediaKey = (f"collage:{collage_key}", "collage")
+    cached_file_id = file_ids.get(media_key)
+    try:
+        if cached_file_id:
+            try:
+                sent = await message.answer_photo(photo=cached_file_id, caption=COLLAGE_CAPTION, parse_mode="HTML")
+                media_sends.inc(kind="collage", outcome="cached")
+                return sent.message_id, collage_key
+            except Exception as error:
+                logger.warning("Cached collage file_id rejected: %s", error)
+                file_ids.invalidate([media_key])
+        sent = await message.answer_photo(
+            photo=BufferedInputFile(data, filename="outfit.jpg"),
+            caption=COLLAGE_CAPTION,
+            parse_mode="HTML",
+        )
+    except Exception as error:
+        logger.warning("Failed to send outfit collage: %s", error)
+        media_sends.inc(kind="collage", outcome="failed")
+        return None
+    if sent.photo:
+        file_ids.set_many({media_key: sent.photo[-1].file_id})
+    media_sends.inc(kind="collage", outcome="uploaded")
+    return sent.message_id, collage_key
+
+
+def card_media_keys(photos: list[tuple[str, str, str, str]]) -> list[str]:
+    # One fingerprint per photo of the card. Signed proxy URLs get a new exp and sig on
+    # every response, so those are left out; the first photo also carries the caption.
+    keys = []
+    for index, (url, caption, _label, variant) in enumerate(photos):
+        identity = f"{unsigned_url(url)}\0{variant}\0{caption if index == 0 else ''}"
+        keys.append(hashlib.blake2b(identity.encode(), digest_size=8).hexdigest())
+    return keys
+
+
+async def send_outfit_media(message: Message, outfit: OutfitView, card: OutfitCard) -> None:
+    sent_collage = await send_outfit_collage(message, outfit)
+    if sent_collage is not None:
+        message_id, collage_key = sent_collage
+        card.media_message_ids, card.media_keys, card.collage = [message_id], [collage_key], True
+        return
+    photos = await checked_outfit_photos(outfit)
+    card.media_message_ids = await send_outfit_photos(message, photos)
+    # After the single-photo fallback the card no longer matches the photos, so the next
+    # edit replaces everything.
+    card.media_keys = card_media_keys(photos) if len(card.media_message_ids) == len(photos) else []
+    card.collage = False
+
+
+def not_modified(error: TelegramBadRequest) -> bool:
+    return "message is not modified" in error.message
+
+
+async def edit_card_photo(
+    message: Message,
+    message_id: int,
+    media_key: MediaKey,
+    source: str | InputFile,
+    caption: str | None,
+    kind: str,
+) -> bool:
+    # Swaps one photo of the card, by file_id when Telegram already has it.
+    cached_file_id = file_ids.get(media_key)
+    sources: list[str | InputFile] = ([cached_file_id] if cached_file_id else []) + [source]
+    for media in sources:
+        try:
+            result = await message.bot.edit_message_media(
+                chat_id=message.chat.id,
+                message_id=message_id,
+                media=InputMediaPhoto(media=media, caption=caption, parse_mode="HTML" if caption else None),
+            )
+        except Exception as error:
+            if isinstance(error, TelegramBadRequest) and not_modified(error):
+                return True
+            logger.warning("Failed to edit outfit card photo: %s", error)
+            if media == cached_file_id:
+                file_ids.invalidate([media_key])
+            continue
+        if isinstance(result, Message) and result.photo and media != cached_file_id:
+            file_ids.set_many({media_key: result.photo[-1].file_id})
+        media_sends.inc(kind=kind, outcome="cached" if media == cached_file_id else "uploaded")
+        return True
+    media_sends.inc(kind=kind, outcome="failed")
+    return False
+
+
+async def edit_outfit_card(message: Message, card: OutfitCard, outfit: OutfitView) -> bool:
+    # Updates the card the tap came from: the text, then only the photos that changed.
+    # False when the card cannot take this outfit (it was deleted, the new outfit has
+    # more photos than the album, which Telegram cannot grow, or a photo edit failed and
+    # the album would mix two outfits); the caller sends a new one.
+    photos: list[tuple[str, str, str, str]] = []
+    rendered_collage: tuple[str, bytes] | None = None
+    if card.collage:
+        rendered_collage = await render_outfit_collage(outfit)
+        if rendered_collage is None:
+            return False
+    else:
+        photos = await checked_outfit_photos(outfit)
+        if not photos or len(photos) > len(card.media_message_ids):
+            return False
 
-    accessories = outfit.get("accessories", [])
-    if isinstance(accessories, list):
-        for index, item in enumerate(accessories[:3], start=1):
-            if isinstance(item, dict):
-                slots.append((f"Accessory {index}", item))
+    try:
+        await message.edit_text(
+            format_outfit(outfit),
+            reply_markup=action_keyboard(),
+            parse_mode="HTML",
+            disable_web_page_preview=True,
+        )
+    except TelegramBadRequest as error:
+        if not not_modified(error):
+            logger.warning("Failed to edit outfit card text: %s", error)
+            return False
+
+    if rendered_collage is not None:
+        collage_key, data = rendered_collage
+        if card.media_keys == [collage_key]:
+            return True
+        if not await edit_card_photo(
+            message,
+            card.media_message_ids[0],
+            (f"collage:{collage_key}", "collage"),
+            BufferedInputFile(data, filename="outfit.jpg"),
+            COLLAGE_CAPTION,
+            "edit_collage",
+        ):
+            return False
+        card.media_keys = [collage_key]
+        return True
+
+    keys = card_media_keys(photos)
+    old_keys = card.media_keys + [""] * (len(keys) - len(card.media_keys))
+    changed = [index for index, (key, old_key) in enumerate(zip(keys, old_keys)) if key != old_key]
+    # Each photo is its own edit call; they go out together (the outbound scheduler
+    # still paces them per chat).
+    results = await asyncio.gather(
+        *(
+            edit_card_photo(
+                message,
+                card.media_message_ids[index],
+                (photos[index][0], photos[index][3]),
+                photo_media(photos[index][0], photos[index][3]),
+                photos[index][1] if index == 0 else None,
+                "edit_photo",
+            )
+            for index in changed
+        )
+    )
+    if not all(results):
+        return False
+    surplus = card.media_message_ids[len(photos) :]
+    if surplus:
+        try:
+            await message.bot.delete_messages(chat_id=message.chat.id, message_ids=surplus)
+        except Exception as error:
+            logger.warning("Failed to delete surplus outfit card photos: %s", error)
+    card.media_message_ids = card.media_message_ids[: len(photos)]
+    card.media_keys = keys
+    return True
+
+
+def collect_outfit_links(outfit: OutfitView) -> list[str]:
+    rendered = outfit.rendered
+    if rendered.links is None:
+        rendered.links = [
+            f"• <b>{escape(piece.label)}</b>: <a href=\"{escape(piece.link)}\">"
+            f"{escape(piece.brand or 'Brand')} — {escape(piece.item or 'Item')}</a>"
+            for piece in outfit.pieces
+            if piece.link is not None
+        ]
+    return rendered.links
+
+
+def inline_result(outfit: OutfitView) -> InlineQueryResultArticle:
+    rendered = outfit.rendered
+    if rendered.inline_result is None:
+        thumbnail = next((piece.image_url for piece in outfit.main_pieces if piece.image_url), None)
+        rendered.inline_result = InlineQueryResultArticle(
+            id=hashlib.blake2b(outfit.blob, digest_size=16).hexdigest(),
+            title=f"{(outfit.style or 'Outfit').title()} · ${outfit.total_price}",
+            description=" · ".join(piece.brand for piece in outfit.main_pieces if piece.brand),
+            thumbnail_url=thumbnail,
+            input_message_content=InputTextMessageContent(
+                message_text=format_outfit(outfit),
+                parse_mode="HTML",
+                link_preview_options=LinkPreviewOptions(is_disabled=True),
+            ),
+        )
+    return rendered.inline_result
 
-    lines: list[str] = []
-    for label, data in slots:
-        link = data.get("affiliate_link") or data.get("reference_link")
-        if not isinstance(link, str) or not link.startswith(("http://", "https://")):
-            continue
-        brand = escape(str(data.get("brand") or "Brand"))
-        item = escape(str(data.get("item") or "Item"))
-        lines.append(f"• <b>{escape(label)}</b>: <a href=\"{escape(link)}\">{brand} — {item}</a>")
-    return lines
 
+async def save_request_change(message: Message, state: ChatState) -> None:
+    # The request changed, so speculative variants of the old one are no longer useful.
+    prefetcher.cancel(message.chat.id)
+    await store.set_chat_state(message.chat.id, state)
 
-async def generate_and_send(message: Message, req: OutfitRequestState) -> None:
-    chat_state = await ensure_chat_session(message)
-    chat_state.last_request = req
 
+async def fetch_outfit(
+    message: Message,
+    chat_state: ChatState,
+    req: OutfitRequestState,
+    on_step: StepCallback | None = None,
+    speculative: bool = False,
+) -> OutfitView:
     async def _generate(access_token: str) -> dict[str, Any]:
         return await backend.generate_outfit(
             access_token=access_token,
@@ -220,18 +682,162 @@ async def generate_and_send(message: Message, req: OutfitRequestState) -> None:
             budget_min=req.budget_min,
             budget_max=req.budget_max,
             luxury_only=req.luxury_only,
+            speculative=speculative,
+            on_step=on_step,
         )
 
-    outfit = await call_with_refresh(chat_state, _generate)
+    # Normalize once per backend response; everything downstream renders from the view.
+    return OutfitView.from_payload(await call_with_refresh(message, chat_state, _generate))
+
+
+async def commit_prefetched(
+    message: Message, chat_state: ChatState, req: OutfitRequestState, outfit: OutfitView
+) -> None:
+    # Now that the user sees it, the prefetched outfit joins their history and style profile.
+    request = generation_payload(
+        style=req.style,
+        occasion=req.occasion,
+        city=req.city,
+        budget_mode=req.budget_mode,
+        budget_min=req.budget_min,
+        budget_max=req.budget_max,
+        luxury_only=req.luxury_only,
+    )
+
+    async def _commit(access_token: str) -> dict[str, Any]:
+        return await backend.commit_outfit(access_token, request, outfit.payload())
+
+    try:
+        await call_with_refresh(message, chat_state, _commit)
+    except Exception as error:
+        logger.warning("Failed to record prefetched outfit for chat %s: %s", message.chat.id, error)
+
+
+def pipeline_progress(placeholder: Message) -> StepCallback:
+    # Telegram rate-limits edits of one message, so coalesce steps into at most one edit per second.
+    steps: list[str] = []
+    last_edit = 0.0
+
+    async def on_step(step: str) -> None:
+        nonlocal last_edit
+        if step in steps:
+            return
+        steps.append(step)
+        now = time.monotonic()
+        if now - last_edit < 1.0:
+            return
+        last_edit = now
+        lines = "\n".join(f"✓ {escape(name)}" for name in steps)
+        await placeholder.edit_text(f"⏳ <b>Generating your outfit…</b>\n{lines}", parse_mode="HTML")
+
+    return on_step
+
+
+async def generate_and_send(
+    message: Message,
+    req: OutfitRequestState,
+    *,
+    use_cache: bool = True,
+    edit_card: bool = False,
+) -> None:
+    chat_id = message.chat.id
+    chat_state = await ensure_chat_session(message)
+    chat_state.last_request = req
+    await store.set_chat_state(chat_id, chat_state)
+    # Taps on the buttons of the current card update that card instead of adding a new one.
+    card = chat_state.card if edit_card and settings.edit_cards else None
+    if card is not None and card.text_message_id != message.message_id:
+        card = None
+    cache_key = (chat_id, req.cache_key())
+
+    # Repeated styles and Cheaper/Luxury toggles are served without spending the generate quota.
+    outfit = outfit_cache.get(cache_key) if use_cache else None
+    prefetched = prefetcher.take(chat_id, req) if use_cache and outfit is None else None
+    prefetcher.cancel(chat_id)
+    if prefetched is not None:
+        outfit = await prefetcher.wait(prefetched)
+    # A prefetch (just awaited or already cached) was generated as speculative.
+    commit = prefetcher.shown(chat_id, req) and outfit is not None
+    placeholder: Message | None = None
+    degraded = False
+    if outfit is None:
+        on_step: StepCallback | None = None
+        if backend.streams is not None and card is None:
+            # Streaming mode: answer at once and fill the message in as pipeline steps finish.
+            # A card being edited keeps showing the previous outfit and its buttons until then.
+            placeholder = await message.answer("⏳ <b>Generating your outfit…</b>", parse_mode="HTML")
+            on_step = pipeline_progress(placeholder)
+        try:
+            async with admission.slot():
+                prefetcher.record_generation(chat_id)
+                outfit = await fetch_outfit(message, chat_state, req, on_step=on_step)
+        except AdmissionRejected as error:
+            logger.warning("Generation shed for chat %s: %s", chat_id, error)
+            busy_text = "Too many outfit requests right now, please try again in a minute."
+            if placeholder is not None:
+                await placeholder.edit_text(busy_text)
+            else:
+                await message.answer(busy_text)
+            return
+        except Exception as error:
+            outfit = fallback.generate(req) if fallback is not None and is_backend_unavailable(error) else None
+            if outfit is None:
+                raise
+            logger.warning("Backend generation failed for chat %s, serving a catalog outfit: %s", chat_id, error)
+            degraded = True
+        if not degraded:
+            # Catalog outfits are not cached, so the next request tries the backend again.
+            outfit_cache.set(cache_key, outfit)
     chat_state.last_outfit = outfit
+    await store.set_chat_state(chat_id, chat_state)
 
-    await message.answer(
-        format_outfit(outfit),
-        reply_markup=action_keyboard(),
-        parse_mode="HTML",
-        disable_web_page_preview=True,
-    )
-    await send_outfit_photos(message, outfit)
+    text = format_outfit(outfit)
+    edited = False
+    if placeholder is not None:
+        try:
+            await placeholder.edit_text(
+                text,
+                reply_markup=action_keyboard(),
+                parse_mode="HTML",
+                disable_web_page_preview=True,
+            )
+            edited = True
+        except TelegramBadRequest as error:
+            logger.warning("Failed to edit streaming placeholder: %s", error)
+    if card is not None and await edit_outfit_card(message, card, outfit):
+        card_updates.inc(outcome="edited")
+    else:
+        sent = placeholder if edited else None
+        if sent is None:
+            sent = await message.answer(
+                text,
+                reply_markup=action_keyboard(),
+                parse_mode="HTML",
+                disable_web_page_preview=True,
+            )
+        card_updates.inc(outcome="sent" if card is None else "resent")
+        card = OutfitCard(text_message_id=sent.message_id)
+        await send_outfit_media(message, outfit, card)
+    chat_state.card = card
+    await store.set_chat_state(chat_id, chat_state)
+    if commit:
+        await commit_prefetched(message, chat_state, req, outfit)
+
+    if settings.prefetch_enabled and not degraded:
+
+        async def prefetch_variant(variant: OutfitRequestState) -> OutfitView:
+            # Runs after this tap is answered, so it gets the full generate timeout.
+            with detached():
+                return await fetch_outfit(message, chat_state, variant, speculative=True)
+
+        if chat_id not in prefetcher.entitlements:
+            try:
+                subscription = await call_with_refresh(message, chat_state, backend.subscription)
+            except Exception as error:
+                logger.warning("Subscription lookup failed for chat %s, not prefetching: %s", chat_id, error)
+            else:
+                prefetcher.remember(chat_id, Entitlement.from_subscription(subscription))
+        prefetcher.schedule(chat_id, req, prefetch_variant)
 
 
 @router.message(Command("start"))
@@ -257,6 +863,7 @@ async def on_set_style(message: Message, command: CommandObject) -> None:
         await message.answer("Usage: /setstyle streetwear")
         return
     state.last_request.style = command.args.strip().lower()
+    await save_request_change(message, state)
     await message.answer(f"Style set to: {state.last_request.style}")
 
 
@@ -267,6 +874,7 @@ async def on_set_occasion(message: Message, command: CommandObject) -> None:
         await message.answer("Usage: /setoccasion date")
         return
     state.last_request.occasion = command.args.strip().lower()
+    await save_request_change(message, state)
     await message.answer(f"Occasion set to: {state.last_request.occasion}")
 
 
@@ -277,6 +885,7 @@ async def on_set_city(message: Message, command: CommandObject) -> None:
         await message.answer("Usage: /setcity London")
         return
     state.last_request.city = command.args.strip()
+    await save_request_change(message, state)
     await message.answer(f"City set to: {state.last_request.city}")
 
 
@@ -309,6 +918,7 @@ async def on_budget(message: Message, command: CommandObject) -> None:
         state.last_request.budget_max = None
         state.last_request.luxury_only = mode == "premium"
 
+    await save_request_change(message, state)
     await message.answer(
         f"Budget set: {mode} {state.last_request.budget_min or ''} {state.last_request.budget_max or ''}".strip()
     )
@@ -325,6 +935,7 @@ async def on_luxury(message: Message, command: CommandObject) -> None:
     state.last_request.luxury_only = mode == "on"
     if state.last_request.luxury_only:
         state.last_request.budget_mode = "premium"
+    await save_request_change(message, state)
     await message.answer(f"Luxury mode: {'enabled' if state.last_request.luxury_only else 'disabled'}")
 
 
@@ -355,6 +966,30 @@ async def on_generate(message: Message) -> None:
     await generate_and_send(message, state.last_request)
 
 
+@router.message(Command("profile"))
+async def on_profile(message: Message, command: CommandObject) -> None:
+    # Admin only (TELEGRAM_ADMIN_IDS); anyone else gets no sign the command exists.
+    if message.from_user is None or message.from_user.id not in settings.admin_ids:
+        return
+    try:
+        seconds = float(command.args or 10)
+    except ValueError:
+        await message.answer("Usage: /profile [seconds]")
+        return
+    try:
+        folded = await profiler.profile(seconds)
+    except ProfilerBusy:
+        await message.answer("A profile is already running")
+        return
+    if not folded:
+        await message.answer("No samples collected")
+        return
+    await message.answer_document(
+        BufferedInputFile(folded.encode(), filename=f"profile-{int(time.time())}.folded"),
+        caption="Folded stacks: flamegraph.pl, speedscope or inferno",
+    )
+
+
 @router.callback_query(F.data.startswith("budget:"))
 async def on_budget_action(callback: CallbackQuery) -> None:
     if not callback.message:
@@ -362,30 +997,10 @@ async def on_budget_action(callback: CallbackQuery) -> None:
     chat_state = await ensure_chat_session(callback.message)
     action = callback.data.split(":", maxsplit=1)[1]
 
-    req = chat_state.last_request
-    if action == "cheaper":
-        if req.budget_mode == "custom":
-            req.budget_min = max(50, int((req.budget_min or 200) * 0.7))
-            req.budget_max = max(req.budget_min + 50, int((req.budget_max or 900) * 0.75))
-            req.luxury_only = False
-        else:
-            req.budget_mode = "cheaper"
-            req.budget_min = None
-            req.budget_max = None
-            req.luxury_only = False
-    elif action == "premium":
-        if req.budget_mode == "custom":
-            req.budget_min = int((req.budget_min or 200) * 1.2)
-            req.budget_max = int((req.budget_max or 900) * 1.3)
-            req.luxury_only = True
-        else:
-            req.budget_mode = "premium"
-            req.budget_min = None
-            req.budget_max = None
-            req.luxury_only = True
+    req = apply_budget_action(chat_state.last_request, action)
 
     await callback.answer("Regenerating...")
-    await generate_and_send(callback.message, req)
+    await generate_and_send(callback.message, req, edit_card=True)
 
 
 @router.callback_query(F.data == "action:regenerate")
@@ -394,7 +1009,7 @@ async def on_regenerate(callback: CallbackQuery) -> None:
         return
     chat_state = await ensure_chat_session(callback.message)
     await callback.answer("Regenerating...")
-    await generate_and_send(callback.message, chat_state.last_request)
+    await generate_and_send(callback.message, chat_state.last_request, use_cache=False, edit_card=True)
 
 
 @router.callback_query(F.data == "action:save")
@@ -402,17 +1017,60 @@ async def on_save(callback: CallbackQuery) -> None:
     if not callback.message:
         return
     chat_state = await ensure_chat_session(callback.message)
-    if not chat_state.last_outfit:
+    last_outfit = chat_state.last_outfit
+    if last_outfit is None:
         await callback.answer("No outfit to save", show_alert=True)
         return
 
+    telegram_id, username = telegram_identity(callback.message)
+    # Acknowledged at once; the write goes out in the background (write_behind.py).
+    if write_queue is not None and write_queue.enqueue(
+        callback.message.chat.id, telegram_id, username, KIND_SAVE, last_outfit.blob, last_outfit.blob
+    ):
+        await callback.answer("Outfit saved")
+        return
+
     async def _save(access_token: str) -> dict[str, Any]:
-        return await backend.save_outfit(access_token, chat_state.last_outfit or {})
+        return await backend.save_outfit(access_token, last_outfit.payload())
 
-    await call_with_refresh(chat_state, _save)
+    await call_with_refresh(callback.message, chat_state, _save)
     await callback.answer("Outfit saved")
 
 
+@router.callback_query(F.data.in_({"rate:1", "rate:5"}))
+async def on_rate(callback: CallbackQuery) -> None:
+    if not callback.message:
+        return
+    chat_state = await ensure_chat_session(callback.message)
+    outfit = chat_state.last_outfit
+    if outfit is None:
+        await callback.answer("No outfit to rate", show_alert=True)
+        return
+
+    rating = int(callback.data.split(":", maxsplit=1)[1])
+    feedback = {
+        "rating": rating,
+        "style": (outfit.style or chat_state.last_request.style)[:60],
+        "budgetMode": chat_state.last_request.budget_mode,
+        "outfit": {
+            "style": outfit.style,
+            "total_price": outfit.total_price,
+            "brands": [piece.brand for piece in outfit.main_pieces if piece.brand],
+        },
+    }
+    telegram_id, username = telegram_identity(callback.message)
+    body = zlib.compress(json_codec.dumps(feedback), 1)
+    if write_queue is None or not write_queue.enqueue(
+        callback.message.chat.id, telegram_id, username, KIND_FEEDBACK, body, outfit.blob + bytes([rating])
+    ):
+
+        async def _rate(access_token: str) -> dict[str, Any]:
+            return await backend.send_feedback(access_token, feedback)
+
+        await call_with_refresh(callback.message, chat_state, _rate)
+    await callback.answer("Thanks for the feedback")
+
+
 @router.callback_query(F.data == "action:links")
 async def on_links(callback: CallbackQuery) -> None:
     if not callback.message:
@@ -433,6 +1091,19 @@ async def on_links(callback: CallbackQuery) -> None:
     await callback.answer("Links sent")
 
 
+@router.inline_query()
+async def on_inline_query(query: InlineQuery) -> None:
+    outfits = inline_cache.match(query.query, INLINE_RESULTS_LIMIT) if inline_cache is not None else []
+    await query.answer(
+        [inline_result(outfit) for outfit in outfits],
+        # An empty answer is not cached by Telegram, so the style shows up once it is warm.
+        cache_time=settings.inline_cache_time_seconds if outfits else 0,
+        is_personal=False,
+        # Nothing warm for this text: offer a full generation in the private chat instead.
+        button=None if outfits else InlineQueryResultsButton(text="Generate in chat", start_parameter="inline"),
+    )
+
+
 @router.message()
 async def on_plain_message(message: Message) -> None:
     # Quick mode: a plain style name triggers generation with current context.
@@ -445,16 +1116,82 @@ async def on_plain_message(message: Message) -> None:
     await generate_and_send(message, state.last_request)
 
 
-async def main() -> None:
-    bot = Bot(token=settings.bot_token)
+def build_bot() -> Bot:
+    session = None
+    if settings.telegram_api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.telegram_api_url))
+    bot = Bot(token=settings.bot_token, session=session)
+    bot.session.middleware(outbound)
+    return bot
+
+
+async def on_startup() -> None:
+    store.start()
+    # Writes left on disk by the previous run go out without waiting for a new tap.
+    if write_queue is not None:
+        write_queue.start()
+    if inline_cache is not None:
+        inline_cache.start()
+    loop_monitor.start()
+    if fallback is not None:
+        fallback.start()
+
+
+def setup_metrics_app(app: web.Application) -> None:
+    add_profile_route(app, profiler)
+
+
+def build_dispatcher() -> Dispatcher:
     dispatcher = Dispatcher()
+    dispatcher.startup.register(on_startup)
+    dispatcher.update.outer_middleware(chat_serializer)
+    router.message.middleware(handler_metrics)
+    router.callback_query.middleware(handler_metrics)
+    router.inline_query.middleware(handler_metrics)
+    router.message.middleware(slow_step_warnings)
+    router.callback_query.middleware(slow_step_warnings)
+    router.inline_query.middleware(slow_step_warnings)
+    router.message.middleware(handler_deadline)
+    router.callback_query.middleware(handler_deadline)
     dispatcher.include_router(router)
+    return dispatcher
+
+
+async def shutdown(bot: Bot) -> None:
+    await loop_monitor.close()
+    if image_checker is not None:
+        await image_checker.close()
+    if inline_cache is not None:
+        await inline_cache.close()
+    if write_queue is not None:
+        await write_queue.close()
+    await backend.close()
+    await store.close()
+    await file_ids.close()
+    if collage is not None:
+        await collage.close()
+    await outbound.close()
+    await bot.session.close()
+
+
+async def main() -> None:
+    bot = build_bot()
+    dispatcher = build_dispatcher()
+    metrics_runner = None
+    if settings.metrics_port:
+        metrics_runner = await start_metrics_server(
+            registry, settings.metrics_host, settings.metrics_port, setup=setup_metrics_app
+        )
 
     try:
-        await dispatcher.start_polling(bot)
+        if settings.bot_mode == "webhook":
+            await run_webhook(dispatcher, bot, settings)
+        else:
+            await dispatcher.start_polling(bot)
     finally:
-        await backend.close()
-        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await shutdown(bot)
 
 
 if __name__ == "__main__":
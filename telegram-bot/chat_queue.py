@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from prefetch import RateWindow
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChatLane:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    users: int = 0
+    debounce_seq: dict[str, int] = field(default_factory=dict)
+
+
+class ChatSerialMiddleware(BaseMiddleware):
+    # Outer update middleware: one update at a time per chat, in arrival order.
+    # Updates sharing a debounce key collapse so that only the newest queued one runs.
+    def __init__(self, debounce_key: Callable[[Update], str | None], max_pending: int):
+        self.debounce_key = debounce_key
+        self.max_pending = max_pending
+        self._lanes: dict[int, ChatLane] = {}
+        self.pending = 0
+        self.superseded = 0
+        self.shed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat")
+        if chat is None or not isinstance(event, Update):
+            return await handler(event, data)
+
+        if self.pending >= self.max_pending:
+            self.shed += 1
+            await reject_update(event, "Bot is busy right now, please try again in a moment.")
+            return None
+
+        lane = self._lanes.setdefault(chat.id, ChatLane())
+        key = self.debounce_key(event)
+        seq = 0
+        if key is not None:
+            seq = lane.debounce_seq.get(key, 0) + 1
+            lane.debounce_seq[key] = seq
+
+        lane.users += 1
+        self.pending += 1
+        try:
+            async with lane.lock:
+                self.pending -= 1
+                if key is not None and lane.debounce_seq[key] != seq:
+                    self.superseded += 1
+                    await reject_update(event, None)
+                    return None
+                return await handler(event, data)
+        finally:
+            lane.users -= 1
+            if lane.users == 0:
+                del self._lanes[chat.id]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "chats": len(self._lanes),
+            "pending": self.pending,
+            "superseded": self.superseded,
+            "shed": self.shed,
+        }
+
+
+async def reject_update(update: Update, text: str | None) -> None:
+    # Callback buttons keep spinning until answered, so always answer them.
+    try:
+        if update.callback_query is not None:
+            await update.callback_query.answer(text or "")
+        elif update.message is not None and text:
+            await update.message.answer(text)
+    except Exception as error:
+        logger.warning("Failed to notify rejected update: %s", error)
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class AdmissionController:
+    # Global gate in front of backend generations: caps concurrency and waits for the
+    # generate rate window, shedding load when the wait would be too long.
+    def __init__(
+        self,
+        window: RateWindow,
+        *,
+        max_concurrent: int,
+        max_waiting: int,
+        max_delay_seconds: float,
+    ):
+        self.window = window
+        self.max_waiting = max_waiting
+        self.max_delay_seconds = max_delay_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.delayed = 0
+        self.shed = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self.waiting >= self.max_waiting:
+            self.shed += 1
+            raise AdmissionRejected("too many generations waiting")
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        try:
+            delay = self.window.retry_after("global")
+            if delay > self.max_delay_seconds:
+                self.shed += 1
+                raise AdmissionRejected("generate rate window exhausted")
+            if delay > 0:
+                self.delayed += 1
+                await asyncio.sleep(delay)
+            self.active += 1
+            self.admitted += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+        finally:
+            self._semaphore.release()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "shed": self.shed,
+        }
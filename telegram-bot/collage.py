@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import aiohttp
+
+from media_cache import unsigned_url
+
+logger = logging.getLogger(__name__)
+
+RASTER_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+TILE_SIZE = 480
+LABEL_HEIGHT = 64
+COLUMNS = 3
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+FETCH_CHUNK_BYTES = 64 * 1024
+
+
+@dataclass(frozen=True)
+class CollageSlot:
+    label: str
+    url: str | None
+    brand: str
+    item: str
+    category: str
+
+
+def slugify(value: str) -> str:
+    # Same slug shape as the PACK_ALL_CLOTHES file names ("Levi's" -> "levis", "A.P.C." -> "a-p-c").
+    value = value.lower().replace("'", "").replace("’", "")
+    return re.sub(r"[^a-z0-9]+", "-", value).strip("-")
+
+
+class LocalImageIndex:
+    # Files are named "<pack_id>-<brand>-<category>-<title>.<ext>"; only raster files are usable.
+    def __init__(self, images_dir: str | None):
+        self.images_dir = Path(images_dir) if images_dir else None
+        self._paths: dict[str, Path] | None = None
+
+    def _load(self) -> dict[str, Path]:
+        paths: dict[str, Path] = {}
+        if self.images_dir and self.images_dir.is_dir():
+            for path in self.images_dir.iterdir():
+                if path.suffix.lower() in RASTER_SUFFIXES:
+                    paths[path.stem.split("-", 1)[-1]] = path
+        return paths
+
+    async def find(self, slot: CollageSlot) -> Path | None:
+        if self._paths is None:
+            paths = await asyncio.to_thread(self._load)
+            if self._paths is None:
+                self._paths = paths
+        key = f"{slugify(slot.brand)}-{slugify(slot.category)}-{slugify(slot.item)}"
+        return self._paths.get(key)
+
+
+def render_collage(tiles: list[tuple[bytes | None, str]], tile_size: int = TILE_SIZE) -> bytes:
+    # Runs in a worker process: decode, resize and compose every tile into one JPEG.
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+    columns = min(COLUMNS, max(1, len(tiles)))
+    rows = (len(tiles) + columns - 1) // columns
+    cell_height = tile_size + LABEL_HEIGHT
+    canvas = Image.new("RGB", (columns * tile_size, rows * cell_height), (17, 24, 39))
+    draw = ImageDraw.Draw(canvas)
+    font = ImageFont.load_default(size=26)
+
+    for index, (data, label) in enumerate(tiles):
+        left = (index % columns) * tile_size
+        top = (index // columns) * cell_height
+        tile = None
+        if data:
+            try:
+                with Image.open(io.BytesIO(data)) as source:
+                    tile = ImageOps.pad(source.convert("RGB"), (tile_size, tile_size), color=(255, 255, 255))
+            except (OSError, ValueError):
+                tile = None
+        if tile is None:
+            tile = Image.new("RGB", (tile_size, tile_size), (51, 65, 85))
+        canvas.paste(tile, (left, top))
+        draw.text((left + 16, top + tile_size + 16), label, fill=(248, 250, 252), font=font)
+
+    output = io.BytesIO()
+    canvas.save(output, format="JPEG", quality=85, optimize=True)
+    return output.getvalue()
+
+
+class CollageDiskCache:
+    # LRU by file mtime: hits are touched, the oldest files go first once over budget.
+    # The directory is scanned once; after that its entries and total size are tracked in
+    # memory, and every file operation runs in a thread, off the event loop.
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries: OrderedDict[str, int] | None = None  # key -> size, least recently used first
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.jpg"
+
+    def _scan(self) -> OrderedDict[str, int]:
+        files = []
+        for item in self.directory.glob("*.jpg"):
+            try:
+                stat = item.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, item.stem, stat.st_size))
+        return OrderedDict((key, size) for _mtime, key, size in sorted(files))
+
+    async def _index(self) -> OrderedDict[str, int]:
+        if self._entries is None:
+            entries = await asyncio.to_thread(self._scan)
+            if self._entries is None:
+                self._entries = entries
+                self._total = sum(entries.values())
+        return self._entries
+
+    @staticmethod
+    def _read(path: Path) -> bytes:
+        data = path.read_bytes()
+        os.utime(path)
+        return data
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        # One temporary file per thread, so concurrent writes of the same key do not collide.
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+    @staticmethod
+    def _unlink(paths: list[Path]) -> None:
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    async def get(self, key: str) -> bytes | None:
+        entries = await self._index()
+        if key not in entries:
+            self.misses += 1
+            return None
+        try:
+            data = await asyncio.to_thread(self._read, self._path(key))
+        except FileNotFoundError:
+            # Removed behind our back; forget it.
+            self._total -= entries.pop(key, 0)
+            self.misses += 1
+            return None
+        if key in entries:
+            entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    async def set(self, key: str, data: bytes) -> None:
+        entries = await self._index()
+        await asyncio.to_thread(self._write, self._path(key), data)
+        self._total += len(data) - entries.pop(key, 0)
+        entries[key] = len(data)
+        stale: list[Path] = []
+        while self._total > self.max_bytes and entries:
+            old_key, size = entries.popitem(last=False)
+            self._total -= size
+            stale.append(self._path(old_key))
+            self.evictions += 1
+        if stale:
+            await asyncio.to_thread(self._unlink, stale)
+
+
+class CollageRenderer:
+    def __init__(
+        self,
+        *,
+        images_dir: str | None,
+        cache_dir: str,
+        cache_max_bytes: int,
+        workers: int,
+        fetch_timeout_seconds: float,
+    ):
+        self.local_images = LocalImageIndex(images_dir)
+        self.cache = CollageDiskCache(cache_dir, cache_max_bytes)
+        self.workers = workers
+        self.fetch_timeout = aiohttp.ClientTimeout(total=fetch_timeout_seconds)
+        self._executor: ProcessPoolExecutor | None = None
+        self._session: aiohttp.ClientSession | None = None
+
+    @staticmethod
+    def cache_key(slots: list[CollageSlot]) -> str:
+        # Signed proxy URLs are re-signed on every response; the key must outlive that.
+        digest = hashlib.sha1()
+        for slot in slots:
+            url = unsigned_url(slot.url) if slot.url else slot.url
+            digest.update(f"{slot.label}\0{url}\0{slot.brand}\0{slot.item}\n".encode())
+        return digest.hexdigest()
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def render(self, slots: list[CollageSlot]) -> tuple[str, bytes]:
+        key = self.cache_key(slots)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return key, cached
+
+        images = await asyncio.gather(*(self._load_image(slot) for slot in slots))
+        tiles = [(data, f"{slot.label}: {slot.brand}"[:32]) for data, slot in zip(images, slots)]
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self._executor, render_collage, tiles)
+        await self.cache.set(key, data)
+        return key, data
+
+    async def _load_image(self, slot: CollageSlot) -> bytes | None:
+        local_path = await self.local_images.find(slot)
+        if local_path is not None:
+            return await asyncio.to_thread(local_path.read_bytes)
+        if not slot.url:
+            return None
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.fetch_timeout)
+        try:
+            async with self._session.get(slot.url) as response:
+                if response.status >= 400 or (response.content_length or 0) > MAX_IMAGE_BYTES:
+                    return None
+                # content.read(n) returns only what is buffered so far; read to EOF under the cap.
+                chunks: list[bytes] = []
+                size = 0
+                async for chunk in response.content.iter_chunked(FETCH_CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > MAX_IMAGE_BYTES:
+                        logger.warning("Collage image %s is over %d bytes", slot.url, MAX_IMAGE_BYTES)
+                        return None
+                    chunks.append(chunk)
+                return b"".join(chunks)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            # A missing tile is drawn as a blank card instead of failing the whole collage.
+            logger.warning("Failed to fetch collage image %s: %s", slot.url, error)
+            return None
@@ -2,18 +2,125 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass
+from pathlib import Path
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_PACK_IMAGES_DIR = REPO_ROOT / "PACK_ALL_CLOTHES" / "images"
+DEFAULT_FALLBACK_CATALOGS = (
+    REPO_ROOT / "PACK_ALL_CLOTHES" / "items.csv",
+    REPO_ROOT / "data" / "end" / "launches-catalog.json",
+)
+
+
+@dataclass(frozen=True)
+class EndpointTimeout:
+    connect: float
+    read: float
+    total: float
+
 
 @dataclass(frozen=True)
 class Settings:
     bot_token: str
     backend_url: str
-    backend_timeout_seconds: int
+    backend_timeout_seconds: float
     bot_secret: str | None
+    bot_mode: str
+    telegram_api_url: str | None
+    webhook_url: str | None
+    webhook_path: str
+    webhook_secret: str | None
+    webhook_host: str
+    webhook_port: int
+    state_backend: str
+    state_max_chats: int
+    state_idle_ttl_seconds: int
+    redis_url: str
+    backend_pool_limit: int
+    backend_pool_limit_per_host: int
+    backend_keepalive_seconds: float
+    backend_dns_ttl_seconds: int
+    backend_timeouts: dict[str, EndpointTimeout]
+    outfit_cache_size: int
+    outfit_cache_ttl_seconds: int
+    generate_user_limit: int
+    generate_global_limit: int
+    prefetch_enabled: bool
+    prefetch_user_reserve: int
+    prefetch_global_reserve: int
+    prefetch_quota_reserve: int
+    max_pending_updates: int
+    max_concurrent_generations: int
+    max_waiting_generations: int
+    admission_max_delay_seconds: float
+    file_id_cache_path: str
+    file_id_cache_size: int
+    collage_enabled: bool
+    pack_images_dir: str
+    collage_cache_dir: str
+    collage_cache_max_bytes: int
+    collage_workers: int
+    image_fetch_timeout_seconds: float
+    image_check_enabled: bool
+    image_check_timeout_seconds: float
+    image_bad_ttl_seconds: float
+    edit_cards: bool
+    streaming_enabled: bool
+    stream_max_connections: int
+    stream_idle_seconds: float
+    send_global_rate: float
+    send_chat_rate: float
+    send_chat_burst: float
+    send_max_retries: int
+    metrics_host: str
+    metrics_port: int
+    backend_max_response_bytes: int
+    workers: int
+    write_queue_path: str
+    write_queue_max_entries: int
+    write_queue_max_age_seconds: float
+    write_queue_flush_interval_seconds: float
+    write_queue_concurrency: int
+    inline_enabled: bool
+    inline_max_styles: int
+    inline_refresh_seconds: float
+    inline_cache_time_seconds: int
+    state_snapshot_path: str | None
+    state_snapshot_interval_seconds: float
+    loop_lag_interval_seconds: float
+    slow_callback_seconds: float
+    admin_ids: frozenset[int]
+    profile_max_seconds: float
+    profile_interval_seconds: float
+    fallback_enabled: bool
+    fallback_catalogs: list[str]
+    handler_deadline_seconds: float
+    breaker_failures: int
+    breaker_open_seconds: float
+    hedge_percentile: float
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    raw = os.getenv(name, "").strip().lower()
+    if not raw:
+        return default
+    return raw in {"1", "true", "yes", "on"}
+
+
+def parse_endpoint_timeout(name: str, default: EndpointTimeout) -> EndpointTimeout:
+    # Format: "connect,read,total" in seconds, e.g. TELEGRAM_BACKEND_GENERATE_TIMEOUT=3,25,30
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    parts = [part.strip() for part in raw.split(",")]
+    if len(parts) != 3:
+        raise ValueError(f"{name} must be connect,read,total")
+    connect, read, total = (float(part) for part in parts)
+    return EndpointTimeout(connect=connect, read=read, total=total)
 
 
 def load_settings() -> Settings:
@@ -21,13 +128,135 @@ def load_settings() -> Settings:
     backend_url = os.getenv("TELEGRAM_BACKEND_URL", "http://localhost:4000").strip().rstrip("/")
     timeout_raw = os.getenv("TELEGRAM_BACKEND_TIMEOUT", "10").strip()
     bot_secret = os.getenv("TELEGRAM_BACKEND_BOT_SECRET", "").strip() or None
+    bot_mode = os.getenv("TELEGRAM_BOT_MODE", "polling").strip().lower()
+    telegram_api_url = os.getenv("TELEGRAM_API_URL", "").strip().rstrip("/") or None
+    webhook_url = os.getenv("TELEGRAM_WEBHOOK_URL", "").strip().rstrip("/") or None
+    webhook_path = os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook").strip()
+    webhook_secret = os.getenv("TELEGRAM_WEBHOOK_SECRET", "").strip() or None
+    webhook_host = os.getenv("TELEGRAM_WEBHOOK_HOST", "0.0.0.0").strip()
+    webhook_port_raw = os.getenv("TELEGRAM_WEBHOOK_PORT", "8080").strip()
+    state_backend = os.getenv("TELEGRAM_STATE_BACKEND", "memory").strip().lower()
+    state_max_chats_raw = os.getenv("TELEGRAM_STATE_MAX_CHATS", "50000").strip()
+    state_idle_ttl_raw = os.getenv("TELEGRAM_STATE_IDLE_TTL", "86400").strip()
+    redis_url = (
+        os.getenv("TELEGRAM_REDIS_URL", "").strip() or os.getenv("REDIS_URL", "redis://localhost:6379").strip()
+    )
+
+    send_global_rate = float(os.getenv("TELEGRAM_SEND_GLOBAL_RATE", "30").strip())
+    send_chat_rate = float(os.getenv("TELEGRAM_SEND_CHAT_RATE", "1").strip())
+    workers = int(os.getenv("TELEGRAM_WORKERS", "1").strip())
+    admin_ids_raw = os.getenv("TELEGRAM_ADMIN_IDS", "").strip()
+    fallback_catalogs_raw = os.getenv("TELEGRAM_FALLBACK_CATALOGS", "").strip()
+
+    backend_timeout = float(timeout_raw)
+    backend_timeouts = {
+        "auth": parse_endpoint_timeout(
+            "TELEGRAM_BACKEND_AUTH_TIMEOUT",
+            EndpointTimeout(connect=3, read=5, total=min(backend_timeout, 8)),
+        ),
+        "generate": parse_endpoint_timeout(
+            "TELEGRAM_BACKEND_GENERATE_TIMEOUT",
+            EndpointTimeout(connect=3, read=backend_timeout, total=backend_timeout),
+        ),
+        "write": parse_endpoint_timeout(
+            "TELEGRAM_BACKEND_WRITE_TIMEOUT",
+            EndpointTimeout(connect=3, read=backend_timeout, total=backend_timeout),
+        ),
+    }
 
     if not bot_token:
         raise ValueError("TELEGRAM_BOT_TOKEN is required")
+    if bot_mode not in {"polling", "webhook"}:
+        raise ValueError("TELEGRAM_BOT_MODE must be polling or webhook")
+    if bot_mode == "webhook" and not webhook_secret:
+        raise ValueError("TELEGRAM_WEBHOOK_SECRET is required in webhook mode")
+    if state_backend not in {"memory", "redis"}:
+        raise ValueError("TELEGRAM_STATE_BACKEND must be memory or redis")
+    if send_global_rate <= 0 or send_chat_rate <= 0:
+        raise ValueError("TELEGRAM_SEND_GLOBAL_RATE and TELEGRAM_SEND_CHAT_RATE must be positive")
+    if workers < 1:
+        raise ValueError("TELEGRAM_WORKERS must be at least 1")
 
     return Settings(
         bot_token=bot_token,
         backend_url=backend_url,
-        backend_timeout_seconds=int(timeout_raw),
+        backend_timeout_seconds=backend_timeout,
         bot_secret=bot_secret,
+        bot_mode=bot_mode,
+        telegram_api_url=telegram_api_url,
+        webhook_url=webhook_url,
+        webhook_path=webhook_path if webhook_path.startswith("/") else f"/{webhook_path}",
+        webhook_secret=webhook_secret,
+        webhook_host=webhook_host,
+        webhook_port=int(webhook_port_raw),
+        state_backend=state_backend,
+        state_max_chats=int(state_max_chats_raw),
+        state_idle_ttl_seconds=int(state_idle_ttl_raw),
+        redis_url=redis_url,
+        backend_pool_limit=int(os.getenv("TELEGRAM_BACKEND_POOL_LIMIT", "200").strip()),
+        backend_pool_limit_per_host=int(os.getenv("TELEGRAM_BACKEND_POOL_LIMIT_PER_HOST", "100").strip()),
+        backend_keepalive_seconds=float(os.getenv("TELEGRAM_BACKEND_KEEPALIVE", "30").strip()),
+        backend_dns_ttl_seconds=int(os.getenv("TELEGRAM_BACKEND_DNS_TTL", "300").strip()),
+        backend_timeouts=backend_timeouts,
+        outfit_cache_size=int(os.getenv("TELEGRAM_OUTFIT_CACHE_SIZE", "10000").strip()),
+        outfit_cache_ttl_seconds=int(os.getenv("TELEGRAM_OUTFIT_CACHE_TTL", "600").strip()),
+        generate_user_limit=int(os.getenv("TELEGRAM_GENERATE_USER_LIMIT", "8").strip()),
+        generate_global_limit=int(os.getenv("TELEGRAM_GENERATE_GLOBAL_LIMIT", "600").strip()),
+        prefetch_enabled=env_flag("TELEGRAM_PREFETCH_ENABLED"),
+        prefetch_user_reserve=int(os.getenv("TELEGRAM_PREFETCH_USER_RESERVE", "4").strip()),
+        prefetch_global_reserve=int(os.getenv("TELEGRAM_PREFETCH_GLOBAL_RESERVE", "100").strip()),
+        prefetch_quota_reserve=int(os.getenv("TELEGRAM_PREFETCH_QUOTA_RESERVE", "10").strip()),
+        max_pending_updates=int(os.getenv("TELEGRAM_MAX_PENDING_UPDATES", "5000").strip()),
+        max_concurrent_generations=int(os.getenv("TELEGRAM_MAX_CONCURRENT_GENERATIONS", "64").strip()),
+        max_waiting_generations=int(os.getenv("TELEGRAM_MAX_WAITING_GENERATIONS", "500").strip()),
+        admission_max_delay_seconds=float(os.getenv("TELEGRAM_ADMISSION_MAX_DELAY", "5").strip()),
+        file_id_cache_path=os.getenv("TELEGRAM_FILE_ID_CACHE_PATH", ".cache/telegram-file-ids.sqlite3").strip(),
+        file_id_cache_size=int(os.getenv("TELEGRAM_FILE_ID_CACHE_SIZE", "50000").strip()),
+        collage_enabled=env_flag("TELEGRAM_COLLAGE_ENABLED"),
+        pack_images_dir=os.getenv("TELEGRAM_PACK_IMAGES_DIR", "").strip() or str(DEFAULT_PACK_IMAGES_DIR),
+        collage_cache_dir=os.getenv("TELEGRAM_COLLAGE_CACHE_DIR", ".cache/collages").strip(),
+        collage_cache_max_bytes=int(os.getenv("TELEGRAM_COLLAGE_CACHE_MB", "256").strip()) * 1024 * 1024,
+        collage_workers=int(os.getenv("TELEGRAM_COLLAGE_WORKERS", "2").strip()),
+        image_fetch_timeout_seconds=float(os.getenv("TELEGRAM_IMAGE_FETCH_TIMEOUT", "5").strip()),
+        image_check_enabled=env_flag("TELEGRAM_IMAGE_CHECK_ENABLED"),
+        image_check_timeout_seconds=float(os.getenv("TELEGRAM_IMAGE_CHECK_TIMEOUT", "1.5").strip()),
+        image_bad_ttl_seconds=float(os.getenv("TELEGRAM_IMAGE_BAD_TTL", "600").strip()),
+        edit_cards=env_flag("TELEGRAM_EDIT_CARDS"),
+        streaming_enabled=env_flag("TELEGRAM_STREAMING_ENABLED"),
+        stream_max_connections=int(os.getenv("TELEGRAM_STREAM_MAX_CONNECTIONS", "500").strip()),
+        stream_idle_seconds=float(os.getenv("TELEGRAM_STREAM_IDLE_SECONDS", "120").strip()),
+        send_global_rate=send_global_rate,
+        send_chat_rate=send_chat_rate,
+        send_chat_burst=float(os.getenv("TELEGRAM_SEND_CHAT_BURST", "3").strip()),
+        send_max_retries=int(os.getenv("TELEGRAM_SEND_MAX_RETRIES", "3").strip()),
+        metrics_host=os.getenv("TELEGRAM_METRICS_HOST", "127.0.0.1").strip(),
+        metrics_port=int(os.getenv("TELEGRAM_METRICS_PORT", "9464").strip()),
+        backend_max_response_bytes=int(os.getenv("TELEGRAM_BACKEND_MAX_RESPONSE_KB", "2048").strip()) * 1024,
+        workers=workers,
+        write_queue_path=os.getenv("TELEGRAM_WRITE_QUEUE_PATH", ".cache/telegram-write-queue.sqlite3").strip(),
+        write_queue_max_entries=int(os.getenv("TELEGRAM_WRITE_QUEUE_MAX", "10000").strip()),
+        write_queue_max_age_seconds=float(os.getenv("TELEGRAM_WRITE_QUEUE_MAX_AGE", "86400").strip()),
+        write_queue_flush_interval_seconds=float(os.getenv("TELEGRAM_WRITE_QUEUE_FLUSH_INTERVAL", "1").strip()),
+        write_queue_concurrency=int(os.getenv("TELEGRAM_WRITE_QUEUE_CONCURRENCY", "8").strip()),
+        inline_enabled=env_flag("TELEGRAM_INLINE_ENABLED"),
+        inline_max_styles=int(os.getenv("TELEGRAM_INLINE_MAX_STYLES", "20").strip()),
+        inline_refresh_seconds=float(os.getenv("TELEGRAM_INLINE_REFRESH_SECONDS", "1800").strip()),
+        inline_cache_time_seconds=int(os.getenv("TELEGRAM_INLINE_CACHE_TIME", "300").strip()),
+        state_snapshot_path=os.getenv("TELEGRAM_STATE_SNAPSHOT_PATH", ".cache/telegram-state.snapshot").strip() or None,
+        state_snapshot_interval_seconds=float(os.getenv("TELEGRAM_STATE_SNAPSHOT_INTERVAL", "300").strip()),
+        loop_lag_interval_seconds=float(os.getenv("TELEGRAM_LOOP_LAG_INTERVAL", "0.5").strip()),
+        slow_callback_seconds=float(os.getenv("TELEGRAM_SLOW_CALLBACK_MS", "100").strip()) / 1000,
+        admin_ids=frozenset(int(part) for part in admin_ids_raw.split(",") if part.strip()),
+        profile_max_seconds=float(os.getenv("TELEGRAM_PROFILE_MAX_SECONDS", "60").strip()),
+        profile_interval_seconds=float(os.getenv("TELEGRAM_PROFILE_INTERVAL_MS", "5").strip()) / 1000,
+        fallback_enabled=env_flag("TELEGRAM_FALLBACK_ENABLED"),
+        fallback_catalogs=(
+            [part.strip() for part in fallback_catalogs_raw.split(",") if part.strip()]
+            if fallback_catalogs_raw
+            else [str(path) for path in DEFAULT_FALLBACK_CATALOGS]
+        ),
+        handler_deadline_seconds=float(os.getenv("TELEGRAM_HANDLER_DEADLINE", "15").strip()),
+        breaker_failures=int(os.getenv("TELEGRAM_BREAKER_FAILURES", "5").strip()),
+        breaker_open_seconds=float(os.getenv("TELEGRAM_BREAKER_OPEN_SECONDS", "30").strip()),
+        hedge_percentile=float(os.getenv("TELEGRAM_BACKEND_HEDGE_PERCENTILE", "0").strip()),
     )
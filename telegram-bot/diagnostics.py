@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from types import FrameType
+from typing import Any, Awaitable, Callable, Coroutine
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+loop_lag_seconds = registry.histogram(
+    "loop_lag_seconds",
+    "How late the event loop woke a timer, i.e. how long it was blocked",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+slow_steps = registry.counter(
+    "slow_steps_total",
+    "Handler steps that held the event loop longer than the slow threshold",
+    ("handler",),
+)
+
+
+class LoopLagMonitor:
+    # A timer that should fire every interval; whatever it fires late by is time the
+    # loop spent running something else without yielding (json.dumps, big renders,
+    # synchronous logging, a blocking call in a handler).
+    def __init__(self, *, interval_seconds: float, warn_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.warn_seconds = warn_seconds
+        self.lag_seconds = 0.0
+        self.lag_seconds_max = 0.0
+        self.stalls = 0
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            lag = max(0.0, loop.time() - expected)
+            self.lag_seconds = lag
+            self.lag_seconds_max = max(self.lag_seconds_max, lag)
+            loop_lag_seconds.observe(lag)
+            if lag >= self.warn_seconds:
+                self.stalls += 1
+                logger.warning("Event loop blocked for %.0f ms", lag * 1000)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "lag_seconds": self.lag_seconds,
+            "lag_seconds_max": self.lag_seconds_max,
+            "stalls": self.stalls,
+        }
+
+
+class _StepTimer:
+    # Drives a handler coroutine step by step; each send()/throw() is one uninterrupted
+    # stretch on the loop, so a long one is the handler itself blocking everybody else.
+    __slots__ = ("_coro", "_name", "_warn_seconds")
+
+    def __init__(self, coro: Coroutine[Any, Any, Any], name: str, warn_seconds: float):
+        self._coro = coro
+        self._name = name
+        self._warn_seconds = warn_seconds
+
+    def __await__(self) -> _StepTimer:
+        return self
+
+    def __iter__(self) -> _StepTimer:
+        return self
+
+    def __next__(self) -> Any:
+        return self.send(None)
+
+    def send(self, value: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return self._coro.send(value)
+        finally:
+            self._check(time.perf_counter() - started)
+
+    def throw(self, *args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return self._coro.throw(*args)
+        finally:
+            self._check(time.perf_counter() - started)
+
+    def close(self) -> None:
+        self._coro.close()
+
+    def _check(self, elapsed: float) -> None:
+        if elapsed >= self._warn_seconds:
+            slow_steps.inc(handler=self._name)
+            logger.warning("Slow callback in handler %s: held the event loop for %.0f ms", self._name, elapsed * 1000)
+
+
+class SlowStepMiddleware(BaseMiddleware):
+    # Inner middleware like HandlerMetricsMiddleware, so the warning can name the handler.
+    def __init__(self, warn_seconds: float):
+        self.warn_seconds = warn_seconds
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        return await _StepTimer(handler(event, data), name, self.warn_seconds)
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    # Samples the event loop thread's stack from a helper thread and returns it in the
+    # folded "frame;frame;frame count" format read by flamegraph.pl, speedscope and inferno.
+    # The loop keeps serving updates while it runs; one profile at a time.
+    def __init__(self, *, max_seconds: float, interval_seconds: float):
+        self.max_seconds = max_seconds
+        self.interval_seconds = interval_seconds
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    async def profile(self, seconds: float) -> str:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("a profile is already running")
+        try:
+            self.runs += 1
+            target = threading.get_ident()
+            duration = min(max(seconds, 0.1), self.max_seconds)
+            stacks = await asyncio.to_thread(self._sample, target, duration)
+        finally:
+            self._lock.release()
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+    def _sample(self, target: int, duration: float) -> TallyCounter[str]:
+        stacks: TallyCounter[str] = TallyCounter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(target)
+            labels: list[str] = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(self.interval_seconds)
+        return stacks
+
+    def stats(self) -> dict[str, Any]:
+        return {"runs": self.runs, "running": int(self._lock.locked())}
+
+
+PROFILER_KEY = web.AppKey("profiler", SamplingProfiler)
+LOOPBACK_ADDRESSES = {"127.0.0.1", "::1"}
+
+
+async def on_profile(request: web.Request) -> web.Response:
+    # Local hook only: the metrics port is usually reachable from the scraper's network.
+    if request.remote not in LOOPBACK_ADDRESSES:
+        raise web.HTTPForbidden(text="profiling is only available from localhost")
+    try:
+        seconds = float(request.query.get("seconds", "10"))
+    except ValueError:
+        raise web.HTTPBadRequest(text="seconds must be a number")
+    try:
+        folded = await request.app[PROFILER_KEY].profile(seconds)
+    except ProfilerBusy as error:
+        raise web.HTTPConflict(text=str(error))
+    return web.Response(text=folded, content_type="text/plain")
+
+
+def add_profile_route(app: web.Application, profiler: SamplingProfiler, path: str = "/debug/profile") -> None:
+    app[PROFILER_KEY] = profiler
+    app.router.add_get(path, on_profile)
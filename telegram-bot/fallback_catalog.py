@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import json
+import logging
+import math
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
+
+import aiohttp
+
+from api_client import BackendError
+from outfit_view import OutfitView
+
+if TYPE_CHECKING:
+    from state import OutfitRequestState
+
+logger = logging.getLogger(__name__)
+
+SLOTS = ("top", "bottom", "outerwear", "shoes", "accessory")
+# Share of the outfit budget each slot aims for; the backend composer weights slots similarly.
+SLOT_SHARES = {"top": 0.2, "bottom": 0.2, "outerwear": 0.3, "shoes": 0.22, "accessory": 0.08}
+# Same ranges as the backend BudgetEngineService for the non-custom modes.
+BUDGET_RANGES = {"cheaper": (80, 700), "premium": (700, 8000), "luxury": (900, 9000)}
+# Items on either side of the target price that a pick is drawn from, so Regenerate varies.
+PICK_SPREAD = 4
+EXPLANATION = "Picked from the local catalog while the stylist service is unavailable; scores are not computed."
+
+
+def is_backend_unavailable(error: BaseException) -> bool:
+    # Timeouts, refused connections and 5xx mean "try the local catalog"; 4xx are real answers.
+    if isinstance(error, BackendError):
+        return error.status >= 500
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError))
+
+
+def _http_url(value: Any) -> str | None:
+    return value if isinstance(value, str) and value.startswith(("http://", "https://")) else None
+
+
+def _norm(value: str) -> str:
+    return " ".join(value.split()).lower()
+
+
+def read_end_catalog(path: Path) -> Iterator[tuple[str, str, str, float, str | None, str | None, list[str]]]:
+    # data/end/launches-catalog.json: a list of {brand, category, title, price, productUrl, imageUrl, styleTags}.
+    for item in json.loads(path.read_bytes()):
+        yield (
+            item.get("brand") or "",
+            item.get("title") or "",
+            item.get("category") or "",
+            item.get("price") or 0,
+            _http_url(item.get("productUrl")),
+            _http_url(item.get("imageUrl")),
+            list(item.get("styleTags") or []),
+        )
+
+
+def read_pack_table(path: Path) -> Iterator[tuple[str, str, str, float, str | None, str | None, list[str]]]:
+    # PACK_ALL_CLOTHES/items.csv from `npm --workspace backend run catalog:export:pack`.
+    with path.open(newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            try:
+                price = float(row.get("price") or 0)
+            except ValueError:
+                continue
+            yield (
+                row.get("brand") or "",
+                row.get("title") or "",
+                row.get("category") or "",
+                price,
+                _http_url(row.get("product_url")),
+                _http_url(row.get("image_original_url")),
+                [tag for tag in (row.get("style_tags") or "").split("|") if tag],
+            )
+
+
+class CatalogIndex:
+    # Column arrays (one list per field, prices in a typed array) plus, per category and
+    # per (category, style tag), the row ids sorted by price next to their prices, so a
+    # budget window is two bisections.
+    def __init__(self) -> None:
+        self.brands: list[str] = []
+        self.titles: list[str] = []
+        self.categories: list[str] = []
+        self.prices = array("d")
+        self.links: list[str | None] = []
+        self.images: list[str | None] = []
+        self._slices: dict[tuple[str, str | None], tuple[array, array]] = {}
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    @classmethod
+    def build(cls, rows: Iterable[tuple[str, str, str, float, str | None, str | None, list[str]]]) -> CatalogIndex:
+        index = cls()
+        groups: dict[tuple[str, str | None], list[int]] = defaultdict(list)
+        seen: set[tuple[str, str]] = set()
+        for brand, title, category, price, link, image, tags in rows:
+            category = _norm(category)
+            if category not in SLOT_SHARES or price <= 0 or not title or (brand, title) in seen:
+                continue
+            seen.add((brand, title))
+            row = len(index.prices)
+            index.brands.append(sys.intern(brand))
+            index.titles.append(title)
+            index.categories.append(sys.intern(category))
+            index.prices.append(float(price))
+            index.links.append(link)
+            index.images.append(image)
+            groups[(category, None)].append(row)
+            for tag in {_norm(tag) for tag in tags}:
+                groups[(category, sys.intern(tag))].append(row)
+        prices = index.prices
+        for key, rows_in_group in groups.items():
+            rows_in_group.sort(key=prices.__getitem__)
+            index._slices[key] = (array("d", (prices[row] for row in rows_in_group)), array("I", rows_in_group))
+        return index
+
+    @classmethod
+    def load(cls, paths: Iterable[str]) -> CatalogIndex:
+        def rows() -> Iterator[tuple[str, str, str, float, str | None, str | None, list[str]]]:
+            for raw in paths:
+                path = Path(raw)
+                if not path.is_file():
+                    logger.info("Fallback catalog %s not found, skipping", path)
+                    continue
+                yield from (read_pack_table(path) if path.suffix == ".csv" else read_end_catalog(path))
+
+        return cls.build(rows())
+
+    def pick(self, category: str, tag: str | None, low: float, high: float, target: float, rng: random.Random) -> int:
+        # Rows of the style if it has any in this category, else the whole category.
+        prices, rows = self._slices.get((category, tag)) or self._slices.get((category, None)) or ((), ())
+        if not rows:
+            return -1
+        first = bisect_left(prices, low)
+        last = bisect_right(prices, high)
+        if first >= last:
+            # Nothing inside the slot's range: take the items nearest to it.
+            first, last = 0, len(rows)
+        center = min(max(bisect_left(prices, target, first, last), first), last - 1)
+        return rows[rng.randrange(max(first, center - PICK_SPREAD), min(last, center + PICK_SPREAD + 1))]
+
+    def piece(self, row: int) -> dict[str, Any]:
+        image = self.images[row]
+        price = self.prices[row]
+        return {
+            "brand": self.brands[row],
+            "item": self.titles[row],
+            "category": self.categories[row],
+            "price": int(price) if price.is_integer() else price,
+            "reference_link": self.links[row],
+            "image": {"medium": image, "high_res": image} if image else None,
+            "image_url": image,
+        }
+
+    def compose(self, req: OutfitRequestState, rng: random.Random) -> dict[str, Any] | None:
+        if req.budget_mode == "custom":
+            low, high = req.budget_min or 100, req.budget_max or 1000
+        else:
+            low, high = BUDGET_RANGES["luxury" if req.luxury_only else req.budget_mode]
+        # Geometric middle of the range: $237 for cheaper, $2366 for premium.
+        target = math.sqrt(max(low, 1) * max(high, 1))
+        tag = _norm(req.style)
+        slots: dict[str, dict[str, Any]] = {}
+        for category in SLOTS:
+            share = SLOT_SHARES[category]
+            row = self.pick(category, tag, low * share, high * share, target * share, rng)
+            if row < 0:
+                return None
+            slots[category] = self.piece(row)
+        accessory = slots.pop("accessory")
+        total = sum(piece["price"] for piece in slots.values()) + accessory["price"]
+        return {
+            **slots,
+            "accessories": [accessory],
+            "total_price": int(total) if float(total).is_integer() else round(total, 2),
+            "style": tag,
+            "weather_context": req.city,
+            "budget_range": f"${low}-${high}",
+            "explanation": EXPLANATION,
+            "scores": {},
+            "fallback": True,
+        }
+
+
+class FallbackGenerator:
+    # Degraded-mode outfits for when /outfits/generate times out or fails with 5xx.
+    # The catalog is indexed once, in a thread, when the bot starts.
+    def __init__(self, paths: list[str], seed: int | None = None):
+        self.paths = paths
+        self.index: CatalogIndex | None = None
+        self.build_seconds = 0.0
+        self.served = 0
+        self.unavailable = 0
+        self._rng = random.Random(seed)
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.load())
+
+    async def load(self) -> None:
+        started = time.perf_counter()
+        try:
+            self.index = await asyncio.to_thread(CatalogIndex.load, self.paths)
+        except Exception as error:
+            logger.warning("Failed to index the fallback catalog: %s", error)
+            return
+        self.build_seconds = time.perf_counter() - started
+        logger.info("Fallback catalog indexed: %s items in %.0f ms", len(self.index), self.build_seconds * 1000)
+
+    def generate(self, req: OutfitRequestState) -> OutfitView | None:
+        outfit = self.index.compose(req, self._rng) if self.index is not None else None
+        if outfit is None:
+            self.unavailable += 1
+            return None
+        self.served += 1
+        return OutfitView.from_payload(outfit)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "items": len(self.index) if self.index is not None else 0,
+            "build_seconds": self.build_seconds,
+            "served": self.served,
+            "unavailable": self.unavailable,
+        }
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Iterable
+
+import aiohttp
+
+from cache import TTLCache
+from collage import CollageSlot, LocalImageIndex
+from media_cache import proxy_origin
+from outfit_view import OutfitPiece
+
+logger = logging.getLogger(__name__)
+
+# Telegram fetches photos sent by URL only up to 5 MB.
+PHOTO_URL_MAX_BYTES = 5 * 1024 * 1024
+LOCAL_VARIANT = "local"
+# Known-good URLs are rechecked after this long; bad ones after `bad_ttl_seconds`.
+# A bad URL is either gone (the origin answered with an error or not an image) or
+# unreachable from here (timeout, connection error, or refused to a non-browser client).
+GONE = "gone"
+UNREACHABLE = "unreachable"
+GOOD_TTL_SECONDS = 300.0
+MAX_ENTRIES = 20_000
+# Telegram fetches photo URLs itself, with its own user agent and none of the browser
+# headers the backend media proxy sends. Origins are probed the same way, so an origin
+# that only serves browsers goes through the proxy instead of failing in sendMediaGroup.
+PROBE_HEADERS = {"User-Agent": "TelegramBot (like TwitterBot)"}
+# Statuses of an origin that refuses this client but may still serve the proxy.
+REFUSED_STATUSES = (401, 403, 429)
+
+
+class ImageChecker:
+    # Picks, per album photo, a source Telegram will be able to fetch: the origin if it
+    # answered a Telegram-like probe within PHOTO_URL_MAX_BYTES; for an oversized origin
+    # the backend's resized medium proxy URL; then the local PACK_ALL_CLOTHES image;
+    # then, if the origin was only unreachable from here, the signed proxy URL. A photo
+    # whose origin is gone is left out.
+    # Origins are probed together with HEAD (ranged GET when HEAD is refused); proxy URLs
+    # are not probed, since that would spend the proxy's rate limit and fetch the image.
+    def __init__(self, *, local_images: LocalImageIndex, timeout_seconds: float, bad_ttl_seconds: float):
+        self.local_images = local_images
+        self.timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+        self.bad: TTLCache[str] = TTLCache(MAX_ENTRIES, bad_ttl_seconds)
+        self.sizes: TTLCache[int] = TTLCache(MAX_ENTRIES, GOOD_TTL_SECONDS)
+        self._inflight: dict[str, asyncio.Task[int | None]] = {}
+        self._session: aiohttp.ClientSession | None = None
+        self.probes = 0
+        self.failed = 0
+        self.skipped_bad = 0
+        self.swapped_local = 0
+        self.swapped_proxy = 0
+        self.swapped_resized = 0
+        self.dropped = 0
+
+    async def probe(self, url: str) -> int | None:
+        # Reported size in bytes (0 when the server does not say), or None if unusable.
+        if url in self.bad:
+            self.skipped_bad += 1
+            return None
+        size = self.sizes.get(url)
+        if size is not None:
+            return size
+        task = self._inflight.get(url)
+        if task is None:
+            task = self._inflight[url] = asyncio.ensure_future(self._probe(url))
+            task.add_done_callback(lambda _done: self._inflight.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def _probe(self, url: str) -> int | None:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout, headers=PROBE_HEADERS)
+        self.probes += 1
+        try:
+            async with self._session.head(url, allow_redirects=True) as response:
+                status, headers = response.status, response.headers
+            if status in (403, 405, 501):
+                # Some CDNs refuse HEAD; one byte of the body tells the same.
+                async with self._session.get(url, headers={"Range": "bytes=0-0"}) as response:
+                    status, headers = response.status, response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            logger.info("Image probe failed for %s: %s", url, error)
+            self.failed += 1
+            self.bad.set(url, UNREACHABLE)
+            return None
+        if status in REFUSED_STATUSES:
+            self.failed += 1
+            self.bad.set(url, UNREACHABLE)
+            return None
+        if not 200 <= status < 400 or not headers.get("Content-Type", "image/").startswith("image/"):
+            self.failed += 1
+            self.bad.set(url, GONE)
+            return None
+        total = headers.get("Content-Range", "").rpartition("/")[2]
+        size = int(total) if total.isdigit() else int(headers.get("Content-Length") or 0)
+        self.sizes.set(url, size)
+        return size
+
+    async def choose(self, pieces: Iterable[OutfitPiece]) -> list[tuple[str, str] | None]:
+        # One (url or local path, variant) per piece, or None when nothing usable is left.
+        pieces = list(pieces)
+        candidates = [self._candidates(piece) for piece in pieces]
+        origins = {origin for options in candidates for origin, _url, _variant in options}
+        sizes = dict(zip(origins, await asyncio.gather(*(self.probe(origin) for origin in origins))))
+        choices: list[tuple[str, str] | None] = []
+        for piece, options in zip(pieces, candidates):
+            choice = next(
+                (
+                    (origin, variant)
+                    for origin, _url, variant in options
+                    if sizes[origin] is not None and sizes[origin] <= PHOTO_URL_MAX_BYTES
+                ),
+                None,
+            )
+            if choice is None:
+                choice = await self._substitute(piece, options, sizes)
+            choices.append(choice)
+        return choices
+
+    @staticmethod
+    def _candidates(piece: OutfitPiece) -> list[tuple[str, str, str]]:
+        # (origin to probe and send, URL from the payload, variant), high_res before medium.
+        # Proxied renditions share one origin; both are kept, since only the proxy resizes.
+        options: list[tuple[str, str, str]] = []
+        for url, variant in ((piece.image_url, piece.image_variant), (piece.collage_url, "medium")):
+            if url is not None and all(url != seen for _origin, seen, _variant in options):
+                options.append((proxy_origin(url) or url, url, variant))
+        return options
+
+    async def _substitute(
+        self,
+        piece: OutfitPiece,
+        options: list[tuple[str, str, str]],
+        sizes: dict[str, int | None],
+    ) -> tuple[str, str] | None:
+        # The origin is there but too big for Telegram: the proxy's medium rendition is resized.
+        resized = next(
+            (
+                (url, variant)
+                for origin, url, variant in options
+                if variant == "medium" and proxy_origin(url) and (sizes.get(origin) or 0) > PHOTO_URL_MAX_BYTES
+            ),
+            None,
+        )
+        if resized is not None:
+            self.swapped_resized += 1
+            return resized
+        local_path = await self.local_images.find(
+            CollageSlot(
+                label=piece.label,
+                url=None,
+                brand=piece.brand or "",
+                item=piece.item or "",
+                category=piece.category or piece.label.split()[0].lower(),
+            )
+        )
+        if local_path is not None:
+            self.swapped_local += 1
+            return str(local_path), LOCAL_VARIANT
+        # The backend may reach an origin the bot cannot; one that answered 404 is gone for both.
+        proxied = next(
+            (
+                (url, variant)
+                for origin, url, variant in options
+                if proxy_origin(url) and self.bad.get(origin) == UNREACHABLE
+            ),
+            None,
+        )
+        if proxied is not None:
+            self.swapped_proxy += 1
+            return proxied
+        self.dropped += 1
+        return None
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "probes": self.probes,
+            "failed": self.failed,
+            "skipped_bad": self.skipped_bad,
+            "bad_urls": len(self.bad),
+            "swapped_local": self.swapped_local,
+            "swapped_proxy": self.swapped_proxy,
+            "swapped_resized": self.swapped_resized,
+            "dropped": self.dropped,
+        }
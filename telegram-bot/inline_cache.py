@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+
+from api_client import BackendAuthError, BackendClient, BackendError, BackendSession, TokenManager
+from outfit_view import OutfitView
+from prefetch import Entitlement, RateWindow
+from state import OutfitRequestState, apply_budget_action
+
+logger = logging.getLogger(__name__)
+
+# Every featured style is kept warm in the variants behind the Cheaper and Luxury buttons;
+# Luxury only when the bot's backend account has luxury-only mode (premium).
+INLINE_BUDGET_ACTIONS = ("cheaper", "premium")
+RETRY_SECONDS = 60.0
+WARM_KEY = "inline"
+
+
+def normalize_style(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+class StyleIndex:
+    # Sorted (word suffix, style) pairs: "old money" is found by "ol" and by "mon".
+    # A query is one bisect plus a walk over the matching run.
+    def __init__(self, styles: list[str]):
+        self.styles = styles
+        keys: list[tuple[str, str]] = []
+        for style in styles:
+            words = style.split(" ")
+            keys.extend((" ".join(words[start:]), style) for start in range(len(words)))
+        keys.sort()
+        self._keys = keys
+
+    def match(self, query: str, limit: int) -> list[str]:
+        query = normalize_style(query)
+        if not query:
+            return self.styles[:limit]
+        found: list[str] = []
+        for key, style in self._keys[bisect.bisect_left(self._keys, (query,)) :]:
+            if not key.startswith(query) or len(found) >= limit:
+                break
+            if style not in found:
+                found.append(style)
+        return found
+
+
+class InlineOutfitCache:
+    # Ready outfits for the backend's featured styles, generated in the background under
+    # the bot's own backend account so inline queries are answered from memory. Warm-ups
+    # spend that account's daily generate quota, so each refresh stops when it runs out.
+    def __init__(
+        self,
+        backend: BackendClient,
+        tokens: TokenManager,
+        *,
+        telegram_id: str,
+        user_window: RateWindow,
+        global_window: RateWindow,
+        global_reserve: int,
+        max_styles: int,
+        refresh_seconds: float,
+    ):
+        self.backend = backend
+        self.tokens = tokens
+        self.telegram_id = telegram_id
+        self.user_window = user_window
+        self.global_window = global_window
+        self.global_reserve = global_reserve
+        self.max_styles = max_styles
+        self.refresh_seconds = refresh_seconds
+        self.index = StyleIndex([])
+        self._outfits: dict[str, dict[str, OutfitView]] = {}  # style -> budget action -> outfit
+        self._session: BackendSession | None = None
+        self._task: asyncio.Task[None] | None = None
+        self.queries = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.generated = 0
+        self.generate_failures = 0
+        self.skipped_quota = 0
+        self.refreshed_at: float | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def match(self, query: str, limit: int) -> list[OutfitView]:
+        self.queries += 1
+        outfits = [
+            outfit
+            for style in self.index.match(query, limit)
+            for outfit in self._outfits.get(style, {}).values()
+        ][:limit]
+        if outfits:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return outfits
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+                delay = self.refresh_seconds
+            except Exception as error:
+                self.refresh_failures += 1
+                logger.warning("Inline outfit refresh failed: %s", error)
+                delay = RETRY_SECONDS
+            await asyncio.sleep(delay)
+
+    async def refresh(self) -> None:
+        styles: list[str] = []
+        for name in await self.backend.featured_styles():
+            style = normalize_style(name)
+            if style and style not in styles:
+                styles.append(style)
+        styles = styles[: self.max_styles]
+        # New styles become searchable at once; their outfits appear as they are generated.
+        self.index = StyleIndex(styles)
+        self._outfits = {style: outfits for style, outfits in self._outfits.items() if style in styles}
+        entitlement = Entitlement.from_subscription(await self._call(self.backend.subscription))
+        skipped = 0
+        # Cheaper outfits for every style first, so a small quota still covers them all.
+        for action in INLINE_BUDGET_ACTIONS:
+            for style in styles:
+                req = apply_budget_action(OutfitRequestState(style=style), action)
+                if not entitlement.allows(req):
+                    continue
+                if entitlement.remaining is not None and entitlement.remaining <= 0:
+                    skipped += 1
+                    continue
+                try:
+                    outfit = await self._generate(req)
+                except (BackendError, asyncio.TimeoutError, aiohttp.ClientError) as error:
+                    self.generate_failures += 1
+                    logger.warning("Inline outfit for %r (%s) not refreshed: %s", style, action, error)
+                    continue
+                if entitlement.remaining is not None:
+                    entitlement.remaining -= 1
+                # Variants that failed or ran out of quota keep serving their previous outfit.
+                self._outfits.setdefault(style, {})[action] = outfit
+        if skipped:
+            self.skipped_quota += skipped
+            logger.info("Inline warm-up quota used up; %d outfits not refreshed", skipped)
+        self.refreshes += 1
+        self.refreshed_at = time.monotonic()
+
+    async def _generate(self, req: OutfitRequestState) -> OutfitView:
+        # Stay inside the backend's per-user generate limit, and leave the global
+        # budget to users when it runs low.
+        while True:
+            delay = self.user_window.retry_after(WARM_KEY)
+            if delay <= 0 and self.global_window.remaining("global") > self.global_reserve:
+                break
+            await asyncio.sleep(max(delay, 1.0))
+        self.user_window.record(WARM_KEY)
+        self.global_window.record("global")
+
+        data = await self._call(lambda access_token: self._request(req, access_token))
+        self.generated += 1
+        return OutfitView.from_payload(data)
+
+    async def _call(self, fn: Callable[[str], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        self._session = await self.tokens.ensure_fresh(int(self.telegram_id), self._session, self.telegram_id, None)
+        try:
+            return await fn(self._session.access_token)
+        except BackendAuthError:
+            self._session = await self.tokens.refresh(int(self.telegram_id), self._session, self.telegram_id, None)
+            return await fn(self._session.access_token)
+
+    async def _request(self, req: OutfitRequestState, access_token: str) -> dict[str, Any]:
+        return await self.backend.generate_outfit(
+            access_token,
+            style=req.style,
+            occasion=req.occasion,
+            city=req.city,
+            budget_mode=req.budget_mode,
+            luxury_only=req.luxury_only,
+            speculative=True,
+        )
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "styles": len(self.index.styles),
+            "outfits": sum(len(outfits) for outfits in self._outfits.values()),
+            "queries": self.queries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "generated": self.generated,
+            "generate_failures": self.generate_failures,
+            "skipped_quota": self.skipped_quota,
+            "refresh_age_seconds": time.monotonic() - self.refreshed_at if self.refreshed_at is not None else 0.0,
+        }
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
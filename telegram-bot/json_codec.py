@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional speedup; the standard library is the fallback
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data: bytes | str) -> Any:
+    # Both backends raise a ValueError subclass on malformed input.
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    # Compact UTF-8, the same bytes whichever backend is installed.
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def dumps_str(value: Any) -> str:
+    # aiohttp's json_serialize hook expects str.
+    return dumps(value).decode()
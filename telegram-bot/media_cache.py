@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+MediaKey = tuple[str, str]
+
+PROXY_PATH = "/api/media/proxy"
+# Query parameters of backend media proxy URLs that change on every response.
+SIGNED_URL_PARAMS = frozenset({"exp", "sig"})
+# How long a write waits for another process holding the database lock.
+BUSY_TIMEOUT_SECONDS = 5.0
+
+
+def proxy_origin(url: str) -> str | None:
+    # The product image behind a backend /api/media/proxy URL, or None for any other URL.
+    parts = urlsplit(url)
+    if not parts.path.endswith(PROXY_PATH):
+        return None
+    origin = parse_qs(parts.query).get("url", [""])[0]
+    return origin if origin.startswith(("http://", "https://")) else None
+
+
+def unsigned_url(url: str) -> str:
+    # The URL without its per-response signature: the same image keeps the same string.
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if not any(name in SIGNED_URL_PARAMS for name, _value in query):
+        return url
+    return urlunsplit(parts._replace(query=urlencode([item for item in query if item[0] not in SIGNED_URL_PARAMS])))
+
+
+class FileIdCache:
+    # Maps (image URL, variant) to the Telegram file_id returned by the first successful
+    # upload, so repeat sends skip Telegram's download of the remote image.
+    # Lookups are served from memory; sqlite keeps the mapping across restarts. Loading
+    # and writes run in a thread, and writes made while one is in progress go out
+    # together in the next transaction. A database error is logged and the cache carries
+    # on in memory, so it can never fail a send.
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries: OrderedDict[MediaKey, str] = OrderedDict()
+        self._pending: dict[MediaKey, str | None] = {}  # None deletes the row
+        self._loaded = False
+        self._db: sqlite3.Connection | None = None
+        self._task: asyncio.Task[None] | None = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(key: MediaKey) -> MediaKey:
+        # Proxy URLs carry a fresh exp/sig in every payload; the image is the origin behind them.
+        url, variant = key
+        return proxy_origin(url) or url, variant
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is not None:
+            return self._db
+        if self.path != ":memory:":
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        # Used from worker threads, one operation at a time (see _sync).
+        db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids ("
+                "url TEXT NOT NULL, variant TEXT NOT NULL, file_id TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (url, variant))"
+            )
+        except sqlite3.Error:
+            db.close()
+            raise
+        self._db = db
+        return db
+
+    def _load(self) -> list[tuple[str, str, str]]:
+        # About 170 ms for a full 50k-entry cache, hence the thread: the first replies after
+        # a restart are sent (uncached) while it runs.
+        return self._connect().execute(
+            "SELECT url, variant, file_id FROM file_ids ORDER BY updated_at DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+
+    def _write(self, batch: dict[MediaKey, str | None]) -> None:
+        db = self._connect()
+        now = time.time()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO file_ids (url, variant, file_id, updated_at) VALUES (?, ?, ?, ?)",
+                [(url, variant, file_id, now) for (url, variant), file_id in batch.items() if file_id is not None],
+            )
+            db.executemany(
+                "DELETE FROM file_ids WHERE url = ? AND variant = ?",
+                [key for key, file_id in batch.items() if file_id is None],
+            )
+
+    def _start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sync())
+
+    async def _sync(self) -> None:
+        if not self._loaded:
+            try:
+                rows = await asyncio.to_thread(self._load)
+            except sqlite3.Error as error:
+                self.errors += 1
+                logger.warning("File id cache %s unavailable, keeping file ids in memory: %s", self.path, error)
+                rows = []
+            self._loaded = True
+            # Entries set (or dropped) while loading are newer than anything on disk.
+            loaded = OrderedDict(
+                ((url, variant), file_id)
+                for url, variant, file_id in reversed(rows)
+                if (url, variant) not in self._entries and (url, variant) not in self._pending
+            )
+            loaded.update(self._entries)
+            self._entries = loaded
+            self._evict()
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except sqlite3.Error as error:
+                self.errors += 1
+                logger.warning("Failed to persist %d file ids: %s", len(batch), error)
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            key, _file_id = self._entries.popitem(last=False)
+            self._pending[key] = None
+            self.evictions += 1
+
+    def get(self, key: MediaKey) -> str | None:
+        if not self._loaded:
+            self._start()
+        key = self._key(key)
+        file_id = self._entries.get(key)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return file_id
+
+    def set_many(self, items: dict[MediaKey, str]) -> None:
+        for key, file_id in items.items():
+            key = self._key(key)
+            if self._entries.get(key) != file_id:
+                self._pending[key] = file_id
+            self._entries[key] = file_id
+            self._entries.move_to_end(key)
+        self._evict()
+        if self._pending:
+            self._start()
+
+    def invalidate(self, keys: list[MediaKey]) -> None:
+        for key in keys:
+            key = self._key(key)
+            if self._entries.pop(key, None) is not None:
+                self._pending[key] = None
+                self.invalidations += 1
+        if self._pending:
+            self._start()
+
+    async def close(self) -> None:
+        # Writes still queued are flushed first.
+        if self._pending:
+            self._start()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._db is not None:
+            await asyncio.to_thread(self._db.close)
+            self._db = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "pending_writes": len(self._pending),
+            "errors": self.errors,
+        }
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import inspect
+import logging
+import math
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Union
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Same text exposition format the backend serves from /health/metrics.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "gothyxan_bot_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Collector = Callable[[], Union[dict[str, Any], Awaitable[dict[str, Any]]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts..., +Inf count], sum.
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total[0])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = PREFIX):
+        self.prefix = prefix
+        self._metrics: list[Counter | Histogram] = []
+        self._collectors: list[tuple[str, Collector]] = []
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(f"{self.prefix}{name}", help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(f"{self.prefix}{name}", help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, component: str, collect: Collector) -> None:
+        # Components keep their own counters in stats(); every numeric field is
+        # exported as a gauge "<prefix><component>_<field>" at scrape time.
+        self._collectors.append((component, collect))
+
+    async def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for component, collect in self._collectors:
+            try:
+                stats = collect()
+                if inspect.isawaitable(stats):
+                    stats = await stats
+            except Exception as error:
+                logger.warning("Metrics collector %s failed: %s", component, error)
+                continue
+            for field, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.prefix}{component}_{field}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+handler_seconds = registry.histogram(
+    "handler_seconds",
+    "Telegram update handler latency",
+    ("handler",),
+)
+handler_errors = registry.counter(
+    "handler_errors_total",
+    "Telegram update handlers that raised",
+    ("handler",),
+)
+backend_request_seconds = registry.histogram(
+    "backend_request_seconds",
+    "Backend API request latency",
+    ("method", "path"),
+)
+backend_errors = registry.counter(
+    "backend_errors_total",
+    "Backend API requests that failed, by HTTP status or error kind",
+    ("method", "path", "status"),
+)
+media_sends = registry.counter(
+    "media_sends_total",
+    "Outfit media deliveries by kind and outcome",
+    ("kind", "outcome"),
+)
+card_updates = registry.counter(
+    "card_updates_total",
+    "Outfit cards shown, by whether the current card was edited in place or a new one sent",
+    ("outcome",),
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # Inner middleware: runs after filters matched, so data["handler"] is the handler that will run.
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(handler=name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, handler=name)
+
+
+METRICS_REGISTRY_KEY = web.AppKey("metrics_registry", MetricsRegistry)
+
+
+async def on_metrics(request: web.Request) -> web.Response:
+    body = await request.app[METRICS_REGISTRY_KEY].render()
+    return web.Response(body=body.encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+def add_metrics_route(app: web.Application, metrics: MetricsRegistry, path: str = "/metrics") -> None:
+    app[METRICS_REGISTRY_KEY] = metrics
+    app.router.add_get(path, on_metrics)
+
+
+async def start_metrics_server(
+    metrics: MetricsRegistry,
+    host: str,
+    port: int,
+    setup: Callable[[web.Application], None] | None = None,
+) -> web.AppRunner:
+    app = web.Application()
+    add_metrics_route(app, metrics)
+    if setup is not None:
+        setup(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("Metrics endpoint listening on %s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import TYPE_CHECKING, Any
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    AnswerInlineQuery,
+    EditMessageCaption,
+    EditMessageMedia,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    SendMediaGroup,
+    TelegramMethod,
+)
+from aiogram.methods.base import Response, TelegramType
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_MESSAGE = 0
+PRIORITY_EDIT = 1
+# Answers to callback/inline queries are not messages and do not count against the send limits.
+UNTHROTTLED_METHODS = (AnswerCallbackQuery, AnswerInlineQuery)
+EDIT_METHODS = (EditMessageText, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay_for(self, amount: float) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        blocked = max(0.0, self.blocked_until - now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(blocked, missing / self.rate if missing > 0 else 0.0)
+
+    def take(self, amount: float) -> None:
+        # A call heavier than the burst waits only for a full bucket, then leaves it in
+        # debt, so the calls after it pay for the whole weight.
+        self.tokens -= amount
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    # Session middleware in front of every Bot API call that targets a chat:
+    # per-chat bucket (Telegram allows ~1 msg/s per chat), then a global bucket
+    # (~30 msg/s) served in priority order (new messages before edits), with media
+    # groups weighted by size in both.
+    # Flood-control errors block the affected bucket for RetryAfter and are retried.
+    # Telegram does not say which limit tripped: a chat that had sent nothing else
+    # within its bucket window cannot have hit its own limit, so that RetryAfter is
+    # taken as bot-wide and blocks the global bucket too.
+    def __init__(
+        self,
+        *,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_retries: int,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chat_buckets: dict[int | str, TokenBucket] = {}
+        self._queue: list[tuple[int, int, asyncio.Future[None], float]] = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: asyncio.Task[None] | None = None
+        self.chat_waiting = 0
+        self.sent = 0
+        self.retries = 0
+        self.global_blocks = 0
+        self.delay_seconds_total = 0.0
+        self.delay_seconds_max = 0.0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or isinstance(method, UNTHROTTLED_METHODS):
+            # getUpdates, setWebhook, getMe and query answers are not rate limited per chat.
+            return await make_request(bot, method)
+
+        weight = len(method.media) if isinstance(method, SendMediaGroup) else 1
+        priority = PRIORITY_EDIT if isinstance(method, EDIT_METHODS) else PRIORITY_MESSAGE
+        chat_busy = False
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            busy = await self._chat_slot(chat_id, weight)
+            # A retry finds the chat bucket refilled by the wait; keep the first call's reading.
+            chat_busy = busy if attempt == 0 else chat_busy
+            await self._global_slot(weight, priority)
+            self._record_delay(time.monotonic() - started)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as error:
+                # Blocked even when giving up, so the next sends respect retry_after too.
+                self._chat_bucket(chat_id).block(error.retry_after)
+                if not chat_busy:
+                    self.global_blocks += 1
+                    self.global_bucket.block(error.retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning(
+                    "Telegram flood control (%s), retrying in %ss: %s",
+                    "chat" if chat_busy else "global",
+                    error.retry_after,
+                    error,
+                )
+                continue
+            self.sent += 1
+            return response
+        raise RuntimeError("unreachable")
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10_000:
+                self._chat_buckets = {key: value for key, value in self._chat_buckets.items() if not value.idle()}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _chat_slot(self, chat_id: int | str, weight: float) -> bool:
+        # True when the chat had spent part of its bucket before this call.
+        bucket = self._chat_bucket(chat_id)
+        self.chat_waiting += 1
+        try:
+            while (delay := bucket.delay_for(weight)) > 0:
+                await asyncio.sleep(delay)
+            busy = bucket.tokens < bucket.capacity
+            bucket.take(weight)
+        finally:
+            self.chat_waiting -= 1
+        return busy
+
+    async def _global_slot(self, weight: float, priority: int) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future, weight))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self) -> None:
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            _priority, _seq, future, weight = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            delay = self.global_bucket.delay_for(weight)
+            if delay > 0:
+                # Re-check the head after the wait: a higher-priority call may have arrived.
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._queue)
+            self.global_bucket.take(weight)
+            future.set_result(None)
+
+    def _record_delay(self, seconds: float) -> None:
+        self.delay_seconds_total += seconds
+        self.delay_seconds_max = max(self.delay_seconds_max, seconds)
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": len(self._queue) + self.chat_waiting,
+            "global_queue": len(self._queue),
+            "chat_waiting": self.chat_waiting,
+            "sent": self.sent,
+            "retries": self.retries,
+            "global_blocks": self.global_blocks,
+            "delay_seconds_avg": self.delay_seconds_total / self.sent if self.sent else 0.0,
+            "delay_seconds_max": self.delay_seconds_max,
+        }
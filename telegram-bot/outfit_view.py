@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import base64
+import sys
+import zlib
+from dataclasses import dataclass, field
+from typing import Any
+
+import json_codec
+
+MAIN_SLOTS = (("Top", "top"), ("Bottom", "bottom"), ("Outerwear", "outerwear"), ("Shoes", "shoes"))
+MAX_ACCESSORIES = 3
+SCORE_KEYS = ("style_coherence", "budget_efficiency", "weather_compatibility")
+
+
+def _text(value: Any) -> str | None:
+    return None if value is None or value == "" else str(value)
+
+
+def _intern(value: Any) -> str | None:
+    # Brands, categories and variants repeat across thousands of chats; share one copy.
+    text = _text(value)
+    return sys.intern(text) if text is not None else None
+
+
+def _http_url(value: Any) -> str | None:
+    return value if isinstance(value, str) and value.startswith(("http://", "https://")) else None
+
+
+@dataclass(frozen=True, slots=True)
+class OutfitPiece:
+    label: str
+    present: bool
+    brand: str | None
+    item: str | None
+    category: str | None
+    price: Any
+    image_url: str | None
+    image_variant: str
+    collage_url: str | None
+    link: str | None
+
+    @classmethod
+    def from_payload(cls, label: str, data: Any) -> OutfitPiece:
+        data = data if isinstance(data, dict) else {}
+        image = data.get("image") if isinstance(data.get("image"), dict) else {}
+        variant = next((name for name in ("high_res", "medium") if image.get(name)), "image_url")
+        image_url = image.get(variant) if variant != "image_url" else data.get("image_url")
+        # Collages are downscaled anyway, so they prefer the medium rendition.
+        collage_url = image.get("medium") or image.get("high_res") or data.get("image_url")
+        return cls(
+            label=sys.intern(label),
+            present=bool(data),
+            brand=_intern(data.get("brand")),
+            item=_text(data.get("item")),
+            category=_intern(data.get("category")),
+            price=data.get("price") or 0,
+            image_url=_http_url(image_url),
+            image_variant=sys.intern(variant),
+            collage_url=_http_url(collage_url),
+            link=_http_url(data.get("affiliate_link") or data.get("reference_link")),
+        )
+
+
+@dataclass(slots=True)
+class RenderedOutfit:
+    # Filled lazily by the bot's renderers and reused on every re-send; never persisted.
+    text: str | None = None
+    photos: list[tuple[str, str, str, str]] | None = None
+    links: list[str] | None = None
+    collage_slots: list[Any] | None = None
+    inline_result: Any = None
+
+
+@dataclass(frozen=True, slots=True)
+class OutfitView:
+    # Only what the outfit card, photos, collage and links read; the full backend
+    # response is kept zlib-compressed for /outfits/save (level 1: ~7% larger than
+    # the default level, at half the CPU on the per-response path).
+    style: str | None
+    weather_context: str | None
+    budget_range: str | None
+    total_price: Any
+    explanation: str | None
+    scores: tuple[Any, ...]
+    pieces: tuple[OutfitPiece, ...]
+    accessory_start: int
+    blob: bytes
+    rendered: RenderedOutfit = field(default_factory=RenderedOutfit, compare=False, repr=False)
+
+    @classmethod
+    def from_payload(cls, outfit: dict[str, Any], blob: bytes | None = None) -> OutfitView:
+        pieces = [OutfitPiece.from_payload(label, outfit.get(key, {})) for label, key in MAIN_SLOTS]
+        accessories = outfit.get("accessories", [])
+        if isinstance(accessories, list):
+            # Labels follow the position in the backend list, skipped entries included.
+            for index, item in enumerate(accessories[:MAX_ACCESSORIES], start=1):
+                if isinstance(item, dict):
+                    pieces.append(OutfitPiece.from_payload(f"Accessory {index}", item))
+        scores = outfit.get("scores") if isinstance(outfit.get("scores"), dict) else {}
+        return cls(
+            style=_intern(outfit.get("style")),
+            weather_context=_text(outfit.get("weather_context")),
+            budget_range=_intern(outfit.get("budget_range")),
+            total_price=outfit.get("total_price"),
+            explanation=_text(outfit.get("explanation")),
+            scores=tuple(scores.get(key, 0) for key in SCORE_KEYS),
+            pieces=tuple(pieces),
+            accessory_start=len(MAIN_SLOTS),
+            blob=blob or zlib.compress(json_codec.dumps(outfit), 1),
+        )
+
+    @property
+    def main_pieces(self) -> tuple[OutfitPiece, ...]:
+        return self.pieces[: self.accessory_start]
+
+    @property
+    def accessories(self) -> tuple[OutfitPiece, ...]:
+        return self.pieces[self.accessory_start :]
+
+    def payload(self) -> dict[str, Any]:
+        return json_codec.loads(zlib.decompress(self.blob))
+
+    def to_dict(self) -> dict[str, Any]:
+        # The blob is the source of truth; the projection is rebuilt from it on load.
+        return {"blob": base64.b64encode(self.blob).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> OutfitView:
+        if "blob" not in data:
+            # State written before the compact view existed holds the raw backend response.
+            return cls.from_payload(data)
+        return cls.from_blob(base64.b64decode(data["blob"]))
+
+    @classmethod
+    def from_blob(cls, blob: bytes) -> OutfitView:
+        return cls.from_payload(json_codec.loads(zlib.decompress(blob)), blob=blob)
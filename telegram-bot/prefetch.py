@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+from cache import TTLCache
+from outfit_view import OutfitView
+from state import OutfitRequestState, apply_budget_action
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ACTIONS = ("cheaper", "premium")
+# Subscriptions are looked up again after this long, so upgrades and the daily reset show up.
+ENTITLEMENT_TTL_SECONDS = 300.0
+ENTITLEMENT_CACHE_SIZE = 50_000
+
+
+@dataclass(slots=True)
+class Entitlement:
+    # What the backend lets a user generate (GET /monetization/subscription): luxury-only
+    # requests need `luxuryOnlyEnabled`, and `remaining` is today's generate quota left,
+    # None when unlimited. Every generate call, speculative or not, spends one.
+    luxury: bool
+    remaining: int | None
+
+    @classmethod
+    def from_subscription(cls, data: dict[str, Any]) -> Entitlement:
+        if data.get("unlimitedGenerations"):
+            remaining = None
+        else:
+            remaining = int(data.get("dailyGenerationLimit") or 0) - int(data.get("generationsToday") or 0)
+        return cls(luxury=bool(data.get("luxuryOnlyEnabled")), remaining=remaining)
+
+    def allows(self, req: OutfitRequestState) -> bool:
+        return self.luxury or not req.luxury_only
+
+
+class RateWindow:
+    # Sliding-window counter mirroring the backend generate throttle (limit per window).
+    def __init__(self, limit: int, window_seconds: float):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._events: dict[Hashable, deque[float]] = {}
+
+    def _prune(self, key: Hashable, now: float) -> deque[float]:
+        events = self._events.get(key)
+        if events is None:
+            return deque()
+        cutoff = now - self.window_seconds
+        while events and events[0] <= cutoff:
+            events.popleft()
+        if not events:
+            del self._events[key]
+        return events
+
+    def remaining(self, key: Hashable) -> int:
+        return self.limit - len(self._prune(key, time.monotonic()))
+
+    def retry_after(self, key: Hashable) -> float:
+        now = time.monotonic()
+        events = self._prune(key, now)
+        if len(events) < self.limit:
+            return 0.0
+        return events[0] + self.window_seconds - now
+
+    def record(self, key: Hashable) -> None:
+        now = time.monotonic()
+        self._prune(key, now)
+        self._events.setdefault(key, deque()).append(now)
+
+
+class PrefetchScheduler:
+    def __init__(
+        self,
+        cache: TTLCache[OutfitView],
+        user_window: RateWindow,
+        global_window: RateWindow,
+        *,
+        user_reserve: int,
+        global_reserve: int,
+        quota_reserve: int,
+    ):
+        self.cache = cache
+        self.user_window = user_window
+        self.global_window = global_window
+        self.user_reserve = user_reserve
+        self.global_reserve = global_reserve
+        self.quota_reserve = quota_reserve
+        self.entitlements: TTLCache[Entitlement] = TTLCache(ENTITLEMENT_CACHE_SIZE, ENTITLEMENT_TTL_SECONDS)
+        # Cache keys of prefetched outfits not yet shown: the backend generated them as
+        # speculative, so they reach the user's history only when committed (see shown()).
+        self._unshown: TTLCache[bool] = TTLCache(cache.max_entries, cache.ttl_seconds)
+        self._tasks: dict[int, dict[Hashable, asyncio.Task[OutfitView]]] = {}
+        self.scheduled = 0
+        self.skipped_budget = 0
+        self.skipped_entitlement = 0
+        self.used = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.served = 0
+
+    def remember(self, chat_id: int, entitlement: Entitlement) -> None:
+        self.entitlements.set(chat_id, entitlement)
+
+    def record_generation(self, chat_id: int) -> None:
+        self.user_window.record(chat_id)
+        self.global_window.record("global")
+        entitlement = self.entitlements.get(chat_id)
+        if entitlement is not None and entitlement.remaining is not None:
+            entitlement.remaining -= 1
+
+    def _has_spare_budget(self, chat_id: int, entitlement: Entitlement) -> bool:
+        return (
+            self.user_window.remaining(chat_id) > self.user_reserve
+            and self.global_window.remaining("global") > self.global_reserve
+            and (entitlement.remaining is None or entitlement.remaining > self.quota_reserve)
+        )
+
+    def schedule(
+        self,
+        chat_id: int,
+        req: OutfitRequestState,
+        generate: Callable[[OutfitRequestState], Awaitable[OutfitView]],
+    ) -> None:
+        self.cancel(chat_id)
+        entitlement = self.entitlements.get(chat_id)
+        if entitlement is None:
+            # Without the subscription we cannot tell what the user may spend.
+            self.skipped_entitlement += 1
+            return
+        current_key = req.cache_key()
+        pending: dict[Hashable, asyncio.Task[OutfitView]] = {}
+        for action in PREFETCH_ACTIONS:
+            variant = apply_budget_action(req, action)
+            variant_key = variant.cache_key()
+            cache_key = (chat_id, variant_key)
+            if variant_key == current_key or variant_key in pending or cache_key in self.cache:
+                continue
+            # The backend would refuse it (Luxury for a free account).
+            if not entitlement.allows(variant):
+                self.skipped_entitlement += 1
+                continue
+            # Only spend quota the user is unlikely to need for their own taps.
+            if not self._has_spare_budget(chat_id, entitlement):
+                self.skipped_budget += 1
+                break
+            self.record_generation(chat_id)
+            task = asyncio.create_task(self._run(cache_key, variant, generate))
+            task.add_done_callback(lambda done, key=variant_key: self._forget(chat_id, key, done))
+            pending[variant_key] = task
+            self.scheduled += 1
+        if pending:
+            self._tasks[chat_id] = pending
+
+    async def _run(
+        self,
+        cache_key: Hashable,
+        variant: OutfitRequestState,
+        generate: Callable[[OutfitRequestState], Awaitable[OutfitView]],
+    ) -> OutfitView:
+        outfit = await generate(variant)
+        self.cache.set(cache_key, outfit)
+        self._unshown.set(cache_key, True)
+        return outfit
+
+    def take(self, chat_id: int, req: OutfitRequestState) -> asyncio.Task[OutfitView] | None:
+        # An in-flight prefetch for exactly this request is awaited instead of cancelled.
+        task = self._tasks.get(chat_id, {}).pop(req.cache_key(), None)
+        if task is not None:
+            self.used += 1
+        return task
+
+    def shown(self, chat_id: int, req: OutfitRequestState) -> bool:
+        # True (once) when the outfit cached for req is a prefetch the user is now shown, so
+        # the caller commits it; a tap that generates afresh also clears it.
+        if self._unshown.pop((chat_id, req.cache_key())) is None:
+            return False
+        self.served += 1
+        return True
+
+    async def wait(self, task: asyncio.Task[OutfitView]) -> OutfitView | None:
+        # None when the prefetch failed for any reason; the caller then generates as usual.
+        try:
+            return await task
+        except Exception as error:
+            self.failed += 1
+            logger.warning("Prefetched outfit unavailable, generating again: %s", error)
+            return None
+
+    def cancel(self, chat_id: int) -> None:
+        for task in self._tasks.pop(chat_id, {}).values():
+            if not task.done():
+                task.cancel()
+                self.cancelled += 1
+
+    def _forget(self, chat_id: int, key: Hashable, task: asyncio.Task[OutfitView]) -> None:
+        pending = self._tasks.get(chat_id)
+        if pending and pending.get(key) is task:
+            del pending[key]
+            if not pending:
+                del self._tasks[chat_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Outfit prefetch failed: %s", task.exception())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": sum(len(tasks) for tasks in self._tasks.values()),
+            "scheduled": self.scheduled,
+            "used": self.used,
+            "served": self.served,
+            "cancelled": self.cancelled,
+            "skipped_budget": self.skipped_budget,
+            "skipped_entitlement": self.skipped_entitlement,
+            "failed": self.failed,
+        }
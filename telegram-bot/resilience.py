@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import logging
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+breaker_transitions = registry.counter(
+    "backend_breaker_transitions_total",
+    "Backend circuit breaker state changes, by path and new state",
+    ("path", "state"),
+)
+
+# Monotonic time by which the current handler wants its answer; None outside handlers.
+_deadline: ContextVar[float | None] = ContextVar("backend_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    # Nested scopes can only shorten the budget, never extend the caller's.
+    if seconds <= 0:
+        yield
+        return
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def detached() -> Iterator[None]:
+    # For background work started from a handler (prefetch): its own timeouts apply,
+    # not what is left of the tap's budget.
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_remaining() -> float | None:
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+class DeadlineMiddleware(BaseMiddleware):
+    # Every backend call a handler makes, retries and re-logins included, shares one budget.
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        with deadline(self.seconds):
+            return await handler(event, data)
+
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` consecutive failures and rejects calls for
+    # `open_seconds`; then lets a single probe through (half-open) and closes on its
+    # success or opens again on its failure.
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int,
+        open_seconds: float,
+        on_change: Callable[[str, str, str], None],
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def retry_after(self) -> float | None:
+        # None when the call may go ahead, otherwise seconds until it is worth trying.
+        if self.state == OPEN:
+            wait = self.opened_at + self.open_seconds - time.monotonic()
+            if wait > 0:
+                return wait
+            self._set(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probing:
+                return self.open_seconds
+            self.probing = True
+        return None
+
+    def record_success(self) -> None:
+        self.probing = False
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set(CLOSED)
+
+    def record_failure(self) -> None:
+        self.probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self._set(OPEN)
+
+    def release(self) -> None:
+        # The call ended without telling us anything about the backend (cancelled, or
+        # cut short by the caller's deadline).
+        self.probing = False
+
+    def _set(self, state: str) -> None:
+        previous, self.state = self.state, state
+        self.on_change(self.name, previous, state)
+
+
+class BreakerBoard:
+    # One breaker per backend path, created on first use. State changes are exported as
+    # events: a log line, gothyxan_bot_backend_breaker_transitions_total{path,state} and
+    # any callbacks in `listeners`.
+    def __init__(self, *, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.listeners: list[Callable[[str, str, str], None]] = []
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self.rejected = 0
+
+    def get(self, path: str) -> CircuitBreaker | None:
+        if self.failure_threshold <= 0:
+            return None
+        breaker = self._breakers.get(path)
+        if breaker is None:
+            breaker = self._breakers[path] = CircuitBreaker(
+                path,
+                failure_threshold=self.failure_threshold,
+                open_seconds=self.open_seconds,
+                on_change=self._changed,
+            )
+        return breaker
+
+    def _changed(self, path: str, previous: str, state: str) -> None:
+        log = logger.info if state == CLOSED else logger.warning
+        log("Backend circuit for %s: %s -> %s", path, previous, state)
+        breaker_transitions.inc(path=path, state=state)
+        for listener in self.listeners:
+            try:
+                listener(path, previous, state)
+            except Exception as error:
+                logger.warning("Breaker listener failed: %s", error)
+
+    def stats(self) -> dict[str, Any]:
+        states = [breaker.state for breaker in self._breakers.values()]
+        return {
+            "open": states.count(OPEN),
+            "half_open": states.count(HALF_OPEN),
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    # Recent latencies per path; the hedge delay is their `percentile`-th value.
+    def __init__(self, percentile: float, window: int = 256, min_samples: int = 20):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+
+    def observe(self, path: str, seconds: float) -> None:
+        samples = self._samples.get(path)
+        if samples is None:
+            samples = self._samples[path] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def threshold(self, path: str) -> float | None:
+        samples = self._samples.get(path)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, math.ceil(len(ordered) * self.percentile / 100) - 1)]
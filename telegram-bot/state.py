@@ -1,12 +1,35 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from typing import Any
+import asyncio
+import logging
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Iterable, Protocol
 
+import json_codec
 from api_client import BackendSession
+from config import Settings
+from outfit_view import OutfitView
+from state_snapshot import StateSnapshot, write_snapshot
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+RECORD_HEAD = struct.Struct("=I")
+# Chats encoded per event loop turn while a snapshot is taken (about 10 ms each).
+SNAPSHOT_CHUNK = 1000
+
+
+def _fields(value: Any) -> dict[str, Any]:
+    # Shallow asdict for the slotted, scalar-only dataclasses below; asdict's deep copy
+    # was most of the snapshot encoding time.
+    return {name: getattr(value, name) for name in value.__slots__}
+
+
+@dataclass(slots=True)
 class OutfitRequestState:
     style: str = "streetwear"
     occasion: str | None = None
@@ -16,32 +39,444 @@ class OutfitRequestState:
     budget_max: int | None = None
     luxury_only: bool = False
 
+    def cache_key(self) -> tuple[Any, ...]:
+        # Requests the backend treats identically must map to the same key.
+        custom = self.budget_mode == "custom"
+        return (
+            " ".join(self.style.split()).lower(),
+            (self.occasion or "").strip().lower() or None,
+            (self.city or "").strip().casefold() or None,
+            self.budget_mode,
+            self.budget_min if custom else None,
+            self.budget_max if custom else None,
+            self.luxury_only,
+        )
+
+
+def apply_budget_action(req: OutfitRequestState, action: str) -> OutfitRequestState:
+    # Rules behind the Cheaper/Luxury buttons; shared with the prefetcher so it
+    # requests exactly what the next tap will ask for.
+    req = replace(req)
+    if action == "cheaper":
+        if req.budget_mode == "custom":
+            req.budget_min = max(50, int((req.budget_min or 200) * 0.7))
+            req.budget_max = max(req.budget_min + 50, int((req.budget_max or 900) * 0.75))
+            req.luxury_only = False
+        else:
+            req.budget_mode = "cheaper"
+            req.budget_min = None
+            req.budget_max = None
+            req.luxury_only = False
+    elif action == "premium":
+        if req.budget_mode == "custom":
+            req.budget_min = int((req.budget_min or 200) * 1.2)
+            req.budget_max = int((req.budget_max or 900) * 1.3)
+            req.luxury_only = True
+        else:
+            req.budget_mode = "premium"
+            req.budget_min = None
+            req.budget_max = None
+            req.luxury_only = True
+    return req
+
 
-@dataclass
+@dataclass(slots=True)
+class OutfitCard:
+    # Where the current outfit is shown: the text message with the buttons and the photo
+    # messages under it, plus a fingerprint per photo so an edit only replaces what changed.
+    text_message_id: int
+    media_message_ids: list[int] = field(default_factory=list)
+    media_keys: list[str] = field(default_factory=list)
+    collage: bool = False
+
+
+@dataclass(slots=True)
 class ChatState:
     backend_session: BackendSession
     last_request: OutfitRequestState = field(default_factory=OutfitRequestState)
-    last_outfit: dict[str, Any] | None = None
+    last_outfit: OutfitView | None = None
+    card: OutfitCard | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "backend_session": asdict(self.backend_session),
+            "last_request": asdict(self.last_request),
+            "last_outfit": self.last_outfit.to_dict() if self.last_outfit else None,
+            "card": _fields(self.card) if self.card else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> ChatState:
+        last_outfit = data.get("last_outfit")
+        card = data.get("card")
+        return cls(
+            backend_session=BackendSession(**data["backend_session"]),
+            last_request=OutfitRequestState(**data.get("last_request", {})),
+            last_outfit=OutfitView.from_dict(last_outfit) if last_outfit else None,
+            card=OutfitCard(**card) if card else None,
+        )
+
+    def to_record(self) -> bytes:
+        # Snapshot encoding: session and request as JSON, then the outfit blob as is
+        # (already compressed, so no base64 and no second compression).
+        head = json_codec.dumps(
+            {
+                "backend_session": _fields(self.backend_session),
+                "last_request": _fields(self.last_request),
+                "card": _fields(self.card) if self.card else None,
+            }
+        )
+        blob = self.last_outfit.blob if self.last_outfit else b""
+        return RECORD_HEAD.pack(len(head)) + head + blob
+
+    @classmethod
+    def from_record(cls, record: bytes) -> ChatState:
+        (size,) = RECORD_HEAD.unpack_from(record)
+        start = RECORD_HEAD.size
+        head = json_codec.loads(record[start : start + size])
+        blob = record[start + size :]
+        card = head.get("card")
+        return cls(
+            backend_session=BackendSession(**head["backend_session"]),
+            last_request=OutfitRequestState(**head["last_request"]),
+            last_outfit=OutfitView.from_blob(blob) if blob else None,
+            card=OutfitCard(**card) if card else None,
+        )
+
+
+class StateBackend(Protocol):
+    async def get_many(self, chat_ids: Iterable[int]) -> dict[int, ChatState]: ...
+
+    async def set_many(self, states: dict[int, ChatState]) -> None: ...
+
+    async def delete(self, chat_id: int) -> None: ...
+
+    async def stats(self) -> dict[str, int]: ...
+
+    def start(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class MemoryStateBackend:
+    def __init__(
+        self,
+        max_chats: int,
+        idle_ttl_seconds: int,
+        *,
+        snapshot_path: str | None = None,
+        snapshot_interval_seconds: float = 0,
+    ):
+        self.max_chats = max_chats
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval_seconds = snapshot_interval_seconds
+        # Ordered oldest -> most recently touched, so expiry and LRU both pop from the front.
+        self._store: OrderedDict[int, tuple[float, ChatState]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evicted_lru = 0
+        self._evicted_ttl = 0
+        self._restored = 0
+        self._snapshots = 0
+        self._snapshot_task: asyncio.Task[None] | None = None
+        # The previous run's chats stay on disk until they come back (see _restore).
+        self._snapshot: StateSnapshot | None = None
+        self._superseded: set[int] = set()
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                self._snapshot = StateSnapshot(snapshot_path)
+            except (OSError, ValueError) as error:
+                logger.warning("Ignoring chat state snapshot: %s", error)
+
+    async def get_many(self, chat_ids: Iterable[int]) -> dict[int, ChatState]:
+        now = time.monotonic()
+        self._expire(now)
+        found: dict[int, ChatState] = {}
+        for chat_id in chat_ids:
+            entry = self._store.get(chat_id)
+            state = entry[1] if entry is not None else self._restore(chat_id)
+            if state is None:
+                self._misses += 1
+                continue
+            self._hits += 1
+            self._store[chat_id] = (now, state)
+            self._store.move_to_end(chat_id)
+            found[chat_id] = state
+        self._evict_lru()
+        return found
+
+    async def set_many(self, states: dict[int, ChatState]) -> None:
+        now = time.monotonic()
+        for chat_id, state in states.items():
+            self._supersede(chat_id)
+            self._store[chat_id] = (now, state)
+            self._store.move_to_end(chat_id)
+        self._expire(now)
+        self._evict_lru()
+
+    async def delete(self, chat_id: int) -> None:
+        self._supersede(chat_id)
+        self._store.pop(chat_id, None)
+
+    async def stats(self) -> dict[str, int]:
+        return {
+            "chats": len(self._store),
+            "hits": self._hits,
+            "misses": self._misses,
+            "evicted_lru": self._evicted_lru,
+            "evicted_ttl": self._evicted_ttl,
+            "restored": self._restored,
+            "snapshots": self._snapshots,
+        }
+
+    def start(self) -> None:
+        if self.snapshot_path and self.snapshot_interval_seconds > 0 and self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def close(self) -> None:
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+            self._snapshot_task = None
+        if self.snapshot_path:
+            try:
+                await self.save_snapshot()
+            except OSError as error:
+                logger.error("Failed to write chat state snapshot: %s", error)
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+        self._store.clear()
+
+    async def save_snapshot(self) -> int:
+        # Records are encoded on the loop (states are mutated there) in chunks, so handlers
+        # keep running in between; only the file write runs in a thread.
+        if not self.snapshot_path:
+            return 0
+        entries = await self._snapshot_entries()
+        await asyncio.to_thread(write_snapshot, self.snapshot_path, entries)
+        self._snapshots += 1
+        return len(entries)
+
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval_seconds)
+            try:
+                await self.save_snapshot()
+            except OSError as error:
+                logger.error("Failed to write chat state snapshot: %s", error)
+
+    async def _snapshot_entries(self) -> list[tuple[int, float, bytes]]:
+        wall_offset = time.time() - time.monotonic()
+        live = list(self._store.items())
+        entries: list[tuple[int, float, bytes]] = []
+        for start in range(0, len(live), SNAPSHOT_CHUNK):
+            if start:
+                await asyncio.sleep(0)
+            entries.extend(
+                (chat_id, touched_at + wall_offset, state.to_record())
+                for chat_id, (touched_at, state) in live[start : start + SNAPSHOT_CHUNK]
+            )
+        # Chats deleted or evicted while the chunks were encoded are left out, and chats
+        # written or restored meanwhile are added.
+        entries = [entry for entry in entries if entry[0] in self._store]
+        live_ids = {entry[0] for entry in entries}
+        entries.extend(
+            (chat_id, touched_at + wall_offset, state.to_record())
+            for chat_id, (touched_at, state) in self._store.items()
+            if chat_id not in live_ids
+        )
+        live_ids.update(self._store)
+        if self._snapshot is not None:
+            # Chats of the previous run that have not come back yet are copied over undecoded.
+            cutoff = time.time() - self.idle_ttl_seconds if self.idle_ttl_seconds > 0 else float("-inf")
+            entries.extend(
+                (chat_id, touched_at, self._snapshot.record(index))
+                for chat_id, touched_at, index in self._snapshot.entries()
+                if touched_at > cutoff and chat_id not in self._superseded and chat_id not in live_ids
+            )
+        if len(entries) > self.max_chats:
+            entries.sort(key=lambda entry: entry[1], reverse=True)
+            del entries[self.max_chats :]
+        return entries
+
+    def _restore(self, chat_id: int) -> ChatState | None:
+        # A chat of the previous run is decoded on its first update, not at startup.
+        if self._snapshot is None or chat_id in self._superseded:
+            return None
+        index = self._snapshot.find(chat_id)
+        if index is None:
+            return None
+        self._superseded.add(chat_id)
+        if self.idle_ttl_seconds > 0 and time.time() - self._snapshot.touched_at[index] > self.idle_ttl_seconds:
+            return None
+        try:
+            state = ChatState.from_record(self._snapshot.record(index))
+        except (ValueError, KeyError, TypeError, struct.error, zlib.error) as error:
+            logger.warning("Dropping unreadable snapshot state of chat %s: %s", chat_id, error)
+            return None
+        self._restored += 1
+        return state
+
+    def _supersede(self, chat_id: int) -> None:
+        # A newer write or delete wins over whatever the snapshot holds for the chat.
+        if self._snapshot is not None and chat_id not in self._superseded and self._snapshot.find(chat_id) is not None:
+            self._superseded.add(chat_id)
+
+    def _evict_lru(self) -> None:
+        while len(self._store) > self.max_chats:
+            self._store.popitem(last=False)
+            self._evicted_lru += 1
+
+    def _expire(self, now: float) -> None:
+        if self.idle_ttl_seconds <= 0:
+            return
+        cutoff = now - self.idle_ttl_seconds
+        while self._store:
+            chat_id, (touched_at, _state) = next(iter(self._store.items()))
+            if touched_at > cutoff:
+                break
+            del self._store[chat_id]
+            self._evicted_ttl += 1
+
+
+class RedisStateBackend:
+    # Shared between bot processes; any server speaking the Redis protocol works.
+    def __init__(self, url: str, idle_ttl_seconds: int, key_prefix: str = "gothyxan:bot:chat:"):
+        from redis import asyncio as redis_asyncio
+
+        self._redis = redis_asyncio.from_url(url)
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.key_prefix = key_prefix
+        self._hits = 0
+        self._misses = 0
+
+    def _key(self, chat_id: int) -> str:
+        return f"{self.key_prefix}{chat_id}"
+
+    async def get_many(self, chat_ids: Iterable[int]) -> dict[int, ChatState]:
+        ids = list(chat_ids)
+        if not ids:
+            return {}
+        keys = [self._key(chat_id) for chat_id in ids]
+        values = await self._redis.mget(keys)
+        found: dict[int, ChatState] = {}
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for chat_id, key, raw in zip(ids, keys, values):
+                if raw is None:
+                    self._misses += 1
+                    continue
+                self._hits += 1
+                found[chat_id] = ChatState.from_dict(json_codec.loads(raw))
+                if self.idle_ttl_seconds > 0:
+                    pipe.expire(key, self.idle_ttl_seconds)
+            await pipe.execute()
+        return found
+
+    async def set_many(self, states: dict[int, ChatState]) -> None:
+        if not states:
+            return
+        ttl = self.idle_ttl_seconds if self.idle_ttl_seconds > 0 else None
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for chat_id, state in states.items():
+                pipe.set(self._key(chat_id), json_codec.dumps(state.to_dict()), ex=ttl)
+            await pipe.execute()
+
+    async def delete(self, chat_id: int) -> None:
+        await self._redis.delete(self._key(chat_id))
+
+    async def stats(self) -> dict[str, int]:
+        from redis.exceptions import RedisError
+
+        # Expiry and memory-pressure eviction happen inside Redis, so report its counters.
+        # Runs on every /metrics scrape, so the chat count is the key count of the bot's
+        # database from INFO keyspace (exact when that database holds only chat state),
+        # never a SCAN of the keyspace. Lightweight Redis stand-ins may not implement INFO;
+        # report zeros there.
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.info("stats")
+                pipe.info("keyspace")
+                info, keyspace = await pipe.execute()
+        except RedisError:
+            info, keyspace = {}, {}
+        db = self._redis.connection_pool.connection_kwargs.get("db") or 0
+        database = keyspace.get(f"db{db}")
+        return {
+            "chats": int(database.get("keys", 0)) if isinstance(database, dict) else 0,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evicted_lru": int(info.get("evicted_keys", 0)),
+            "evicted_ttl": int(info.get("expired_keys", 0)),
+        }
+
+    def start(self) -> None:
+        # Redis keeps the state across restarts by itself.
+        pass
+
+    async def close(self) -> None:
+        await self._redis.aclose()
 
 
 class BotStateStore:
-    def __init__(self):
-        self._store: dict[int, ChatState] = {}
+    def __init__(self, backend: StateBackend | None = None):
+        self.backend: StateBackend = backend or MemoryStateBackend(max_chats=50_000, idle_ttl_seconds=86_400)
+
+    async def set_chat_state(self, chat_id: int, state: ChatState) -> None:
+        await self.backend.set_many({chat_id: state})
+
+    async def get_chat_state(self, chat_id: int) -> ChatState | None:
+        return (await self.backend.get_many([chat_id])).get(chat_id)
+
+    async def get_many(self, chat_ids: Iterable[int]) -> dict[int, ChatState]:
+        return await self.backend.get_many(chat_ids)
+
+    async def set_many(self, states: dict[int, ChatState]) -> None:
+        await self.backend.set_many(states)
+
+    async def delete_chat_state(self, chat_id: int) -> None:
+        await self.backend.delete(chat_id)
+
+    async def update_session(self, chat_id: int, session: BackendSession) -> None:
+        state = await self.get_chat_state(chat_id)
+        if state:
+            state.backend_session = session
+            await self.set_chat_state(chat_id, state)
+
+    async def update_request(self, chat_id: int, req: OutfitRequestState) -> None:
+        state = await self.get_chat_state(chat_id)
+        if state:
+            state.last_request = req
+            await self.set_chat_state(chat_id, state)
+
+    async def update_outfit(self, chat_id: int, outfit: OutfitView) -> None:
+        state = await self.get_chat_state(chat_id)
+        if state:
+            state.last_outfit = outfit
+            await self.set_chat_state(chat_id, state)
 
-    def set_chat_state(self, chat_id: int, state: ChatState) -> None:
-        self._store[chat_id] = state
+    async def stats(self) -> dict[str, int]:
+        return await self.backend.stats()
 
-    def get_chat_state(self, chat_id: int) -> ChatState | None:
-        return self._store.get(chat_id)
+    def start(self) -> None:
+        self.backend.start()
 
-    def update_session(self, chat_id: int, session: BackendSession) -> None:
-        if chat_id in self._store:
-            self._store[chat_id].backend_session = session
+    async def close(self) -> None:
+        await self.backend.close()
 
-    def update_request(self, chat_id: int, req: OutfitRequestState) -> None:
-        if chat_id in self._store:
-            self._store[chat_id].last_request = req
 
-    def update_outfit(self, chat_id: int, outfit: dict[str, Any]) -> None:
-        if chat_id in self._store:
-            self._store[chat_id].last_outfit = outfit
+def build_state_store(settings: Settings) -> BotStateStore:
+    if settings.state_backend == "redis":
+        backend: StateBackend = RedisStateBackend(
+            settings.redis_url,
+            idle_ttl_seconds=settings.state_idle_ttl_seconds,
+        )
+    else:
+        backend = MemoryStateBackend(
+            max_chats=settings.state_max_chats,
+            idle_ttl_seconds=settings.state_idle_ttl_seconds,
+            snapshot_path=settings.state_snapshot_path,
+            snapshot_interval_seconds=settings.state_snapshot_interval_seconds,
+        )
+    return BotStateStore(backend)
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import bisect
+import mmap
+import os
+import struct
+import time
+from array import array
+from typing import Iterator
+
+# Layout, native byte order (a snapshot is read back by the host that wrote it):
+#   header   magic, version, chat count, written_at (unix time)
+#   index    count int64 chat ids (sorted) | count float64 last touched (unix time)
+#            | count uint64 record offsets | count uint32 record lengths
+#   records  opaque bytes, see ChatState.to_record
+# The index is used in place through memoryviews over the mmap, so opening a snapshot
+# costs the same for ten chats or a million; a record is only read when its chat returns.
+HEADER = struct.Struct("=4sHxxQd")
+MAGIC = b"GXSS"
+VERSION = 1
+
+
+class StateSnapshot:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views: list[memoryview] = []
+        try:
+            self._parse()
+        except ValueError:
+            self.close()
+            raise
+
+    def _parse(self) -> None:
+        size = len(self._mmap)
+        if size < HEADER.size:
+            raise ValueError(f"{self.path}: truncated header")
+        magic, version, count, self.written_at = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path}: not a version {VERSION} state snapshot")
+        columns: list[memoryview] = []
+        offset = HEADER.size
+        for code, width in (("q", 8), ("d", 8), ("Q", 8), ("I", 4)):
+            end = offset + count * width
+            if end > size:
+                raise ValueError(f"{self.path}: truncated index")
+            view = memoryview(self._mmap)[offset:end]
+            self._views.append(view)
+            columns.append(view.cast(code))
+            offset = end
+        self._views.extend(columns)
+        self.chat_ids, self.touched_at, self._offsets, self._lengths = columns
+        if count and self._offsets[count - 1] + self._lengths[count - 1] > size:
+            raise ValueError(f"{self.path}: truncated records")
+
+    def __len__(self) -> int:
+        return len(self.chat_ids)
+
+    def find(self, chat_id: int) -> int | None:
+        index = bisect.bisect_left(self.chat_ids, chat_id)
+        if index < len(self.chat_ids) and self.chat_ids[index] == chat_id:
+            return index
+        return None
+
+    def record(self, index: int) -> bytes:
+        offset = self._offsets[index]
+        return self._mmap[offset : offset + self._lengths[index]]
+
+    def entries(self) -> Iterator[tuple[int, float, int]]:
+        # (chat id, last touched, index) in chat id order.
+        for index in range(len(self.chat_ids)):
+            yield self.chat_ids[index], self.touched_at[index], index
+
+    def close(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._mmap.close()
+
+
+def write_snapshot(path: str, entries: list[tuple[int, float, bytes]]) -> None:
+    # entries: (chat id, last touched, record), chat ids unique. Written next to the
+    # target and renamed over it, so a reader never sees half a file; an existing
+    # mmap of the old file stays valid. Records hold backend tokens, hence 0600.
+    entries.sort(key=lambda entry: entry[0])
+    count = len(entries)
+    offsets = array("Q")
+    lengths = array("I")
+    offset = HEADER.size + count * (8 + 8 + 8 + 4)
+    for _chat_id, _touched_at, record in entries:
+        offsets.append(offset)
+        lengths.append(len(record))
+        offset += len(record)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, count, time.time()))
+        file.write(array("q", [entry[0] for entry in entries]).tobytes())
+        file.write(array("d", [entry[1] for entry in entries]).tobytes())
+        file.write(offsets.tobytes())
+        file.write(lengths.tobytes())
+        file.writelines(entry[2] for entry in entries)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
@@ -0,0 +1,559 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hmac
+import logging
+import math
+import os
+import signal
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+from aiohttp import web
+
+import json_codec
+from config import Settings, load_settings
+from metrics import MetricsRegistry, start_metrics_server
+from webhook import on_healthz
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://api.telegram.org"
+FORWARD_BATCH = 100
+FORWARD_RETRY_SECONDS = 0.5
+STATS_INTERVAL_SECONDS = 5.0
+STATS_FAILURES_BEFORE_KILL = 3
+RESTART_BACKOFF_MIN_SECONDS = 1.0
+RESTART_BACKOFF_MAX_SECONDS = 30.0
+STABLE_UPTIME_SECONDS = 60.0
+POLL_TIMEOUT_SECONDS = 30
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Global budgets are shared by every worker, so each one gets its slice.
+SPLIT_INT_SETTINGS = (
+    ("TELEGRAM_GENERATE_GLOBAL_LIMIT", "generate_global_limit"),
+    ("TELEGRAM_PREFETCH_GLOBAL_RESERVE", "prefetch_global_reserve"),
+    ("TELEGRAM_MAX_CONCURRENT_GENERATIONS", "max_concurrent_generations"),
+    ("TELEGRAM_MAX_WAITING_GENERATIONS", "max_waiting_generations"),
+    ("TELEGRAM_MAX_PENDING_UPDATES", "max_pending_updates"),
+    ("TELEGRAM_BACKEND_POOL_LIMIT", "backend_pool_limit"),
+    ("TELEGRAM_BACKEND_POOL_LIMIT_PER_HOST", "backend_pool_limit_per_host"),
+    ("TELEGRAM_STATE_MAX_CHATS", "state_max_chats"),
+    ("TELEGRAM_STREAM_MAX_CONNECTIONS", "stream_max_connections"),
+)
+
+
+def update_chat_id(update: dict[str, Any]) -> int | None:
+    # The chat the update belongs to, as aiogram's event_chat sees it; the sender for
+    # chat-less updates (inline queries, callbacks on inline messages).
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat")
+        if not isinstance(chat, dict) and isinstance(event.get("message"), dict):
+            chat = event["message"].get("chat")
+        if isinstance(chat, dict) and isinstance(chat.get("id"), int):
+            return chat["id"]
+        sender = event.get("from")
+        if isinstance(sender, dict) and isinstance(sender.get("id"), int):
+            return sender["id"]
+    return None
+
+
+def worker_env(settings: Settings, index: int, workers: int) -> dict[str, str]:
+    env = dict(os.environ)
+    env["TELEGRAM_SEND_GLOBAL_RATE"] = repr(settings.send_global_rate / workers)
+    for name, attribute in SPLIT_INT_SETTINGS:
+        env[name] = str(max(1, math.ceil(getattr(settings, attribute) / workers)))
+    # Each worker flushes its own write-behind queue file and snapshots its own chats.
+    if settings.write_queue_path != ":memory:":
+        env["TELEGRAM_WRITE_QUEUE_PATH"] = f"{settings.write_queue_path}.worker{index}"
+    if settings.state_snapshot_path:
+        env["TELEGRAM_STATE_SNAPSHOT_PATH"] = f"{settings.state_snapshot_path}.worker{index}"
+    # Both caches track their files in memory, so workers must not share them: one sqlite
+    # file would be locked by N writers and one collage directory evicted by N owners.
+    if settings.file_id_cache_path != ":memory:":
+        env["TELEGRAM_FILE_ID_CACHE_PATH"] = f"{settings.file_id_cache_path}.worker{index}"
+    env["TELEGRAM_COLLAGE_CACHE_DIR"] = f"{settings.collage_cache_dir}.worker{index}"
+    env["TELEGRAM_COLLAGE_CACHE_MB"] = str(max(1, settings.collage_cache_max_bytes // (1024 * 1024) // workers))
+    # Only worker 0 warms the inline outfit cache; route() sends it every inline query.
+    if index > 0:
+        env["TELEGRAM_INLINE_ENABLED"] = "false"
+    # Worker n serves its own /metrics on the supervisor's port + 1 + n.
+    env["TELEGRAM_METRICS_PORT"] = str(settings.metrics_port + 1 + index if settings.metrics_port else 0)
+    return env
+
+
+@dataclass
+class WorkerHandle:
+    index: int
+    socket_path: str
+    queue: asyncio.Queue[bytes]
+    session: aiohttp.ClientSession
+    process: asyncio.subprocess.Process | None = None
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+    started_at: float = 0.0
+    restarts: int = 0
+    forwarded: int = 0
+    forward_errors: int = 0
+    stats_failures: int = 0
+    last_stats: dict[str, Any] = field(default_factory=dict)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "alive": int(self.ready.is_set()),
+            "pid": self.process.pid if self.process is not None else 0,
+            "uptime_seconds": time.monotonic() - self.started_at if self.ready.is_set() else 0.0,
+            "restarts": self.restarts,
+            "queued": self.queue.qsize(),
+            "forwarded": self.forwarded,
+            "forward_errors": self.forward_errors,
+            "in_progress": self.last_stats.get("in_progress", 0),
+            "handled": self.last_stats.get("handled", 0),
+            "failed": self.last_stats.get("failed", 0),
+            "chat_queue_pending": self.last_stats.get("chat_queue_pending", 0),
+            "cpu_seconds": self.last_stats.get("cpu_seconds", 0.0),
+        }
+
+
+class Supervisor:
+    # Owns the Telegram side (polling or the public webhook) and fans updates out to
+    # worker processes by chat_id, so each chat's updates, state and caches live in
+    # exactly one worker and arrive there in order.
+    def __init__(self, settings: Settings, workers: int, socket_dir: str):
+        self.settings = settings
+        self.workers: list[WorkerHandle] = []
+        self._socket_dir = socket_dir
+        self._workers_count = workers
+        self._tasks: list[asyncio.Task[None]] = []
+        self._closing = False
+        self._next_keyless = 0
+        self.received = 0
+        self.shed = 0
+
+    async def start(self) -> None:
+        for index in range(self._workers_count):
+            socket_path = str(Path(self._socket_dir) / f"worker-{index}.sock")
+            handle = WorkerHandle(
+                index=index,
+                socket_path=socket_path,
+                queue=asyncio.Queue(maxsize=self.settings.max_pending_updates),
+                session=aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=socket_path)),
+            )
+            self.workers.append(handle)
+            self._tasks.append(asyncio.create_task(self._supervise(handle)))
+            self._tasks.append(asyncio.create_task(self._forward(handle)))
+        self._tasks.append(asyncio.create_task(self._poll_stats()))
+
+    def route(self, update: dict[str, Any]) -> WorkerHandle:
+        if "inline_query" in update:
+            return self.workers[0]
+        chat_id = update_chat_id(update)
+        if chat_id is None:
+            self._next_keyless = (self._next_keyless + 1) % len(self.workers)
+            return self.workers[self._next_keyless]
+        return self.workers[chat_id % len(self.workers)]
+
+    def dispatch(self, update: dict[str, Any], raw: bytes | None = None) -> bool:
+        self.received += 1
+        handle = self.route(update)
+        try:
+            handle.queue.put_nowait(raw if raw is not None else json_codec.dumps(update))
+        except asyncio.QueueFull:
+            self.shed += 1
+            logger.warning("Worker %s backlog is full; dropping update %s", handle.index, update.get("update_id"))
+            return False
+        return True
+
+    async def allowed_updates(self) -> list[str] | None:
+        # Workers own the router, so the first one to come up reports which update types it handles.
+        waiters = [asyncio.create_task(handle.ready.wait()) for handle in self.workers]
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters:
+            waiter.cancel()
+        for handle in self.workers:
+            if handle.ready.is_set():
+                stats = await self._fetch_stats(handle)
+                return stats.get("allowed_updates")
+        return None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "workers": len(self.workers),
+            "workers_alive": sum(handle.ready.is_set() for handle in self.workers),
+            "restarts": sum(handle.restarts for handle in self.workers),
+            "updates_received": self.received,
+            "updates_shed": self.shed,
+            "queued": sum(handle.queue.qsize() for handle in self.workers),
+        }
+
+    async def close(self) -> None:
+        self._closing = True
+        # Give workers a moment to take what is already queued before stopping them.
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and any(
+            handle.ready.is_set() and not handle.queue.empty() for handle in self.workers
+        ):
+            await asyncio.sleep(0.05)
+        for handle in self.workers:
+            if handle.process is not None and handle.process.returncode is None:
+                handle.process.terminate()
+        for handle in self.workers:
+            if handle.process is None:
+                continue
+            try:
+                await asyncio.wait_for(handle.process.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                handle.process.kill()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for handle in self.workers:
+            await handle.session.close()
+
+    async def _supervise(self, handle: WorkerHandle) -> None:
+        backoff = RESTART_BACKOFF_MIN_SECONDS
+        while not self._closing:
+            handle.process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                str(Path(__file__).resolve()),
+                "--worker",
+                str(handle.index),
+                "--socket",
+                handle.socket_path,
+                env=worker_env(self.settings, handle.index, len(self.workers)),
+            )
+            handle.started_at = time.monotonic()
+            waiter = asyncio.create_task(self._wait_ready(handle))
+            returncode = await handle.process.wait()
+            waiter.cancel()
+            handle.ready.clear()
+            if self._closing:
+                return
+            uptime = time.monotonic() - handle.started_at
+            if uptime >= STABLE_UPTIME_SECONDS:
+                backoff = RESTART_BACKOFF_MIN_SECONDS
+            handle.restarts += 1
+            logger.error(
+                "Worker %s (pid %s) exited with %s after %.0fs; restarting in %.0fs",
+                handle.index,
+                handle.process.pid,
+                returncode,
+                uptime,
+                backoff,
+            )
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX_SECONDS)
+
+    async def _wait_ready(self, handle: WorkerHandle) -> None:
+        while True:
+            try:
+                handle.last_stats = await self._fetch_stats(handle)
+            except (aiohttp.ClientError, OSError, ValueError, asyncio.TimeoutError):
+                await asyncio.sleep(0.1)
+                continue
+            handle.stats_failures = 0
+            handle.ready.set()
+            logger.info("Worker %s is up (pid %s)", handle.index, handle.process.pid if handle.process else "?")
+            return
+
+    async def _fetch_stats(self, handle: WorkerHandle) -> dict[str, Any]:
+        timeout = aiohttp.ClientTimeout(total=STATS_INTERVAL_SECONDS)
+        async with handle.session.get("http://worker/stats", timeout=timeout) as response:
+            response.raise_for_status()
+            return json_codec.loads(await response.read())
+
+    async def _poll_stats(self) -> None:
+        while True:
+            await asyncio.sleep(STATS_INTERVAL_SECONDS)
+            for handle in self.workers:
+                if not handle.ready.is_set():
+                    continue
+                try:
+                    handle.last_stats = await self._fetch_stats(handle)
+                    handle.stats_failures = 0
+                except (aiohttp.ClientError, OSError, ValueError, asyncio.TimeoutError) as error:
+                    handle.stats_failures += 1
+                    logger.warning("Worker %s stats failed (%s): %s", handle.index, handle.stats_failures, error)
+                    # A live process that stopped answering is as good as crashed.
+                    if handle.stats_failures >= STATS_FAILURES_BEFORE_KILL and handle.process is not None:
+                        handle.process.kill()
+
+    async def _forward(self, handle: WorkerHandle) -> None:
+        # One sender per worker keeps updates in arrival order; batching keeps the
+        # per-update IPC cost low under bursts.
+        while True:
+            batch = [await handle.queue.get()]
+            while len(batch) < FORWARD_BATCH and not handle.queue.empty():
+                batch.append(handle.queue.get_nowait())
+            body = b"[" + b",".join(batch) + b"]"
+            while True:
+                await handle.ready.wait()
+                try:
+                    async with handle.session.post(
+                        "http://worker/updates",
+                        data=body,
+                        headers={"Content-Type": "application/json"},
+                    ) as response:
+                        response.raise_for_status()
+                    break
+                except (aiohttp.ClientError, OSError) as error:
+                    handle.forward_errors += 1
+                    logger.warning("Forwarding to worker %s failed: %s", handle.index, error)
+                    await asyncio.sleep(FORWARD_RETRY_SECONDS)
+            handle.forwarded += len(batch)
+
+
+class TelegramAPI:
+    # The supervisor never parses updates into aiogram objects; it only needs the
+    # raw JSON to route and forward them.
+    def __init__(self, settings: Settings):
+        base = settings.telegram_api_url or DEFAULT_API_URL
+        self._base = f"{base}/bot{settings.bot_token}"
+        self._session = aiohttp.ClientSession(json_serialize=json_codec.dumps_str)
+
+    async def call(self, method: str, payload: dict[str, Any], timeout: float = 10) -> Any:
+        async with self._session.post(
+            f"{self._base}/{method}",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            data = json_codec.loads(await response.read())
+        if not data.get("ok"):
+            raise RuntimeError(f"{method} failed: {data.get('error_code')} {data.get('description')}")
+        return data.get("result")
+
+    async def close(self) -> None:
+        await self._session.close()
+
+
+async def poll_updates(api: TelegramAPI, supervisor: Supervisor, allowed_updates: list[str] | None) -> None:
+    offset: int | None = None
+    backoff = 1.0
+    while True:
+        payload: dict[str, Any] = {"timeout": POLL_TIMEOUT_SECONDS}
+        if offset is not None:
+            payload["offset"] = offset
+        if allowed_updates is not None:
+            payload["allowed_updates"] = allowed_updates
+        try:
+            updates = await api.call("getUpdates", payload, timeout=POLL_TIMEOUT_SECONDS + 10)
+            if not isinstance(updates, list):
+                raise ValueError("getUpdates did not return a list")
+        except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, ValueError) as error:
+            logger.warning("getUpdates failed: %s; retrying in %.0fs", error, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            continue
+        backoff = 1.0
+        for update in updates:
+            offset = update["update_id"] + 1
+            supervisor.dispatch(update)
+
+
+def build_supervisor_webhook_app(supervisor: Supervisor, settings: Settings) -> web.Application:
+    async def on_update(request: web.Request) -> web.Response:
+        secret = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(secret, settings.webhook_secret or ""):
+            return web.Response(status=401)
+        raw = await request.read()
+        try:
+            update = json_codec.loads(raw)
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(update, dict):
+            return web.Response(status=400)
+        # The body is forwarded as received; only the chat id is read here.
+        supervisor.dispatch(update, raw)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(settings.webhook_path, on_update)
+    app.router.add_get("/healthz", on_healthz)
+    return app
+
+
+async def run_supervisor(settings: Settings) -> None:
+    api = TelegramAPI(settings)
+    metrics = MetricsRegistry()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    with tempfile.TemporaryDirectory(prefix="gothyxan-bot-") as socket_dir:
+        supervisor = Supervisor(settings, settings.workers, socket_dir)
+        metrics.add_collector("supervisor", supervisor.stats)
+        runners: list[web.AppRunner] = []
+        source: asyncio.Task[None] | None = None
+        try:
+            await supervisor.start()
+            for handle in supervisor.workers:
+                metrics.add_collector(f"worker_{handle.index}", handle.stats)
+            if settings.metrics_port:
+                runners.append(await start_metrics_server(metrics, settings.metrics_host, settings.metrics_port))
+
+            allowed_updates = await supervisor.allowed_updates()
+            if settings.bot_mode == "webhook":
+                # Every update passes through here; an access log line per update is pure overhead.
+                runner = web.AppRunner(build_supervisor_webhook_app(supervisor, settings), access_log=None)
+                await runner.setup()
+                await web.TCPSite(runner, host=settings.webhook_host, port=settings.webhook_port).start()
+                runners.append(runner)
+                logger.info(
+                    "Supervisor webhook listening on %s:%s%s with %s workers",
+                    settings.webhook_host,
+                    settings.webhook_port,
+                    settings.webhook_path,
+                    settings.workers,
+                )
+                if settings.webhook_url:
+                    payload: dict[str, Any] = {
+                        "url": f"{settings.webhook_url}{settings.webhook_path}",
+                        "secret_token": settings.webhook_secret,
+                    }
+                    if allowed_updates is not None:
+                        payload["allowed_updates"] = allowed_updates
+                    await api.call("setWebhook", payload)
+            else:
+                logger.info("Supervisor polling with %s workers", settings.workers)
+                source = asyncio.create_task(poll_updates(api, supervisor, allowed_updates))
+            await stop.wait()
+        finally:
+            if source is not None:
+                source.cancel()
+                await asyncio.gather(source, return_exceptions=True)
+            for runner in runners:
+                await runner.cleanup()
+            await supervisor.close()
+            await api.close()
+
+
+class UpdateSink:
+    # Worker side: updates are handled as background tasks, as in webhook mode, and
+    # the chat serializer keeps per-chat order.
+    def __init__(self, dispatcher: Any, bot: Any):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.received = 0
+        self.handled = 0
+        self.failed = 0
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def feed(self, update: dict[str, Any]) -> None:
+        self.received += 1
+        task = asyncio.create_task(self._feed(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _feed(self, update: dict[str, Any]) -> None:
+        try:
+            await self.dispatcher.feed_raw_update(self.bot, update)
+        except Exception:
+            self.failed += 1
+            logger.exception("Update %s failed", update.get("update_id"))
+        else:
+            self.handled += 1
+
+    async def drain(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "received": self.received,
+            "handled": self.handled,
+            "failed": self.failed,
+            "in_progress": len(self._tasks),
+        }
+
+
+async def run_worker(index: int, socket_path: str) -> None:
+    # bot.py builds its singletons at import, so each worker process owns its own.
+    import bot as bot_module
+
+    bot = bot_module.build_bot()
+    dispatcher = bot_module.build_dispatcher()
+    sink = UpdateSink(dispatcher, bot)
+    allowed_updates = dispatcher.resolve_used_update_types()
+
+    async def on_updates(request: web.Request) -> web.Response:
+        for update in json_codec.loads(await request.read()):
+            sink.feed(update)
+        return web.Response()
+
+    async def on_stats(_request: web.Request) -> web.Response:
+        stats: dict[str, Any] = {
+            **sink.stats(),
+            "chat_queue_pending": bot_module.chat_serializer.pending,
+            "cpu_seconds": time.process_time(),
+            "allowed_updates": allowed_updates,
+        }
+        return web.Response(body=json_codec.dumps(stats), content_type="application/json")
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_post("/updates", on_updates)
+    app.router.add_get("/stats", on_stats)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    parent = os.getppid()
+    metrics_runner = None
+    try:
+        await dispatcher.emit_startup(bot=bot, **dispatcher.workflow_data)
+        if bot_module.settings.metrics_port:
+            metrics_runner = await start_metrics_server(
+                bot_module.registry,
+                bot_module.settings.metrics_host,
+                bot_module.settings.metrics_port,
+                setup=bot_module.setup_metrics_app,
+            )
+        await web.UnixSite(runner, socket_path).start()
+        logger.info("Worker %s listening on %s", index, socket_path)
+        # Exit with the supervisor rather than linger as an orphan.
+        while not stop.is_set() and os.getppid() == parent:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await runner.cleanup()
+        await sink.drain()
+        await dispatcher.emit_shutdown(bot=bot, **dispatcher.workflow_data)
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot_module.shutdown(bot)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the bot as a supervisor with TELEGRAM_WORKERS worker processes.")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--socket", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.worker is not None:
+        asyncio.run(run_worker(args.worker, args.socket))
+        return
+
+    settings = load_settings()
+    if settings.workers <= 1:
+        import bot as bot_module
+
+        asyncio.run(bot_module.main())
+        return
+    asyncio.run(run_supervisor(settings))
+
+
+if __name__ == "__main__":
+    main()
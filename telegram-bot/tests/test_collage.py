@@ -0,0 +1,31 @@
+import unittest
+
+from collage import CollageRenderer, CollageSlot
+
+PROXY = "https://api.example.com/api/media/proxy?url=https%3A%2F%2Fcdn.example.com%2Fa.jpg&variant=medium"
+
+
+def slots(url: str) -> list[CollageSlot]:
+    return [CollageSlot(label="Top", url=url, brand="Brand", item="Hoodie", category="top")]
+
+
+class CacheKeyTest(unittest.TestCase):
+    def test_key_ignores_the_proxy_signature(self):
+        self.assertEqual(
+            CollageRenderer.cache_key(slots(f"{PROXY}&exp=1&sig=aa")),
+            CollageRenderer.cache_key(slots(f"{PROXY}&exp=2&sig=bb")),
+        )
+
+    def test_key_follows_the_image(self):
+        self.assertNotEqual(
+            CollageRenderer.cache_key(slots(f"{PROXY}&exp=1&sig=aa")),
+            CollageRenderer.cache_key(slots(f"{PROXY.replace('medium', 'high_res')}&exp=1&sig=aa")),
+        )
+        self.assertNotEqual(
+            CollageRenderer.cache_key(slots("https://cdn.example.com/a.jpg")),
+            CollageRenderer.cache_key(slots(None)),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
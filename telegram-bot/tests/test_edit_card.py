@@ -0,0 +1,115 @@
+import os
+import unittest
+from unittest import mock
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import EditMessageText, SendMediaGroup
+
+from outfit_view import OutfitView
+from state import OutfitCard
+
+# bot.py builds its singletons from the environment at import time.
+with mock.patch.dict(
+    os.environ,
+    {
+        "TELEGRAM_BOT_TOKEN": "123456:test",
+        "TELEGRAM_STATE_BACKEND": "memory",
+        "TELEGRAM_STATE_SNAPSHOT_PATH": "",
+        "TELEGRAM_METRICS_PORT": "0",
+        "TELEGRAM_FILE_ID_CACHE_PATH": ":memory:",
+        "TELEGRAM_WRITE_QUEUE_PATH": ":memory:",
+    },
+):
+    import bot
+
+OUTFIT = OutfitView.from_payload({"style": "streetwear"})
+
+
+def photos(*names: str) -> list[tuple[str, str, str, str]]:
+    return [(f"https://cdn.example.com/{name}.jpg", name, name, "medium") for name in names]
+
+
+class EditOutfitCardTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.message = mock.MagicMock()
+        self.message.chat.id = 1
+        self.message.edit_text = mock.AsyncMock()
+        self.message.bot.delete_messages = mock.AsyncMock()
+        self.edit_photo = mock.AsyncMock(return_value=True)
+        self.photos = mock.AsyncMock(return_value=photos("top", "shoes"))
+        for name, value in (("edit_card_photo", self.edit_photo), ("checked_outfit_photos", self.photos)):
+            patcher = mock.patch.object(bot, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def album_card(self) -> OutfitCard:
+        return OutfitCard(
+            text_message_id=10,
+            media_message_ids=[11, 12, 13],
+            media_keys=bot.card_media_keys(photos("old-top", "shoes", "bag")),
+        )
+
+    async def test_changed_photos_are_edited_in_place(self):
+        card = self.album_card()
+        self.assertTrue(await bot.edit_outfit_card(self.message, card, OUTFIT))
+        # Only the first photo changed; the surplus third one is deleted.
+        self.assertEqual([call.args[1] for call in self.edit_photo.await_args_list], [11])
+        self.message.bot.delete_messages.assert_awaited_once_with(chat_id=1, message_ids=[13])
+        self.assertEqual(card.media_message_ids, [11, 12])
+        self.assertEqual(card.media_keys, bot.card_media_keys(photos("top", "shoes")))
+
+    async def test_failed_photo_edit_asks_for_a_new_card(self):
+        self.photos.return_value = photos("top", "boots")
+        self.edit_photo.side_effect = [True, False]
+        card = self.album_card()
+        self.assertFalse(await bot.edit_outfit_card(self.message, card, OUTFIT))
+        self.message.bot.delete_messages.assert_not_awaited()
+
+    async def test_failed_collage_edit_asks_for_a_new_card(self):
+        self.edit_photo.return_value = False
+        card = OutfitCard(text_message_id=10, media_message_ids=[11], media_keys=["old"], collage=True)
+        with mock.patch.object(bot, "render_outfit_collage", mock.AsyncMock(return_value=("new", b"jpeg"))):
+            self.assertFalse(await bot.edit_outfit_card(self.message, card, OUTFIT))
+        self.assertEqual(card.media_keys, ["old"])
+
+    async def test_deleted_card_asks_for_a_new_card(self):
+        self.message.edit_text.side_effect = TelegramBadRequest(
+            EditMessageText(text="x"), "Bad Request: message to edit not found"
+        )
+        with self.assertLogs("bot", "WARNING"):
+            self.assertFalse(await bot.edit_outfit_card(self.message, self.album_card(), OUTFIT))
+        self.edit_photo.assert_not_awaited()
+
+    async def test_larger_album_asks_for_a_new_card(self):
+        self.photos.return_value = photos("a", "b", "c", "d")
+        self.assertFalse(await bot.edit_outfit_card(self.message, self.album_card(), OUTFIT))
+        self.message.edit_text.assert_not_awaited()
+
+
+class SendOutfitPhotosTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.message = mock.MagicMock()
+        self.message.answer_media_group = mock.AsyncMock()
+        self.message.answer_photo = mock.AsyncMock()
+
+    async def test_flood_control_stops_sending(self):
+        self.message.answer_media_group.side_effect = TelegramRetryAfter(
+            SendMediaGroup(chat_id=1, media=[]), "Too Many Requests", 30
+        )
+        with self.assertLogs("bot", "WARNING"):
+            self.assertEqual(await bot.send_outfit_photos(self.message, photos("top", "shoes")), [])
+        self.message.answer_media_group.assert_awaited_once()
+        self.message.answer_photo.assert_not_awaited()
+
+    async def test_failed_group_falls_back_to_one_photo_without_waiting(self):
+        self.message.answer_media_group.side_effect = TelegramBadRequest(
+            SendMediaGroup(chat_id=1, media=[]), "Bad Request: wrong file identifier"
+        )
+        self.message.answer_photo.return_value = mock.MagicMock(message_id=5, photo=[])
+        with self.assertLogs("bot", "WARNING"):
+            self.assertEqual(await bot.send_outfit_photos(self.message, photos("top", "shoes")), [5])
+        self.message.answer_media_group.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
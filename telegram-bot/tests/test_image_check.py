@@ -0,0 +1,66 @@
+import tempfile
+import unittest
+from urllib.parse import quote
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from collage import LocalImageIndex
+from image_check import PHOTO_URL_MAX_BYTES, ImageChecker
+from outfit_view import OutfitPiece
+
+
+async def origin(request: web.Request) -> web.Response:
+    # Telegram-like clients are refused by /browser-only, as some shops do.
+    if request.match_info["name"] == "browser-only" and "Mozilla" not in request.headers.get("User-Agent", ""):
+        return web.Response(status=403)
+    size = PHOTO_URL_MAX_BYTES + 1 if request.match_info["name"] == "big" else 1000
+    return web.Response(headers={"Content-Type": "image/jpeg", "Content-Length": str(size)})
+
+
+def proxied(url: str, variant: str) -> str:
+    return f"https://api.example.com/api/media/proxy?url={quote(url, safe='')}&variant={variant}&exp=1&sig=aa"
+
+
+class ImageCheckerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        app = web.Application()
+        app.router.add_get("/{name}.jpg", origin)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.directory = tempfile.TemporaryDirectory()
+        self.checker = ImageChecker(
+            local_images=LocalImageIndex(self.directory.name), timeout_seconds=2, bad_ttl_seconds=60
+        )
+
+    async def asyncTearDown(self):
+        await self.checker.close()
+        await self.server.close()
+        self.directory.cleanup()
+
+    def piece(self, name: str, *, proxy: bool = True) -> OutfitPiece:
+        url = str(self.server.make_url(f"/{name}.jpg"))
+        image = {"high_res": proxied(url, "high_res"), "medium": proxied(url, "medium")} if proxy else {"high_res": url}
+        return OutfitPiece.from_payload("Top", {"brand": "Brand", "item": "Hoodie", "category": "top", "image": image})
+
+    async def test_small_origin_is_sent_directly(self):
+        piece = self.piece("small")
+        self.assertEqual(await self.checker.choose([piece]), [(str(self.server.make_url("/small.jpg")), "high_res")])
+
+    async def test_oversized_origin_uses_the_resized_proxy(self):
+        piece = self.piece("big")
+        self.assertEqual(await self.checker.choose([piece]), [(piece.collage_url, "medium")])
+        self.assertEqual(self.checker.stats()["swapped_resized"], 1)
+
+    async def test_origin_refusing_telegram_goes_through_the_proxy(self):
+        piece = self.piece("browser-only")
+        self.assertEqual(await self.checker.choose([piece]), [(piece.image_url, "high_res")])
+        self.assertEqual(self.checker.stats()["swapped_proxy"], 1)
+
+    async def test_oversized_origin_without_proxy_is_dropped(self):
+        self.assertEqual(await self.checker.choose([self.piece("big", proxy=False)]), [None])
+        self.assertEqual(self.checker.stats()["dropped"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
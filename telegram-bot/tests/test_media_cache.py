@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+from media_cache import FileIdCache
+
+PROXY = "https://api.example.com/api/media/proxy?url=https%3A%2F%2Fcdn.example.com%2Fa.jpg&variant=medium"
+
+
+class FileIdCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "file-ids.sqlite3")
+
+    async def asyncTearDown(self):
+        self.directory.cleanup()
+
+    async def reopen(self, cache: FileIdCache, max_entries: int = 100) -> FileIdCache:
+        await cache.close()
+        cache = FileIdCache(self.path, max_entries=max_entries)
+        cache.get(("warm-up", "medium"))
+        await cache._task
+        return cache
+
+    async def test_invalidate_drops_entry_in_memory_and_on_disk(self):
+        cache = FileIdCache(self.path, max_entries=100)
+        cache.set_many(
+            {("https://cdn.example.com/a.jpg", "medium"): "A", ("https://cdn.example.com/b.jpg", "medium"): "B"}
+        )
+        cache.invalidate([("https://cdn.example.com/a.jpg", "medium")])
+        self.assertIsNone(cache.get(("https://cdn.example.com/a.jpg", "medium")))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+        cache = await self.reopen(cache)
+        self.assertIsNone(cache.get(("https://cdn.example.com/a.jpg", "medium")))
+        self.assertEqual(cache.get(("https://cdn.example.com/b.jpg", "medium")), "B")
+        await cache.close()
+
+    async def test_invalidating_unknown_key_is_a_no_op(self):
+        cache = FileIdCache(self.path, max_entries=100)
+        cache.invalidate([("https://cdn.example.com/missing.jpg", "medium")])
+        self.assertEqual(cache.stats()["invalidations"], 0)
+        await cache.close()
+
+    async def test_replaced_file_id_survives_restart(self):
+        cache = FileIdCache(self.path, max_entries=100)
+        cache.set_many({("https://cdn.example.com/a.jpg", "medium"): "old"})
+        cache.invalidate([("https://cdn.example.com/a.jpg", "medium")])
+        cache.set_many({("https://cdn.example.com/a.jpg", "medium"): "new"})
+        cache = await self.reopen(cache)
+        self.assertEqual(cache.get(("https://cdn.example.com/a.jpg", "medium")), "new")
+        await cache.close()
+
+    async def test_proxy_urls_are_keyed_by_origin(self):
+        cache = FileIdCache(self.path, max_entries=100)
+        cache.set_many({(f"{PROXY}&exp=1&sig=aa", "medium"): "A"})
+        self.assertEqual(cache.get((f"{PROXY}&exp=2&sig=bb", "medium")), "A")
+        self.assertEqual(cache.get(("https://cdn.example.com/a.jpg", "medium")), "A")
+        self.assertIsNone(cache.get((f"{PROXY}&exp=2&sig=bb", "high_res")))
+        cache.invalidate([(f"{PROXY}&exp=3&sig=cc", "medium")])
+        self.assertIsNone(cache.get(("https://cdn.example.com/a.jpg", "medium")))
+        await cache.close()
+
+    async def test_evicts_least_recently_used(self):
+        cache = FileIdCache(self.path, max_entries=2)
+        cache.set_many({("a", "medium"): "A", ("b", "medium"): "B"})
+        cache.get(("a", "medium"))
+        cache.set_many({("c", "medium"): "C"})
+        self.assertIsNone(cache.get(("b", "medium")))
+        cache = await self.reopen(cache, max_entries=2)
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertIsNone(cache.get(("b", "medium")))
+        await cache.close()
+
+    async def test_database_errors_do_not_raise(self):
+        # A directory where the sqlite file should be: every open fails.
+        os.mkdir(self.path)
+        cache = FileIdCache(self.path, max_entries=100)
+        with self.assertLogs("media_cache", "WARNING"):
+            cache.set_many({("a", "medium"): "A"})
+            await cache._task
+            self.assertEqual(cache.get(("a", "medium")), "A")
+            self.assertEqual(cache.stats()["errors"], 2)
+            cache.invalidate([("a", "medium")])
+            await cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import time
+import unittest
+from typing import Any
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMediaGroup, SendMessage, TelegramMethod
+from aiogram.types import InputMediaPhoto
+
+from outbound import OutboundScheduler
+
+
+def album(size: int, chat_id: int = 1) -> SendMediaGroup:
+    return SendMediaGroup(
+        chat_id=chat_id, media=[InputMediaPhoto(media=f"https://cdn.example.com/{index}.jpg") for index in range(size)]
+    )
+
+
+class FakeTelegram:
+    # make_request for the middleware: answers True, or raises the queued flood errors first.
+    def __init__(self):
+        self.calls: list[TelegramMethod[Any]] = []
+        self.flood: list[int] = []
+
+    async def __call__(self, _bot: Any, method: TelegramMethod[Any]) -> Any:
+        self.calls.append(method)
+        if self.flood:
+            raise TelegramRetryAfter(method, "Too Many Requests", self.flood.pop(0))
+        return True
+
+
+class OutboundSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.telegram = FakeTelegram()
+        self.scheduler = OutboundScheduler(global_rate=30, chat_rate=1, chat_burst=3, max_retries=0)
+
+    async def asyncTearDown(self):
+        await self.scheduler.close()
+
+    async def send(self, method: TelegramMethod[Any]) -> Any:
+        return await self.scheduler(self.telegram, None, method)
+
+    async def test_media_group_weighs_on_the_chat_bucket(self):
+        await self.send(album(3))
+        chat = self.scheduler._chat_bucket(1)
+        self.assertAlmostEqual(chat.delay_for(1), 1.0, places=1)
+        self.assertAlmostEqual(self.scheduler.global_bucket.tokens, 27, places=0)
+
+    async def test_album_larger_than_the_burst_leaves_debt(self):
+        await self.send(album(5))
+        chat = self.scheduler._chat_bucket(1)
+        # 5 photos against a burst of 3: the next message waits until 1 token is back.
+        self.assertAlmostEqual(chat.delay_for(1), 3.0, places=1)
+        self.assertEqual(self.scheduler._chat_bucket(2).delay_for(1), 0.0)
+
+    async def test_flood_on_an_idle_chat_blocks_every_chat(self):
+        self.telegram.flood = [7]
+        with self.assertRaises(TelegramRetryAfter):
+            await self.send(SendMessage(chat_id=1, text="hi"))
+        self.assertGreater(self.scheduler.global_bucket.blocked_until, time.monotonic() + 6)
+        self.assertGreater(self.scheduler._chat_bucket(1).delay_for(1), 6)
+        self.assertEqual(self.scheduler.stats()["global_blocks"], 1)
+
+    async def test_flood_on_a_busy_chat_blocks_only_that_chat(self):
+        await self.send(SendMessage(chat_id=1, text="first"))
+        self.telegram.flood = [7]
+        with self.assertRaises(TelegramRetryAfter):
+            await self.send(SendMessage(chat_id=1, text="second"))
+        self.assertGreater(self.scheduler._chat_bucket(1).delay_for(1), 6)
+        self.assertEqual(self.scheduler.global_bucket.delay_for(1), 0.0)
+        self.assertEqual(self.scheduler.stats()["global_blocks"], 0)
+
+    async def test_flood_is_retried(self):
+        self.scheduler.max_retries = 2
+        self.telegram.flood = [0]
+        with self.assertLogs("outbound", "WARNING"):
+            self.assertTrue(await self.send(SendMessage(chat_id=1, text="hi")))
+        self.assertEqual(len(self.telegram.calls), 2)
+        stats = self.scheduler.stats()
+        self.assertEqual((stats["sent"], stats["retries"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
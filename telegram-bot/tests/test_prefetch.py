@@ -0,0 +1,143 @@
+import asyncio
+import unittest
+
+from api_client import BackendError, StreamUnavailable
+from cache import TTLCache
+from outfit_view import OutfitView
+from prefetch import Entitlement, PrefetchScheduler, RateWindow
+from state import OutfitRequestState, apply_budget_action
+
+REQUEST = OutfitRequestState(style="streetwear", budget_mode="custom", budget_min=200, budget_max=900)
+
+
+def make_scheduler(quota_reserve: int = 2) -> PrefetchScheduler:
+    return PrefetchScheduler(
+        TTLCache(100, 600),
+        user_window=RateWindow(8, 60),
+        global_window=RateWindow(600, 60),
+        user_reserve=0,
+        global_reserve=0,
+        quota_reserve=quota_reserve,
+    )
+
+
+class EntitlementTest(unittest.TestCase):
+    def test_free_subscription(self):
+        entitlement = Entitlement.from_subscription(
+            {"tier": "FREE", "dailyGenerationLimit": 20, "generationsToday": 7, "luxuryOnlyEnabled": False}
+        )
+        self.assertEqual(entitlement, Entitlement(luxury=False, remaining=13))
+
+    def test_unlimited_subscription(self):
+        entitlement = Entitlement.from_subscription({"unlimitedGenerations": True, "luxuryOnlyEnabled": True})
+        self.assertEqual(entitlement, Entitlement(luxury=True, remaining=None))
+
+
+class ScheduleTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requested: list[OutfitRequestState] = []
+        self.release = asyncio.Event()
+
+    async def generate(self, variant: OutfitRequestState) -> OutfitView:
+        self.requested.append(variant)
+        await self.release.wait()
+        return OutfitView.from_payload({"style": variant.style})
+
+    async def test_unknown_entitlement_schedules_nothing(self):
+        scheduler = make_scheduler()
+        scheduler.schedule(1, REQUEST, self.generate)
+        await asyncio.sleep(0)
+        self.assertEqual(self.requested, [])
+        self.assertEqual(scheduler.stats()["skipped_entitlement"], 1)
+
+    async def test_free_account_never_prefetches_luxury(self):
+        scheduler = make_scheduler()
+        scheduler.remember(1, Entitlement(luxury=False, remaining=15))
+        scheduler.schedule(1, REQUEST, self.generate)
+        await asyncio.sleep(0)
+        self.assertEqual([variant.luxury_only for variant in self.requested], [False])
+        self.assertEqual(scheduler.entitlements.get(1).remaining, 14)
+        scheduler.cancel(1)
+
+    async def test_luxury_account_prefetches_both(self):
+        scheduler = make_scheduler()
+        scheduler.remember(1, Entitlement(luxury=True, remaining=None))
+        scheduler.schedule(1, REQUEST, self.generate)
+        await asyncio.sleep(0)
+        self.assertEqual([variant.luxury_only for variant in self.requested], [False, True])
+        scheduler.cancel(1)
+
+    async def test_stops_near_daily_limit(self):
+        scheduler = make_scheduler(quota_reserve=3)
+        scheduler.remember(1, Entitlement(luxury=True, remaining=4))
+        scheduler.schedule(1, REQUEST, self.generate)
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.requested), 1)
+        self.assertEqual(scheduler.stats()["skipped_budget"], 1)
+        # The user's own generation spends quota too, leaving nothing spare.
+        scheduler.record_generation(1)
+        scheduler.schedule(1, REQUEST, self.generate)
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.requested), 1)
+        scheduler.cancel(1)
+
+    async def test_take_returns_finished_prefetch(self):
+        scheduler = make_scheduler()
+        scheduler.remember(1, Entitlement(luxury=False, remaining=None))
+        scheduler.schedule(1, REQUEST, self.generate)
+        task = scheduler.take(1, apply_budget_action(REQUEST, "cheaper"))
+        self.release.set()
+        outfit = await scheduler.wait(task)
+        self.assertEqual(outfit.style, "streetwear")
+        self.assertTrue(scheduler.shown(1, apply_budget_action(REQUEST, "cheaper")))
+        self.assertFalse(scheduler.shown(1, apply_budget_action(REQUEST, "cheaper")))
+
+    async def test_cached_prefetch_is_reported_shown_once(self):
+        scheduler = make_scheduler()
+        scheduler.remember(1, Entitlement(luxury=False, remaining=None))
+        scheduler.schedule(1, REQUEST, self.generate)
+        self.release.set()
+        await asyncio.sleep(0.01)
+        variant = apply_budget_action(REQUEST, "cheaper")
+        self.assertIsNotNone(scheduler.cache.get((1, variant.cache_key())))
+        self.assertFalse(scheduler.shown(1, REQUEST))
+        self.assertTrue(scheduler.shown(1, variant))
+        self.assertFalse(scheduler.shown(1, variant))
+        self.assertEqual(scheduler.stats()["served"], 1)
+
+
+class WaitFallbackTest(unittest.IsolatedAsyncioTestCase):
+    async def assert_falls_back(self, error: BaseException) -> None:
+        scheduler = make_scheduler()
+
+        async def failing() -> OutfitView:
+            raise error
+
+        task = asyncio.create_task(failing())
+        with self.assertLogs("prefetch", "WARNING"):
+            self.assertIsNone(await scheduler.wait(task))
+        self.assertEqual(scheduler.stats()["failed"], 1)
+
+    async def test_backend_error(self):
+        await self.assert_falls_back(BackendError(503, "/outfits/generate", "unavailable"))
+
+    async def test_timeout(self):
+        await self.assert_falls_back(asyncio.TimeoutError())
+
+    async def test_stream_unavailable(self):
+        await self.assert_falls_back(StreamUnavailable("stream disconnected"))
+
+    async def test_unexpected_error(self):
+        await self.assert_falls_back(KeyError("style"))
+
+    async def test_cancellation_propagates(self):
+        scheduler = make_scheduler()
+        task = asyncio.create_task(asyncio.sleep(10))
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await scheduler.wait(task)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import unittest
+from unittest import mock
+
+from api_client import BackendAuthError, BackendSession
+from state import BotStateStore, ChatState, OutfitCard
+
+# bot.py builds its singletons from the environment at import time.
+with mock.patch.dict(
+    os.environ,
+    {
+        "TELEGRAM_BOT_TOKEN": "123456:test",
+        "TELEGRAM_STATE_BACKEND": "memory",
+        "TELEGRAM_STATE_SNAPSHOT_PATH": "",
+        "TELEGRAM_METRICS_PORT": "0",
+        "TELEGRAM_FILE_ID_CACHE_PATH": ":memory:",
+        "TELEGRAM_WRITE_QUEUE_PATH": ":memory:",
+    },
+):
+    import bot
+
+
+def session(name: str) -> BackendSession:
+    return BackendSession(access_token=f"{name}-access", refresh_token=f"{name}-refresh", token_type="Bearer")
+
+
+class SessionRefreshTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store = BotStateStore()
+        self.tokens = mock.MagicMock()
+        self.tokens.refresh = mock.AsyncMock(return_value=session("fresh"))
+        for name, value in (("store", self.store), ("tokens", self.tokens)):
+            patcher = mock.patch.object(bot, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        await self.store.set_chat_state(1, ChatState(backend_session=session("old")))
+
+    async def test_write_behind_refresh_keeps_state_stored_meanwhile(self):
+        async def refresh(*_args):
+            # A handler sends a new card while the refresh is in flight.
+            state = ChatState(backend_session=session("old"), card=OutfitCard(text_message_id=7))
+            await self.store.set_chat_state(1, state)
+            return session("fresh")
+
+        self.tokens.refresh.side_effect = refresh
+        self.assertEqual(await bot.write_behind_token(1, "1", None, "old-access"), "fresh-access")
+        state = await self.store.get_chat_state(1)
+        self.assertEqual(state.backend_session, session("fresh"))
+        self.assertEqual(state.card.text_message_id, 7)
+
+    async def call(self, chat_state: ChatState, rejected: set[str]):
+        message = mock.MagicMock()
+        message.chat.id = 1
+        message.from_user.id = 1
+        message.from_user.username = None
+        used: list[str] = []
+
+        async def fn(token: str) -> dict[str, str]:
+            used.append(token)
+            if token in rejected:
+                raise BackendAuthError(401, "/outfits/generate", "Unauthorized")
+            return {"token": token}
+
+        return await bot.call_with_refresh(message, chat_state, fn), used
+
+    async def test_session_refreshed_meanwhile_is_reused(self):
+        chat_state = await self.store.get_chat_state(1)
+        stale = ChatState(backend_session=chat_state.backend_session)
+        await self.store.update_session(1, session("other"))
+        result, used = await self.call(stale, {"old-access"})
+        self.assertEqual(result, {"token": "other-access"})
+        self.assertEqual(used, ["old-access", "other-access"])
+        self.tokens.refresh.assert_not_awaited()
+
+    async def test_rejected_session_is_refreshed_and_stored(self):
+        chat_state = await self.store.get_chat_state(1)
+        result, used = await self.call(chat_state, {"old-access"})
+        self.assertEqual(result, {"token": "fresh-access"})
+        self.tokens.refresh.assert_awaited_once()
+        self.assertEqual((await self.store.get_chat_state(1)).backend_session, session("fresh"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import unittest
+from typing import Any
+from unittest import mock
+
+import socketio
+
+from api_client import (
+    STREAM_PATH,
+    BackendAuthError,
+    BackendClient,
+    BackendError,
+    OutfitStreamPool,
+    StreamUnavailable,
+)
+from config import load_settings
+
+
+class FakeSocket:
+    # Stands in for socketio.AsyncClient: records emits and lets a test fire gateway events.
+    instances: list["FakeSocket"] = []
+    refuse = False
+
+    def __init__(self, **_options: Any):
+        self.handlers: dict[str, Any] = {}
+        self.connected = False
+        self.emitted: list[dict[str, Any]] = []
+        FakeSocket.instances.append(self)
+
+    def on(self, event: str, handler: Any, namespace: str | None = None) -> None:
+        self.handlers[event] = handler
+
+    async def connect(self, *_args: Any, **_kwargs: Any) -> None:
+        if FakeSocket.refuse:
+            raise socketio.exceptions.ConnectionError("refused")
+        self.connected = True
+
+    async def emit(self, _event: str, payload: dict[str, Any], namespace: str | None = None) -> None:
+        self.emitted.append(payload)
+
+    async def disconnect(self) -> None:
+        self.connected = False
+
+    async def fire(self, event: str, *args: Any) -> None:
+        await self.handlers[event](*args)
+
+
+async def no_step(_step: str) -> None:
+    return None
+
+
+class StreamPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        FakeSocket.instances = []
+        FakeSocket.refuse = False
+        patcher = mock.patch("socketio.AsyncClient", FakeSocket)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = OutfitStreamPool("http://backend", max_connections=4, idle_seconds=60, timeout_seconds=0.05)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    async def answer(self, socket_index: int, result: dict[str, Any]) -> None:
+        while len(FakeSocket.instances) <= socket_index or not FakeSocket.instances[socket_index].emitted:
+            await asyncio.sleep(0)
+        await FakeSocket.instances[socket_index].fire("result", result)
+
+    async def test_connection_is_reused_after_a_result(self):
+        first = asyncio.create_task(self.pool.generate("token", {"style": "a"}, no_step))
+        await self.answer(0, {"style": "a"})
+        self.assertEqual(await first, {"style": "a"})
+        second = asyncio.create_task(self.pool.generate("token", {"style": "b"}, no_step))
+        await asyncio.sleep(0)
+        self.assertEqual(len(FakeSocket.instances), 1)
+        await FakeSocket.instances[0].fire("result", {"style": "b"})
+        self.assertEqual(await second, {"style": "b"})
+
+    async def test_timeout_discards_connection(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.pool.generate("token", {"style": "slow"}, no_step)
+        stale = FakeSocket.instances[0]
+        self.assertFalse(stale.connected)
+        self.assertEqual(self.pool.stats()["abandoned"], 1)
+
+        # The next request reconnects, and a late result on the old socket cannot answer it.
+        call = asyncio.create_task(self.pool.generate("token", {"style": "next"}, no_step))
+        await self.answer(1, {"style": "next"})
+        await stale.fire("result", {"style": "slow"})
+        self.assertEqual(await call, {"style": "next"})
+        self.assertEqual(self.pool.stats()["connects"], 2)
+
+    async def test_cancellation_discards_connection(self):
+        call = asyncio.create_task(self.pool.generate("token", {"style": "a"}, no_step))
+        while not FakeSocket.instances or not FakeSocket.instances[0].emitted:
+            await asyncio.sleep(0)
+        call.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await call
+        self.assertFalse(FakeSocket.instances[0].connected)
+        self.assertEqual(self.pool.stats()["connections"], 0)
+
+    async def test_waiter_on_a_discarded_connection_is_not_sent(self):
+        first = asyncio.create_task(self.pool.generate("token", {"style": "a"}, no_step))
+        second = asyncio.create_task(self.pool.generate("token", {"style": "b"}, no_step))
+        with self.assertRaises(asyncio.TimeoutError):
+            await first
+        with self.assertRaises(StreamUnavailable):
+            await second
+        self.assertEqual(FakeSocket.instances[0].emitted, [{"style": "a"}])
+
+    async def test_disconnect_after_send_is_a_backend_error(self):
+        call = asyncio.create_task(self.pool.generate("token", {"style": "a"}, no_step))
+        while not FakeSocket.instances or not FakeSocket.instances[0].emitted:
+            await asyncio.sleep(0)
+        await FakeSocket.instances[0].fire("disconnect")
+        with self.assertRaises(BackendError) as raised:
+            await call
+        self.assertNotIsInstance(raised.exception, StreamUnavailable)
+        self.assertEqual(raised.exception.status, 502)
+
+    async def test_gateway_error_body_maps_like_rest(self):
+        call = asyncio.create_task(self.pool.generate("token", {"style": "a", "luxuryOnly": True}, no_step))
+        while not FakeSocket.instances or not FakeSocket.instances[0].emitted:
+            await asyncio.sleep(0)
+        await FakeSocket.instances[0].fire(
+            "error",
+            {"statusCode": 403, "message": "Luxury-only mode requires premium subscription", "error": "Forbidden"},
+        )
+        with self.assertRaises(BackendAuthError) as raised:
+            await call
+        self.assertEqual(raised.exception.status, 403)
+        self.assertEqual(raised.exception.message, "Luxury-only mode requires premium subscription")
+
+
+class GenerateFallbackTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        with mock.patch.dict(os.environ, {"TELEGRAM_BOT_TOKEN": "123456:test", "TELEGRAM_BREAKER_FAILURES": "2"}):
+            self.client = BackendClient(load_settings())
+        self.streams = self.client.streams = mock.AsyncMock(timeout_seconds=30.0)
+        self.rest = self.client._request = mock.AsyncMock(return_value={"style": "rest"})
+
+    async def generate(self) -> dict[str, Any]:
+        return await self.client.generate_outfit(
+            "token", style="a", occasion=None, city=None, budget_mode="cheaper", on_step=no_step
+        )
+
+    async def test_unsent_request_falls_back_to_rest(self):
+        self.streams.generate.side_effect = StreamUnavailable("refused")
+        with self.assertLogs("api_client", "WARNING"):
+            self.assertEqual(await self.generate(), {"style": "rest"})
+        self.rest.assert_awaited_once()
+
+    async def test_sent_request_is_not_generated_twice(self):
+        self.streams.generate.side_effect = BackendError(502, "/outfits (ws)", "stream disconnected")
+        with self.assertRaises(BackendError):
+            await self.generate()
+        self.rest.assert_not_awaited()
+
+    async def test_timeout_is_not_generated_twice(self):
+        self.streams.generate.side_effect = asyncio.TimeoutError()
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.generate()
+        self.rest.assert_not_awaited()
+
+    async def test_stream_failures_open_the_breaker_and_fall_back_to_rest(self):
+        self.streams.generate.side_effect = BackendError(500, STREAM_PATH, "boom")
+        with self.assertLogs("resilience", "WARNING"):
+            for _ in range(2):
+                with self.assertRaises(BackendError):
+                    await self.generate()
+        with self.assertLogs("api_client", "WARNING"):
+            self.assertEqual(await self.generate(), {"style": "rest"})
+        self.assertEqual(self.streams.generate.await_count, 2)
+
+    async def test_refused_stream_does_not_count_against_the_breaker(self):
+        self.streams.generate.side_effect = StreamUnavailable("refused")
+        with self.assertLogs("api_client", "WARNING"):
+            for _ in range(3):
+                self.assertEqual(await self.generate(), {"style": "rest"})
+        self.assertIsNone(self.client.breakers.get(STREAM_PATH).retry_after())
+        self.assertEqual(self.streams.generate.await_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
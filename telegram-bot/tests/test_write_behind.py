@@ -0,0 +1,145 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+import zlib
+from typing import Any
+from unittest import mock
+
+import json_codec
+from write_behind import KIND_FEEDBACK, KIND_SAVE, WriteBehindQueue
+
+
+class FakeBackend:
+    # Applies a batch the way recordBatch does: entries whose idempotency key was already
+    # written are skipped. lose_responses makes the next calls commit and then time out.
+    def __init__(self):
+        self.written: dict[str, dict[str, Any]] = {}
+        self.calls: list[dict[str, Any]] = []
+        self.lose_responses = 0
+
+    async def write_batch(self, access_token: str, *, saves: list[dict[str, Any]], feedback: list[dict[str, Any]]):
+        self.calls.append({"saves": saves, "feedback": feedback})
+        for entry in saves + feedback:
+            self.written.setdefault(entry["idempotencyKey"], entry)
+        if self.lose_responses:
+            self.lose_responses -= 1
+            raise asyncio.TimeoutError()
+        return {"saved": len(saves), "feedback": len(feedback)}
+
+
+async def token_provider(_chat_id: int, _telegram_id: str, _username: str | None, _rejected: str | None) -> str:
+    return "token"
+
+
+def body(payload: dict[str, Any]) -> bytes:
+    return zlib.compress(json_codec.dumps(payload), 1)
+
+
+class WriteBehindQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "writes.sqlite3")
+        self.backend = FakeBackend()
+        # Retries become due at once, so the next flush() replays them.
+        patcher = mock.patch("write_behind.retry_delay", return_value=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        self.directory.cleanup()
+
+    def open_queue(self) -> WriteBehindQueue:
+        queue = WriteBehindQueue(
+            self.backend,
+            token_provider,
+            path=self.path,
+            max_entries=100,
+            max_age_seconds=3600,
+            flush_interval_seconds=60,
+            flush_concurrency=2,
+        )
+        # Flushed by hand below; the background flusher would race the assertions.
+        queue.start = lambda: None
+        return queue
+
+    async def test_replay_after_lost_response_resends_the_same_keys(self):
+        queue = self.open_queue()
+        queue.enqueue(1, "1", None, KIND_SAVE, body({"style": "a"}), b"a")
+        queue.enqueue(1, "1", None, KIND_FEEDBACK, body({"rating": 5}), b"a5")
+        self.backend.lose_responses = 1
+        with self.assertLogs("write_behind", "WARNING"):
+            await queue.flush()
+        self.assertEqual(queue.stats()["queued"], 2)
+        await queue.flush()
+
+        first, second = self.backend.calls
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.backend.written), 2)
+        self.assertEqual(first["feedback"][0]["rating"], 5)
+        self.assertEqual(queue.stats()["queued"], 0)
+        self.assertEqual(queue.stats()["retries"], 2)
+        await queue.close()
+
+    async def test_keys_survive_restart(self):
+        queue = self.open_queue()
+        queue.enqueue(1, "1", None, KIND_SAVE, body({"style": "a"}), b"a")
+        self.backend.lose_responses = 1
+        with self.assertLogs("write_behind", "WARNING"):
+            await queue.flush()
+        # A restart with the batch still queued (close() would flush it).
+        queue._db.close()
+
+        queue = self.open_queue()
+        await queue.flush()
+        first, second = self.backend.calls
+        self.assertEqual(first["saves"][0]["idempotencyKey"], second["saves"][0]["idempotencyKey"])
+        self.assertEqual(len(self.backend.written), 1)
+        await queue.close()
+
+    async def test_double_tap_is_coalesced(self):
+        queue = self.open_queue()
+        self.assertTrue(queue.enqueue(1, "1", None, KIND_SAVE, body({"style": "a"}), b"a"))
+        self.assertTrue(queue.enqueue(1, "1", None, KIND_SAVE, body({"style": "a"}), b"a"))
+        await queue.flush()
+        self.assertEqual(len(self.backend.calls[0]["saves"]), 1)
+        self.assertEqual(queue.stats()["coalesced"], 1)
+        await queue.close()
+
+    async def test_saving_again_after_a_write_is_a_new_entry(self):
+        queue = self.open_queue()
+        queue.enqueue(1, "1", None, KIND_SAVE, body({"style": "a"}), b"a")
+        await queue.flush()
+        queue.enqueue(1, "1", None, KIND_SAVE, body({"style": "a"}), b"a")
+        await queue.flush()
+        self.assertEqual(len(self.backend.written), 2)
+        await queue.close()
+
+    async def test_queue_file_without_keys_is_migrated(self):
+        db = sqlite3.connect(self.path)
+        db.execute(
+            "CREATE TABLE writes ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, telegram_id TEXT NOT NULL, "
+            "username TEXT, kind TEXT NOT NULL, body BLOB NOT NULL, digest TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, created_at REAL NOT NULL, "
+            "UNIQUE (chat_id, kind, digest))"
+        )
+        db.executemany(
+            "INSERT INTO writes (chat_id, telegram_id, kind, body, digest, next_attempt_at, created_at) "
+            "VALUES (1, '1', ?, ?, ?, 0, strftime('%s', 'now'))",
+            [(KIND_SAVE, body({"style": "a"}), "a"), (KIND_SAVE, body({"style": "b"}), "b")],
+        )
+        db.commit()
+        db.close()
+
+        queue = self.open_queue()
+        await queue.flush()
+        keys = [save["idempotencyKey"] for save in self.backend.calls[0]["saves"]]
+        self.assertEqual(len(set(keys)), 2)
+        self.assertTrue(all(keys))
+        await queue.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
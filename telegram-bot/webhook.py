@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+async def on_healthz(_request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+def build_webhook_app(dispatcher: Dispatcher, bot: Bot, settings: Settings) -> web.Application:
+    app = web.Application()
+    # Telegram only needs a 200 back; handlers run as background tasks so a slow
+    # backend call never holds the webhook connection open.
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=settings.webhook_secret,
+    ).register(app, path=settings.webhook_path)
+    app.router.add_get("/healthz", on_healthz)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, settings: Settings) -> None:
+    app = build_webhook_app(dispatcher, bot, settings)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=settings.webhook_host, port=settings.webhook_port)
+    await site.start()
+    logger.info(
+        "Webhook server listening on %s:%s%s",
+        settings.webhook_host,
+        settings.webhook_port,
+        settings.webhook_path,
+    )
+
+    # Replicas behind a load balancer share one public URL; only instances that
+    # are given TELEGRAM_WEBHOOK_URL register it with Telegram.
+    if settings.webhook_url:
+        await bot.set_webhook(
+            url=f"{settings.webhook_url}{settings.webhook_path}",
+            secret_token=settings.webhook_secret,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+
+    # Return on SIGTERM too (docker stop), so shutdown() still runs and snapshots state.
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
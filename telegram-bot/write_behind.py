@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+
+import json_codec
+from api_client import BackendAuthError, BackendClient, BackendError
+from resilience import detached
+
+logger = logging.getLogger(__name__)
+
+# Same cap as OUTFIT_BATCH_MAX_ITEMS on the backend's POST /outfits/batch.
+BATCH_MAX_ITEMS = 50
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 300.0
+
+KIND_SAVE = "save"
+KIND_FEEDBACK = "feedback"
+
+# (chat_id, telegram_id, username, rejected access token or None) -> access token
+TokenProvider = Callable[[int, str, "str | None", "str | None"], Awaitable[str]]
+
+
+@dataclass(frozen=True)
+class QueuedWrite:
+    id: int
+    chat_id: int
+    telegram_id: str
+    username: str | None
+    kind: str
+    body: bytes
+    attempts: int
+    idempotency_key: str
+
+
+def retry_delay(attempts: int) -> float:
+    # Exponential backoff with full jitter, so a backend outage does not end in a retry stampede.
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2**attempts))
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, BackendError):
+        return error.status >= 500 or error.status in (408, 429)
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError))
+
+
+class WriteBehindQueue:
+    # Saves and feedback are acknowledged to the user as soon as they are queued. Entries
+    # live in sqlite (bounded by max_entries, nothing kept in memory), survive restarts, and
+    # are flushed per chat as one POST /outfits/batch with retries and backoff. Each entry
+    # carries an idempotency key fixed at enqueue time: a batch whose response was lost
+    # (timeout, restart mid-request) is resent as is, and the backend skips entries it has
+    # already written.
+    def __init__(
+        self,
+        backend: BackendClient,
+        token_provider: TokenProvider,
+        *,
+        path: str,
+        max_entries: int,
+        max_age_seconds: float,
+        flush_interval_seconds: float,
+        flush_concurrency: int,
+    ):
+        self.backend = backend
+        self.token_provider = token_provider
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.flush_interval_seconds = flush_interval_seconds
+        self.flush_concurrency = flush_concurrency
+        self.enqueued = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.expired = 0
+
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        # WAL without fsync per commit: enqueue stays cheap and still survives a process crash.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS writes ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, telegram_id TEXT NOT NULL, "
+            "username TEXT, kind TEXT NOT NULL, body BLOB NOT NULL, digest TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, created_at REAL NOT NULL, "
+            "idempotency_key TEXT, UNIQUE (chat_id, kind, digest))"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(writes)")}
+        if "idempotency_key" not in columns:
+            # Queue file from before idempotency keys: give the entries still waiting one each.
+            self._db.execute("ALTER TABLE writes ADD COLUMN idempotency_key TEXT")
+            self._db.execute("UPDATE writes SET idempotency_key = lower(hex(randomblob(16)))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS writes_due ON writes (next_attempt_at)")
+        self._db.commit()
+        self.queued = self._db.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            # enqueue() may start the worker from a handler; it must not keep that tap's deadline.
+            with detached():
+                self._task = asyncio.create_task(self._run())
+
+    def enqueue(
+        self,
+        chat_id: int,
+        telegram_id: str,
+        username: str | None,
+        kind: str,
+        body: bytes,
+        dedupe_key: bytes,
+    ) -> bool:
+        # body is zlib-compressed JSON: the outfit for a save (OutfitView.blob as is), the
+        # OutfitFeedbackDto fields for feedback. Returns False when the queue is full, so
+        # the caller can fall back to a direct write.
+        if self.queued >= self.max_entries:
+            self.rejected += 1
+            return False
+        digest = hashlib.sha1(dedupe_key).hexdigest()
+        now = time.time()
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO writes "
+            "(chat_id, telegram_id, username, kind, body, digest, next_attempt_at, created_at, idempotency_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (chat_id, telegram_id, username, kind, body, digest, now, now, uuid.uuid4().hex),
+        )
+        self._db.commit()
+        if cursor.rowcount == 0:
+            # The same save or rating is already waiting for this chat (double tap).
+            self.coalesced += 1
+            return True
+        self.enqueued += 1
+        self.queued += 1
+        self.start()
+        self._wake.set()
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+    async def flush(self) -> None:
+        # Let a burst of taps accumulate for a moment so it goes out as fewer requests.
+        await asyncio.sleep(0.05)
+        self._expire()
+        rows = self._db.execute(
+            "SELECT id, chat_id, telegram_id, username, kind, body, attempts, idempotency_key FROM writes "
+            "WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (time.time(), self.flush_concurrency * BATCH_MAX_ITEMS),
+        ).fetchall()
+        groups: dict[int, list[QueuedWrite]] = defaultdict(list)
+        for row in rows:
+            groups[row[1]].append(QueuedWrite(*row))
+        batches = [
+            entries[start : start + BATCH_MAX_ITEMS]
+            for entries in groups.values()
+            for start in range(0, len(entries), BATCH_MAX_ITEMS)
+        ]
+        semaphore = asyncio.Semaphore(self.flush_concurrency)
+
+        async def send(batch: list[QueuedWrite]) -> None:
+            async with semaphore:
+                await self._send(batch)
+
+        await asyncio.gather(*(send(batch) for batch in batches))
+
+    async def _send(self, batch: list[QueuedWrite]) -> None:
+        first = batch[0]
+        saves: list[dict[str, Any]] = []
+        feedback: list[dict[str, Any]] = []
+        for entry in batch:
+            item = json_codec.loads(zlib.decompress(entry.body))
+            if entry.kind == KIND_SAVE:
+                saves.append({"idempotencyKey": entry.idempotency_key, "channel": "TELEGRAM", "outfit": item})
+            else:
+                feedback.append({"idempotencyKey": entry.idempotency_key, **item})
+
+        async def write(access_token: str) -> dict[str, Any]:
+            return await self.backend.write_batch(access_token, saves=saves, feedback=feedback)
+
+        try:
+            token = await self.token_provider(first.chat_id, first.telegram_id, first.username, None)
+            try:
+                await write(token)
+            except BackendAuthError:
+                token = await self.token_provider(first.chat_id, first.telegram_id, first.username, token)
+                await write(token)
+        except Exception as error:
+            if is_retryable(error):
+                self._reschedule(batch, error)
+            else:
+                # Rejected by validation or auth twice over: retrying would fail the same way.
+                logger.error("Dropping %s queued writes for chat %s: %s", len(batch), first.chat_id, error)
+                self.dropped += len(batch)
+                self._delete(batch)
+            return
+        self.batches += 1
+        self.written += len(batch)
+        self._delete(batch)
+
+    def _reschedule(self, batch: list[QueuedWrite], error: Exception) -> None:
+        retry_after = getattr(error, "retry_after", None)
+        now = time.time()
+        self.retries += len(batch)
+        self._db.executemany(
+            "UPDATE writes SET attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+            [(now + (retry_after or retry_delay(entry.attempts)), entry.id) for entry in batch],
+        )
+        self._db.commit()
+        logger.warning("Queued writes for chat %s will be retried: %s", batch[0].chat_id, error)
+
+    def _delete(self, batch: list[QueuedWrite]) -> None:
+        self._db.executemany("DELETE FROM writes WHERE id = ?", [(entry.id,) for entry in batch])
+        self._db.commit()
+        self.queued = max(0, self.queued - len(batch))
+
+    def _expire(self) -> None:
+        cursor = self._db.execute("DELETE FROM writes WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+        self._db.commit()
+        if cursor.rowcount > 0:
+            logger.error("Dropped %s queued writes older than %.0fs", cursor.rowcount, self.max_age_seconds)
+            self.expired += cursor.rowcount
+            self.queued = max(0, self.queued - cursor.rowcount)
+
+    def stats(self) -> dict[str, float]:
+        oldest = self._db.execute("SELECT MIN(created_at) FROM writes").fetchone()[0]
+        return {
+            "queued": self.queued,
+            "oldest_seconds": time.time() - oldest if oldest is not None else 0.0,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "written": self.written,
+            "batches": self.batches,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "expired": self.expired,
+        }
+
+    async def close(self, timeout: float = 5.0) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Whatever is due goes out now; anything left stays on disk for the next start.
+        try:
+            await asyncio.wait_for(self.flush(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Write-behind flush at shutdown timed out; %s writes kept for the next start", self.queued)
+        self._db.close()